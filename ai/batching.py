@@ -0,0 +1,108 @@
+from dataclasses import dataclass
+from typing import Awaitable, Callable, Generic, List, Optional, Sequence, Set, TypeVar, Union
+import asyncio
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+
+@dataclass
+class BatchStats:
+    """Items and batched calls, shareable between batchers to report one total."""
+    batches: int = 0
+    items: int = 0
+
+    def summary(self) -> str:
+        return f"{self.items} items in {self.batches} batched calls"
+
+
+class MicroBatcher(Generic[T, R]):
+    """
+    Packs small requests that arrive close together into one call.
+
+    `submit(item, tokens)` queues `item` and waits for its result. The pending
+    batch is flushed when the next item would push it past `max_tokens`, when
+    it holds `max_items` items, or `max_wait` seconds after its first item
+    arrived, whichever comes first. `flush` receives the items of one batch
+    and returns one result per item, in order; an exception returned in place
+    of a result is raised in that item's submitter only, and an exception
+    `flush` raises is raised in every submitter of the batch.
+
+    The flush runs in a task that copies the context of one of the batch's
+    submitters, so batch only requests that share the context variables the
+    flush depends on (e.g. keep one batcher per engine). Items whose
+    submitter was cancelled before the flush are left out of it, and a batch
+    left pending by an event loop that has since stopped (a batcher reused
+    across `asyncio.run` calls) is dropped rather than joined.
+    """
+
+    def __init__(self, flush: Callable[[List[T]], Awaitable[Sequence[Union[R, BaseException]]]], max_tokens: int,
+                 max_items: int = 8, max_wait: float = 0.05, stats: Optional[BatchStats] = None):
+        self._flush = flush
+        self.max_tokens = max_tokens
+        self.max_items = max_items
+        self.max_wait = max_wait
+        self._items: List[T] = []
+        self._futures: List[asyncio.Future] = []
+        self._tokens = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # The loop the pending batch and its timer belong to
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Running flushes; the event loop only keeps weak references to tasks
+        self._running: Set[asyncio.Future] = set()
+        self.stats = stats or BatchStats()
+
+    async def submit(self, item: T, tokens: int) -> R:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            # Nobody waits on a batch from a stopped loop, and its timer would never fire
+            self._items, self._futures, self._tokens, self._timer = [], [], 0, None
+            self._loop = loop
+        if self._items and self._tokens + tokens > self.max_tokens:
+            self._dispatch()
+        future = loop.create_future()
+        self._items.append(item)
+        self._futures.append(future)
+        self._tokens += tokens
+        if len(self._items) >= self.max_items or self._tokens >= self.max_tokens:
+            self._dispatch()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._dispatch)
+        return await future
+
+    def _dispatch(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending = [(item, future) for item, future in zip(self._items, self._futures) if not future.cancelled()]
+        self._items, self._futures, self._tokens = [], [], 0
+        if not pending:
+            return
+        items = [item for item, _ in pending]
+        futures = [future for _, future in pending]
+        self.stats.batches += 1
+        self.stats.items += len(items)
+        task = asyncio.ensure_future(self._run(items, futures))
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+    async def _run(self, items: List[T], futures: List[asyncio.Future]):
+        try:
+            results = await self._flush(items)
+        except BaseException as e:
+            for future in futures:
+                if not future.done():
+                    future.set_exception(e)
+            if not isinstance(e, Exception):
+                raise
+            return
+        for future, result in zip(futures, results):
+            if future.done():
+                continue
+            if isinstance(result, BaseException):
+                future.set_exception(result)
+            else:
+                future.set_result(result)
+
+    def summary(self) -> str:
+        return self.stats.summary()
@@ -0,0 +1,254 @@
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Tuple
+import asyncio
+import hashlib
+import os
+import re
+
+from .providers import count_tokens
+from .tracing import get_tracer
+
+
+#######################################################################
+# Whether pages are cleaned at all is the engine's `content_cleaning` setting (CONTENT_CLEANING)
+# Worker processes for cleaning and token counting; 0 cleans in a thread of this process instead
+CleaningWorkers = int(os.getenv("CLEANING_WORKERS", str(min(4, os.cpu_count() or 1))))
+# Pages with fewer tokens than this left after cleaning are dropped
+MinPageTokens = int(os.getenv("MIN_PAGE_TOKENS", "30"))
+#######################################################################
+
+_image = re.compile(r"!\[[^\]]*\]\((?:[^()\s]|\([^)]*\))*(?:\s+\"[^\"]*\")?\)")
+_link = re.compile(r"\[([^\]]*)\]\((?:[^()\s]|\([^)]*\))*(?:\s+\"[^\"]*\")?\)")
+_reference_definition = re.compile(r"^\s*\[[^\]]+\]:\s*\S+")
+_bare_url = re.compile(r"^\s*(?:[-*+]\s+)?<?https?://\S+>?\s*$")
+_html_tag = re.compile(r"</?[a-zA-Z][^>\n]*>")
+_separators_only = re.compile(r"^[\s\-*+|·•>#]*$")
+_spaces = re.compile(r"(?<=\S)[ \t]{2,}")
+_blank_lines = re.compile(r"\n{3,}")
+_words = re.compile(r"\w+")
+_boilerplate = re.compile(
+    r"\b(?:cookies?|consent|privacy (?:policy|settings)|terms (?:of|and) (?:use|service|conditions)|all rights reserved"
+    r"|subscribe|newsletter|sign (?:in|up)|log ?in|register|skip to (?:main )?content|accept all|share (?:on|this)"
+    r"|follow us|advertisement|javascript|back to top)\b",
+    re.IGNORECASE,
+)
+_sentence_end = re.compile(r"[.!?][\"')\]]*$|[.!?]\s")
+_list_item = re.compile(r"^\s*(?:[-*+]|\d+[.)])\s")
+# A line that matches _boilerplate is only treated as a banner when it is this short, not a heading and not a
+# sentence (SentenceWords or more words with sentence punctuation), and it sits next to other banner or link-only lines
+BoilerplateLineWords = 25
+SentenceWords = 6
+# Link-only lines with less visible text than this are menu entries; longer runs of them are link lists
+MenuEntryChars = 40
+LinkListRun = 3
+# Short lines repeated within the first or last EdgeLines non-blank lines of a page (site header and footer)
+# keep only their first occurrence; list items are never dropped this way
+RepeatedLineChars = 80
+EdgeLines = 15
+
+
+def _is_link_only(line: str) -> bool:
+    return bool(_link.search(line)) and _separators_only.match(_link.sub("", line)) is not None
+
+
+def _is_banner_candidate(line: str) -> bool:
+    """A short, non-heading, non-sentence line mentioning cookies, sign-in, newsletters and the like."""
+    text = _html_tag.sub("", _link.sub(r"\1", line)).strip()
+    if not text or text.startswith("#"):
+        return False
+    words = text.split()
+    if len(words) > BoilerplateLineWords:
+        return False
+    if len(words) >= SentenceWords and _sentence_end.search(text):
+        return False
+    return bool(_boilerplate.search(text))
+
+
+def _neighbours(lines: List[str], i: int) -> List[int]:
+    """Indices of the nearest non-blank lines before and after line `i`."""
+    found = []
+    for step in (-1, 1):
+        j = i + step
+        while 0 <= j < len(lines) and not lines[j].strip():
+            j += step
+        if 0 <= j < len(lines):
+            found.append(j)
+    return found
+
+
+def clean_markdown(text: str) -> str:
+    """
+    Remove scraping noise from a Firecrawl markdown page: images, navigation
+    menus and link lists, cookie/newsletter/sign-in banners, reference link
+    definitions, bare URLs, HTML tags and short lines repeated across the
+    page's header and footer. Inline links keep their text. Headings and
+    sentences are kept even when they mention cookies or sign-in, and banner
+    lines are only dropped next to other banner or link-only lines, so pages
+    about those topics keep their content. Fenced code blocks are left alone,
+    and whitespace is collapsed everywhere else.
+    """
+    text = _image.sub("", text)
+    lines = text.split("\n")
+    link_only = [_is_link_only(line) for line in lines]
+    banner = [_is_banner_candidate(line) for line in lines]
+    non_blank = [i for i, line in enumerate(lines) if line.strip()]
+    edges = set(non_blank[:EdgeLines] + non_blank[-EdgeLines:])
+    kept: List[str] = []
+    seen = set()
+    in_fence = False
+    i = 0
+    while i < len(lines):
+        line = lines[i]
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+            kept.append(line)
+            i += 1
+            continue
+        if in_fence:
+            kept.append(line)
+            i += 1
+            continue
+        if link_only[i]:
+            run = i
+            while run < len(lines) and link_only[run]:
+                run += 1
+            # A run of link-only lines is a menu or a link list; a lone one is kept if it reads like content
+            if run - i >= LinkListRun or len(_link.sub(r"\1", line).strip()) < MenuEntryChars:
+                i = run
+                continue
+        i += 1
+        if _reference_definition.match(line) or _bare_url.match(line):
+            continue
+        line = _html_tag.sub("", _link.sub(r"\1", line))
+        line = _spaces.sub(" ", line.rstrip())
+        stripped = line.strip()
+        if not stripped:
+            kept.append("")
+            continue
+        if _separators_only.match(stripped) and not stripped.startswith("|") and stripped not in ("---", "***"):
+            continue
+        if banner[i - 1] and any(banner[j] or link_only[j] for j in _neighbours(lines, i - 1)):
+            continue
+        if (i - 1) in edges and len(stripped) <= RepeatedLineChars and not stripped.startswith("|") \
+                and not _list_item.match(line):
+            if stripped in seen:
+                continue
+            seen.add(stripped)
+        kept.append(line)
+    return _blank_lines.sub("\n\n", "\n".join(kept)).strip()
+
+
+def content_hash(text: str) -> str:
+    """Hash of a page's words, ignoring case, punctuation and layout, to spot the same page under another URL."""
+    return hashlib.sha1(" ".join(_words.findall(text.lower())).encode("utf-8")).hexdigest()
+
+
+def clean_pages(pages: List[str]) -> List[Tuple[str, str, int, int]]:
+    """
+    Clean `pages` and return (cleaned text, content hash, tokens before,
+    tokens after) for each. Runs in a worker process, so it only takes and
+    returns plain data.
+    """
+    results = []
+    for page in pages:
+        cleaned = clean_markdown(page)
+        results.append((cleaned, content_hash(cleaned), count_tokens(page), count_tokens(cleaned)))
+    return results
+
+
+@dataclass
+class CleaningStats:
+    pages: int = 0
+    empty: int = 0
+    duplicates: int = 0
+    tokens_before: int = 0
+    tokens_after: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.tokens_before - self.tokens_after
+
+
+class PageCleaner:
+    """
+    Runs `clean_pages` off the event loop, in a process pool created on first
+    use, and keeps running totals of what it removed.
+    """
+
+    def __init__(self, workers: int = CleaningWorkers, min_tokens: int = MinPageTokens):
+        self.workers = workers
+        self.min_tokens = min_tokens
+        self.stats = CleaningStats()
+        self._executor: Optional[Executor] = None
+
+    @property
+    def executor(self) -> Optional[Executor]:
+        if self._executor is None and self.workers > 0:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+        return self._executor
+
+    async def clean(self, pages: List[str], claim_content: Optional[Callable[[str], bool]] = None) -> List[str]:
+        """
+        Clean one SERP result's pages and return the ones worth prompting.
+        Near-empty pages are dropped, and so are pages whose content hash
+        `claim_content` reports as already seen.
+        """
+        return [cleaned for _, cleaned, _ in await self.clean_indexed(pages, claim_content)]
+
+    async def clean_indexed(self, pages: List[str],
+                            claim_content: Optional[Callable[[str], bool]] = None) -> List[Tuple[int, str, int]]:
+        """
+        Like `clean`, as (index in `pages`, cleaned page, tokens) for each kept
+        page. The workers have already counted the tokens, so callers can
+        budget the pages without encoding them again.
+        """
+        if not pages:
+            return []
+        with get_tracer().span("clean_pages", pages=len(pages)) as span:
+            executor = self.executor
+            if executor is None:
+                results = await asyncio.to_thread(clean_pages, pages)
+            else:
+                results = await asyncio.get_running_loop().run_in_executor(executor, clean_pages, pages)
+            kept = []
+            tokens_before = tokens_after = 0
+            for i, (cleaned, digest, before, after) in enumerate(results):
+                tokens_before += before
+                if after < self.min_tokens:
+                    self.stats.empty += 1
+                    continue
+                if claim_content is not None and not claim_content(digest):
+                    self.stats.duplicates += 1
+                    continue
+                tokens_after += after
+                kept.append((i, cleaned, after))
+            self.stats.pages += len(results)
+            self.stats.tokens_before += tokens_before
+            self.stats.tokens_after += tokens_after
+            span.args["tokens_saved"] = tokens_before - tokens_after
+        return kept
+
+    def summary(self) -> str:
+        stats = self.stats
+        share = f" ({stats.tokens_saved / stats.tokens_before:.0%})" if stats.tokens_before else ""
+        return (
+            f"Content cleaning: {stats.pages} pages, {stats.empty} near-empty and {stats.duplicates} duplicate dropped, "
+            f"{stats.tokens_saved:,} of {stats.tokens_before:,} tokens saved{share}"
+        )
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+_page_cleaner: Optional[PageCleaner] = None
+
+
+def get_page_cleaner() -> PageCleaner:
+    """Return the process-wide page cleaner."""
+    global _page_cleaner
+    if _page_cleaner is None:
+        _page_cleaner = PageCleaner()
+    return _page_cleaner
@@ -0,0 +1,99 @@
+from collections import Counter
+from typing import Dict, List, Sequence
+from .relevance import tokenize
+import math
+
+SparseVector = Dict[str, float]
+
+
+def tfidf_vectors(texts: Sequence[str]) -> List[SparseVector]:
+    """Unit-length TF-IDF vectors, as {term: weight} dicts."""
+    counts = [Counter(tokenize(t)) for t in texts]
+    document_frequency: Counter = Counter()
+    for c in counts:
+        document_frequency.update(c.keys())
+    n = len(texts)
+    vectors = []
+    for c in counts:
+        vector = {term: (1 + math.log(tf)) * math.log((1 + n) / (1 + document_frequency[term])) + 1e-9
+                  for term, tf in c.items()}
+        vectors.append(_normalize(vector))
+    return vectors
+
+
+def _normalize(vector: SparseVector) -> SparseVector:
+    norm = math.sqrt(sum(w * w for w in vector.values()))
+    return {t: w / norm for t, w in vector.items()} if norm else vector
+
+
+def _dot(a: SparseVector, b: SparseVector) -> float:
+    if len(a) > len(b):
+        a, b = b, a
+    return sum(w * b.get(t, 0.0) for t, w in a.items())
+
+
+def cluster_by_topic(texts: Sequence[str], lengths: Sequence[int], max_length: int, iterations: int = 10) -> List[List[int]]:
+    """
+    Group texts by topic so that each group's total length stays within
+    `max_length`.
+
+    Spherical k-means over TF-IDF vectors, with k = total length / max_length
+    and farthest-first seeding so the result is deterministic. Groups still
+    over the limit afterwards are cut into consecutive pieces. Returns lists
+    of indices into `texts`, each in input order, groups ordered by their
+    first member. Every index appears exactly once.
+    """
+    n = len(texts)
+    if n == 0:
+        return []
+    k = min(n, max(1, math.ceil(sum(lengths) / max_length)))
+    if k == 1:
+        return _cap_lengths(list(range(n)), lengths, max_length)
+
+    vectors = tfidf_vectors(texts)
+    seeds = [0]
+    closest = [_dot(v, vectors[0]) for v in vectors]
+    while len(seeds) < k:
+        candidate = min((i for i in range(n) if i not in seeds), key=lambda i: closest[i])
+        seeds.append(candidate)
+        closest = [max(c, _dot(v, vectors[candidate])) for c, v in zip(closest, vectors)]
+    centroids = [vectors[i] for i in seeds]
+
+    assignment = [-1] * n
+    for _ in range(iterations):
+        changed = False
+        for i, v in enumerate(vectors):
+            best = max(range(k), key=lambda c: _dot(v, centroids[c]))
+            if best != assignment[i]:
+                assignment[i] = best
+                changed = True
+        if not changed:
+            break
+        for c in range(k):
+            total: SparseVector = {}
+            for i in range(n):
+                if assignment[i] == c:
+                    for t, w in vectors[i].items():
+                        total[t] = total.get(t, 0.0) + w
+            if total:
+                centroids[c] = _normalize(total)
+
+    groups: Dict[int, List[int]] = {}
+    for i, c in enumerate(assignment):
+        groups.setdefault(c, []).append(i)
+    clusters = []
+    for members in sorted(groups.values(), key=lambda m: m[0]):
+        clusters.extend(_cap_lengths(members, lengths, max_length))
+    return clusters
+
+
+def _cap_lengths(members: List[int], lengths: Sequence[int], max_length: int) -> List[List[int]]:
+    pieces: List[List[int]] = [[]]
+    used = 0
+    for i in members:
+        if pieces[-1] and used + lengths[i] > max_length:
+            pieces.append([])
+            used = 0
+        pieces[-1].append(i)
+        used += lengths[i]
+    return pieces
@@ -1,27 +1,69 @@
-from dotenv import load_dotenv
 import os
 import asyncio
-from openai import OpenAI
-from .text_splitter import RecursiveCharacterTextSplitter
+import re
+import time
+import httpx
+from contextlib import aclosing, contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+import functools
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple, Union
+from openai import OpenAI, AsyncOpenAI, DefaultAsyncHttpxClient
+from .cache import DiskCache
+from .resilience import CallTimeout, RateLimit, Retryable, Timeout, Transient, classify_error, get_resilience
+from .scheduler import get_scheduler
+from .tracing import get_tracer
 import tiktoken
 
 
-# Load environment variables
-load_dotenv()
-# Initialize OpenAI client
-client = OpenAI()
+# Sync OpenAI client, created on first use (see get_client)
+_client: OpenAI | None = None
+
+# Maximum number of LLM requests in flight at once per model, independent of FIRECRAWL_CONCURRENCY
+LLMConcurrencyLimit = int(os.getenv("LLM_CONCURRENCY", "8"))
+
+# Shared async client, created on first use; in-flight requests are bounded by the scheduler's per-model "llm:<model>" pools
+_async_client: AsyncOpenAI | None = None
+# Client used instead of the shared one in the current context (set by ResearchEngine.activate)
+_async_client_override: ContextVar[AsyncOpenAI | None] = ContextVar("async_client_override", default=None)
+
+# Opt-in on-disk memoization of structured responses
+ResponseCacheEnabled = os.getenv("LLM_CACHE", "0").strip().lower() in ("1", "true", "yes", "on")
+ResponseCachePath = os.getenv("LLM_CACHE_PATH", os.path.join(".cache", "llm.sqlite"))
+ResponseCacheTTL = float(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))
+ResponseCacheMaxBytes = int(os.getenv("LLM_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# Parts of a prompt that change on every run (e.g. the timestamp in prompts.system_prompt_func)
+# and must not take part in the cache key
+VolatilePromptPatterns = [
+    re.compile(r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?"),
+]
+
+_response_cache: DiskCache | None = None
 
 
-encoder  = tiktoken.get_encoding("o200k_base")
 MinChunkSize = 140
+# Boundaries a trimmed prompt may end on, most preferred first (the text splitter's defaults)
+TrimSeparators = ['\n\n', '\n', '.', ',', '>', '<', ' ']
 
 def get_model():
     
     return "gpt-4.1-nano"
 
+@functools.lru_cache(maxsize=None)
+def get_encoder() -> tiktoken.Encoding:
+    """The o200k_base encoder, loaded on first use; loading the BPE ranks is the slowest part of startup."""
+    return tiktoken.get_encoding("o200k_base")
+
+def get_client() -> OpenAI:
+    """Return the sync OpenAI client, creating it on first use."""
+    global _client
+    if _client is None:
+        _client = OpenAI()
+    return _client
+
 def generate_structured_response(prompt: str, system_prompt: str, model: str, format_schema) :
     """Synchronous OpenAI call."""
-    resp = client.responses.parse( # type: ignore
+    resp = get_client().responses.parse( # type: ignore
         model=model,
         input=[
             {"role": "system", "content": system_prompt},
@@ -31,10 +73,359 @@ def generate_structured_response(prompt: str, system_prompt: str, model: str, fo
     )
     return resp
 
-async def generate_structured_response_async(prompt: str, system_prompt: str, model: str, format_schema) :
-    """Async wrapper around the same call, suitable for asyncio."""
-    loop = asyncio.get_running_loop()
-    return await loop.run_in_executor(None, generate_structured_response, prompt, system_prompt, model, format_schema)
+def new_async_client(**kwargs) -> AsyncOpenAI:
+    """
+    Create an AsyncOpenAI client whose HTTP connection pool is sized to the
+    LLM concurrency limit, so in-flight requests can reuse keep-alive
+    connections. The per-model scheduler pools already bound the requests in
+    flight, so connections are not capped; enough are kept alive for a
+    stage's primary and fallback model to both run at full concurrency.
+    The client does not retry on its own; `get_resilience("llm")` does, so
+    every attempt goes through the scheduler. `kwargs` (e.g. api_key,
+    base_url) go to AsyncOpenAI.
+    """
+    kwargs.setdefault("max_retries", 0)
+    return AsyncOpenAI(
+        http_client=DefaultAsyncHttpxClient(
+            limits=httpx.Limits(
+                max_connections=None,
+                max_keepalive_connections=LLMConcurrencyLimit * 2,
+            )
+        ),
+        **kwargs,
+    )
+
+def get_async_client() -> AsyncOpenAI:
+    """Return the client for the current context: an override set with
+    `use_async_client`, else the shared client, created on first use."""
+    global _async_client
+    override = _async_client_override.get()
+    if override is not None:
+        return override
+    if _async_client is None:
+        _async_client = new_async_client()
+    return _async_client
+
+@contextmanager
+def use_async_client(client: AsyncOpenAI | None):
+    """Route LLM calls made in this context (and tasks it creates) through `client`."""
+    token = _async_client_override.set(client)
+    try:
+        yield
+    finally:
+        _async_client_override.reset(token)
+
+async def close_async_client():
+    """Close the shared async client and release its pooled connections."""
+    global _async_client
+    if _async_client is not None:
+        await _async_client.close()
+        _async_client = None
+
+@dataclass
+class CachedResponse:
+    """Stand-in for a parsed OpenAI response served from the response cache."""
+    output_parsed: Any
+
+def get_response_cache() -> DiskCache | None:
+    """Return the structured-response cache, or None when LLM_CACHE is off."""
+    global _response_cache
+    if _response_cache is None and ResponseCacheEnabled:
+        _response_cache = DiskCache(ResponseCachePath, ttl=ResponseCacheTTL, max_bytes=ResponseCacheMaxBytes)
+    return _response_cache
+
+def strip_volatile(text: str) -> str:
+    """Blank out the parts of a prompt listed in VolatilePromptPatterns."""
+    for pattern in VolatilePromptPatterns:
+        text = pattern.sub("<volatile>", text)
+    return text
+
+def response_cache_key(prompt: str, system_prompt: str, model: str, format_schema) -> str:
+    return DiskCache.make_key(
+        "responses.parse",
+        model,
+        strip_volatile(system_prompt),
+        strip_volatile(prompt),
+        format_schema.model_json_schema(),
+    )
+
+def response_cache_summary() -> str:
+    cache = get_response_cache()
+    if cache is None:
+        return "LLM response cache disabled"
+    stats = cache.stats
+    return (
+        f"LLM response cache: {stats.hits} hits, {stats.misses} misses, "
+        f"hit rate {stats.hit_rate:.0%}, {stats.evictions} evicted"
+    )
+
+def usage_tokens(usage: Any) -> Optional[Tuple[int, int]]:
+    """(prompt, completion) tokens from a Responses API `usage` object, or None if it has none."""
+    prompt_tokens = getattr(usage, "input_tokens", None)
+    completion_tokens = getattr(usage, "output_tokens", None)
+    if not isinstance(prompt_tokens, int) or not isinstance(completion_tokens, int):
+        return None
+    return prompt_tokens, completion_tokens
+
+def _models(model: Union[str, Sequence[str]]) -> List[str]:
+    return [model] if isinstance(model, str) else list(model)
+
+def should_fall_back(error: BaseException) -> bool:
+    """Errors that another model may not hit: rate limits and timeouts."""
+    return isinstance(error, Exception) and classify_error(error) in (RateLimit, Timeout)
+
+async def generate_structured_response_async(prompt: str, system_prompt: str, model: Union[str, Sequence[str]],
+                                             format_schema, priority: int = 0, timeout: Optional[float] = None) :
+    """
+    Native async OpenAI call, scheduled through the model's pool and memoized when LLM_CACHE is on.
+
+    `model` is a model name or a route: a list of models tried in order,
+    moving to the next one when a call is rate-limited or times out (see
+    ResearchEngine.route). Transient errors are retried on the same model;
+    the last model of a route also retries rate limits and timeouts. Lower
+    `priority` values are served first when the pool is saturated. `timeout`
+    replaces LLM_TIMEOUT for long outputs such as the report.
+    """
+    models = _models(model)
+    for i, name in enumerate(models):
+        retry_on = Retryable if i == len(models) - 1 else (Transient,)
+        try:
+            return await _generate_structured_response(prompt, system_prompt, name, format_schema, priority,
+                                                       fallback=i, retry_on=retry_on, timeout=timeout)
+        except Exception as e:
+            if i == len(models) - 1 or not should_fall_back(e):
+                raise
+
+async def _generate_structured_response(prompt: str, system_prompt: str, model: str, format_schema,
+                                        priority: int = 0, fallback: int = 0, retry_on=Retryable,
+                                        timeout: Optional[float] = None):
+    with get_tracer().span("llm.parse", schema=format_schema.__name__, model=model) as span:
+        if fallback:
+            # How many models of the route failed before this one
+            span.args["fallback"] = fallback
+        cache = get_response_cache()
+        key = None
+        if cache is not None:
+            key = response_cache_key(prompt, system_prompt, model, format_schema)
+            cached = await asyncio.to_thread(cache.get, key)
+            if cached is not None:
+                span.args["cached"] = True
+                return CachedResponse(output_parsed=format_schema.model_validate(cached))
+        client = get_async_client()
+        resp = await get_resilience("llm").call(
+            get_scheduler().llm_pool(model),
+            lambda: client.responses.parse( # type: ignore
+                model=model,
+                input=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": prompt},
+                ],
+                text_format=format_schema,
+            ),
+            priority,
+            retry_on=retry_on,
+            timeout=timeout,
+        )
+        # The API reports the tokens it billed; only clients without usage (e.g. the benchmark fakes) are
+        # counted locally, off the event loop
+        tokens = usage_tokens(getattr(resp, "usage", None))
+        if tokens is None:
+            output = resp.output_parsed.model_dump_json() if resp.output_parsed is not None else ""
+            tokens = await asyncio.to_thread(
+                lambda: (count_tokens(system_prompt) + count_tokens(prompt), count_tokens(output))
+            )
+        span.add("prompt_tokens", tokens[0])
+        span.add("completion_tokens", tokens[1])
+    if cache is not None and resp.output_parsed is not None:
+        await asyncio.to_thread(cache.set, key, resp.output_parsed.model_dump(mode="json"))
+    return resp
+
+async def stream_text_response(prompt: str, system_prompt: str, model: Union[str, Sequence[str]],
+                               priority: int = 0, timeout: Optional[float] = None) -> AsyncIterator[str]:
+    """
+    Stream a plain-text OpenAI response, yielding text deltas as they arrive.
+
+    The model's pool slot is held until the stream ends or the caller closes
+    the generator. With LLM_CACHE on, the full text is memoized and a cache
+    hit is yielded as a single delta.
+
+    Until the first delta arrives, a stream is handled like any other call
+    of the resilience layer: it must start within `timeout` (default
+    LLM_TIMEOUT), transient errors are retried with backoff, and for a route
+    of several models the next one is tried if a model is rate-limited or
+    times out (the last one retries those too). Once text has been yielded,
+    errors propagate.
+    """
+    resilience = get_resilience("llm")
+    resilience.stats.calls += 1
+    models = _models(model)
+    for i, name in enumerate(models):
+        retry_on = Retryable if i == len(models) - 1 else (Transient,)
+        attempt = 0
+        while True:
+            started = False
+            try:
+                first_delta_timeout = resilience.attempt_timeout(timeout)
+                stream = _stream_text_response(prompt, system_prompt, name, priority, first_delta_timeout)
+                # Closing this generator must release the model's pool slot at once, not at garbage collection
+                async with aclosing(stream):
+                    async for delta in stream:
+                        started = True
+                        yield delta
+                return
+            except Exception as e:
+                if started:
+                    raise
+                if isinstance(e, CallTimeout):
+                    resilience.stats.timeouts += 1
+                delay = resilience.retry_delay(e, attempt, retry_on)
+                if delay is not None:
+                    attempt += 1
+                    await asyncio.sleep(delay)
+                    continue
+                if i == len(models) - 1 or not should_fall_back(e):
+                    raise
+                break
+
+async def _stream_text_response(prompt: str, system_prompt: str, model: str, priority: int = 0,
+                                first_delta_timeout: Optional[float] = None) -> AsyncIterator[str]:
+    cache = get_response_cache()
+    key = None
+    if cache is not None:
+        key = DiskCache.make_key("responses.stream", model, strip_volatile(system_prompt), strip_volatile(prompt))
+        cached = await asyncio.to_thread(cache.get, key)
+        if cached is not None:
+            yield cached
+            return
+    chunks = []
+    usage = None
+    # Context variables can't be held across yields, so this span is never current
+    span = get_tracer().start_span("llm.stream", model=model)
+    try:
+        async with get_scheduler().llm_pool(model).slot(priority) as slot:
+            span.add("pool_wait", slot.waited)
+            first_by = time.monotonic() + first_delta_timeout if first_delta_timeout else None
+            try:
+                stream = await asyncio.wait_for(get_async_client().responses.create(
+                    model=model,
+                    input=[
+                        {"role": "system", "content": system_prompt},
+                        {"role": "user", "content": prompt},
+                    ],
+                    stream=True,
+                ), first_delta_timeout)
+                try:
+                    events = stream.__aiter__()
+                    while True:
+                        try:
+                            if chunks or first_by is None:
+                                event = await events.__anext__()
+                            else:
+                                event = await asyncio.wait_for(events.__anext__(), max(0.0, first_by - time.monotonic()))
+                        except StopAsyncIteration:
+                            break
+                        if event.type == "response.completed":
+                            usage = usage_tokens(getattr(getattr(event, "response", None), "usage", None))
+                        if event.type != "response.output_text.delta":
+                            continue
+                        if not chunks:
+                            span.args["first_token_s"] = round(span.duration, 3)
+                        chunks.append(event.delta)
+                        yield event.delta
+                finally:
+                    # Hand the connection back now, not when the abandoned response is garbage collected
+                    await stream.close()
+            except asyncio.TimeoutError:
+                raise CallTimeout(f"{model}: no output after {first_delta_timeout:.1f}s") from None
+    finally:
+        span.end = time.perf_counter()
+        if usage is None and chunks:
+            # No usage event (stream cut short, or a client without usage): count what was sent and received
+            usage = (count_tokens(system_prompt) + count_tokens(prompt), count_tokens("".join(chunks)))
+        if usage is not None:
+            span.add("prompt_tokens", usage[0])
+            span.add("completion_tokens", usage[1])
+    if cache is not None and chunks:
+        await asyncio.to_thread(cache.set, key, "".join(chunks))
+
+def _snap_to_boundary(text: str) -> str:
+    """
+    Cut `text` back to the last separator, trying the same separators as the
+    text splitter in order, so a trimmed prompt never ends mid-word. Gives up
+    and keeps the hard cut rather than discarding more than a fifth of the text.
+    """
+    # Token-boundary decoding can leave a partial character at the end
+    text = text.rstrip("\ufffd")
+    floor = max(MinChunkSize, int(len(text) * 0.8))
+    for separator in TrimSeparators:
+        cut = text.rfind(separator, floor)
+        if cut != -1:
+            # Keep a sentence's closing period; other separators are dropped like the splitter does
+            return text[:cut + 1 if separator == '.' else cut].rstrip()
+    return text
+
+def _truncate_tokens(prompt: str, tokens: List[int], limit: int) -> str:
+    if len(tokens) <= limit:
+        return prompt
+    return _snap_to_boundary(get_encoder().decode(tokens[:limit]))
+
+def fit_token_budgets(lengths: List[int], total_budget: int, per_prompt_limit: Optional[int] = None) -> List[int]:
+    """
+    Split `total_budget` tokens across prompts of the given lengths (water-filling):
+    prompts shorter than an even share keep all their tokens and the rest of
+    the budget is shared evenly among the longer ones.
+    """
+    caps = [min(n, per_prompt_limit) if per_prompt_limit is not None else n for n in lengths]
+    budgets = [0] * len(caps)
+    remaining = max(0, total_budget)
+    order = sorted(range(len(caps)), key=lambda i: caps[i])
+    for position, i in enumerate(order):
+        share = remaining // (len(order) - position)
+        budgets[i] = min(caps[i], share)
+        remaining -= budgets[i]
+    return budgets
+
+def trim_prompts(prompts: List[str], total_budget: int, per_prompt_limit: Optional[int] = None) -> List[str]:
+    """
+    Trim many documents to one shared token budget in a single pass.
+
+    All documents are encoded in one batched call, the budget is divided with
+    `fit_token_budgets`, and each over-budget document is cut once at its
+    token offset.
+    """
+    return trim_prompts_counted(prompts, total_budget, per_prompt_limit)[0]
+
+def trim_prompts_counted(prompts: List[str], total_budget: int, per_prompt_limit: Optional[int] = None,
+                         lengths: Optional[Sequence[Optional[int]]] = None) -> Tuple[List[str], List[int]]:
+    """
+    `trim_prompts` that also returns each result's token count (for a cut
+    document, its budget: snapping to a separator can only shorten it).
+
+    `lengths` holds token counts already known, e.g. from the cleaning
+    workers, with None where unknown. Only documents of unknown length and
+    documents that have to be cut are encoded.
+    """
+    if not prompts:
+        return [], []
+    counts = list(lengths) if lengths is not None else [None] * len(prompts)
+    unknown = [i for i, n in enumerate(counts) if n is None]
+    encoded: Dict[int, List[int]] = {}
+    if unknown:
+        for i, tokens in zip(unknown, get_encoder().encode_batch([prompts[i] for i in unknown], disallowed_special=())):
+            encoded[i] = tokens
+            counts[i] = len(tokens)
+    budgets = fit_token_budgets(counts, total_budget, per_prompt_limit)  # type: ignore
+    trimmed = []
+    for i, (prompt, count, budget) in enumerate(zip(prompts, counts, budgets)):
+        if count <= budget:  # type: ignore
+            trimmed.append(prompt)
+            continue
+        tokens = encoded[i] if i in encoded else get_encoder().encode(prompt, disallowed_special=())
+        trimmed.append(_truncate_tokens(prompt, tokens, budget))
+    return trimmed, [min(count, budget) for count, budget in zip(counts, budgets)]  # type: ignore
+
+def count_tokens(text: str) -> int:
+    return len(get_encoder().encode(text, disallowed_special=()))
 
 def trim_prompt(prompt, context_size=None):
     """Trim prompt to fit within context size"""
@@ -44,27 +435,6 @@ def trim_prompt(prompt, context_size=None):
     if not prompt:
         return ""
     
-    # Check if prompt is already within context size
-    token_count = len(encoder.encode(prompt))
-    if token_count <= context_size:
-        return prompt
-    
-    # Calculate overflow and estimate character reduction
-    overflow_tokens = token_count - context_size
-    estimated_chars_to_remove = overflow_tokens * 3  # Rough estimate: 3 chars per token
-    chunk_size = max(len(prompt) - estimated_chars_to_remove, MinChunkSize)
-    
-    # Use text splitter to trim
-    splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=0
-    )
-    chunks = splitter.split_text(prompt)
-    trimmed = chunks[0] if chunks else ""
-    
-    # Handle edge case where trimming didn't reduce size
-    if len(trimmed) == len(prompt):
-        return prompt[:chunk_size]
-    
-    # Recursively trim if still too long
-    return trim_prompt(trimmed, context_size)
\ No newline at end of file
+    # Encode once and cut directly at the token offset, snapped back to a separator
+    tokens = get_encoder().encode(prompt, disallowed_special=())
+    return _truncate_tokens(prompt, tokens, context_size)
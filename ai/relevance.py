@@ -0,0 +1,107 @@
+from collections import Counter
+from typing import Dict, List, Optional, Sequence
+from .text_splitter import RecursiveCharacterTextSplitter
+import math
+import re
+
+
+_token_pattern = re.compile(r"\w+", re.UNICODE)
+# Function words that would otherwise dominate short SERP queries
+StopWords = frozenset(
+    "a an and are as at be by for from has have how in is it its of on or that the this to was were what when "
+    "where which who why will with about into than then there these those their not can do does did".split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _token_pattern.findall(text.lower()) if t not in StopWords]
+
+
+class BM25:
+    """
+    Okapi BM25 over a fixed list of documents, in plain Python.
+
+    Term frequencies are counted once when the index is built; scoring a
+    query only touches the documents that contain one of its terms.
+    """
+
+    def __init__(self, documents: Sequence[str], k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        self.frequencies: List[Counter] = [Counter(tokenize(d)) for d in documents]
+        self.lengths = [sum(f.values()) for f in self.frequencies]
+        self.average_length = (sum(self.lengths) / len(self.lengths)) if self.lengths else 0.0
+        self.postings: Dict[str, List[int]] = {}
+        for i, frequencies in enumerate(self.frequencies):
+            for term in frequencies:
+                self.postings.setdefault(term, []).append(i)
+
+    def idf(self, term: str) -> float:
+        n = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.frequencies) - n + 0.5) / (n + 0.5))
+
+    def scores(self, query: str) -> List[float]:
+        scores = [0.0] * len(self.frequencies)
+        if not self.average_length:
+            return scores
+        for term in set(tokenize(query)):
+            idf = self.idf(term)
+            for i in self.postings.get(term, ()):
+                tf = self.frequencies[i][term]
+                norm = self.k1 * (1 - self.b + self.b * self.lengths[i] / self.average_length)
+                scores[i] += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+
+def select_relevant_chunks(pages: List[str], query: str, token_budget: int, count_tokens,
+                           chunk_size: int = 1500, gap_marker: str = "\n[...]\n",
+                           lengths: Optional[Sequence[Optional[int]]] = None) -> List[str]:
+    """
+    Keep the parts of each page that are most relevant to `query`.
+
+    Pages are split with `RecursiveCharacterTextSplitter` (chunk_size in
+    characters, no overlap so selected chunks never repeat text) and all
+    chunks are ranked together with BM25, so rare query terms weigh more.
+    Each page then keeps its highest-scoring chunks up to `token_budget`
+    tokens, reassembled in their original order with `gap_marker` where text
+    was dropped. Pages already within the budget are returned unchanged;
+    `lengths` gives the token counts already known for some pages (None for
+    the rest), so those are not encoded again. This is CPU-bound: call it off
+    the event loop.
+    """
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
+    chunked = [splitter.split_text(page) for page in pages]
+    index = BM25([chunk for chunks in chunked for chunk in chunks])
+    scores = index.scores(query)
+
+    selected = []
+    offset = 0
+    for n, (page, chunks) in enumerate(zip(pages, chunked)):
+        page_scores = scores[offset:offset + len(chunks)]
+        offset += len(chunks)
+        known = lengths[n] if lengths is not None else None
+        if (known if known is not None else count_tokens(page)) <= token_budget:
+            selected.append(page)
+            continue
+        # Highest score first; earlier chunks win ties so intros and summaries are preferred
+        ranked = sorted(range(len(chunks)), key=lambda i: (-page_scores[i], i))
+        kept = []
+        used = 0
+        for i in ranked:
+            tokens = count_tokens(chunks[i])
+            if used + tokens > token_budget:
+                continue
+            kept.append(i)
+            used += tokens
+        kept.sort()
+        parts = []
+        for position, i in enumerate(kept):
+            if i != (kept[position - 1] + 1 if position else 0):
+                parts.append(gap_marker)
+            elif position:
+                parts.append("\n\n")
+            parts.append(chunks[i])
+        if kept and kept[-1] != len(chunks) - 1:
+            parts.append(gap_marker)
+        selected.append("".join(parts))
+    return selected
@@ -0,0 +1,315 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Deque, Dict, Iterator, Optional, Sequence, TypeVar
+import asyncio
+import collections
+import os
+import random
+import re
+import time
+
+from .scheduler import ResourcePool, is_rate_limit_error, is_timeout_error
+from .tracing import record
+
+T = TypeVar("T")
+
+
+#######################################################################
+# Per-attempt timeouts in seconds (0: none); Firecrawl scrapes every result page within one search call
+SearchTimeout = float(os.getenv("SEARCH_TIMEOUT", "60"))
+LLMTimeout = float(os.getenv("LLM_TIMEOUT", "120"))
+# The report stage writes the longest outputs of a run (for a streamed report: until its first delta arrives)
+ReportTimeout = float(os.getenv("REPORT_TIMEOUT", "600"))
+# Extra attempts after a retryable failure, with exponential backoff and full jitter
+CallRetries = int(os.getenv("CALL_RETRIES", "3"))
+RetryBaseDelay = float(os.getenv("RETRY_BASE_DELAY", "0.5"))
+RetryMaxDelay = float(os.getenv("RETRY_MAX_DELAY", "20"))
+# Backends that get a duplicate request when a call outlives the HEDGE_QUANTILE of recent latencies: "search", "llm"
+HedgedBackends = {b.strip() for b in os.getenv("HEDGE", "").lower().split(",") if b.strip()}
+HedgeQuantile = float(os.getenv("HEDGE_QUANTILE", "0.95"))
+# Latencies a pool must have seen before it hedges, and the shortest delay it hedges after
+HedgeMinSamples = int(os.getenv("HEDGE_MIN_SAMPLES", "20"))
+HedgeMinDelay = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+#######################################################################
+
+# Error classes, see classify_error
+RateLimit = "rate_limit"
+Timeout = "timeout"
+Transient = "transient"
+Fatal = "fatal"
+Deadline = "deadline"
+# Failures worth another attempt against the same backend
+Retryable = (RateLimit, Timeout, Transient)
+
+# Firecrawl raises plain errors whose message carries the status (e.g. "Internal Server Error: Failed to ...")
+_transient_pattern = re.compile(
+    r"status code:? 5\d\d|\b50[0234]\b|internal server error|bad gateway|service unavailable"
+    r"|max retries exceeded|connection (?:reset|refused|aborted|error)|server disconnected",
+    re.IGNORECASE,
+)
+_timeout_pattern = re.compile(r"request timeout|timed out", re.IGNORECASE)
+
+# Absolute time.monotonic() by which the current research run must finish, if any
+_deadline: ContextVar[Optional[float]] = ContextVar("deadline", default=None)
+
+
+class CallTimeout(TimeoutError):
+    """One attempt at a backend call took longer than its timeout."""
+
+
+class DeadlineExceeded(TimeoutError):
+    """The deadline of the current run leaves no time for another attempt."""
+
+
+def classify_error(error: BaseException) -> str:
+    """
+    Sort a backend failure into rate_limit, timeout, transient (5xx, 408/409,
+    dropped connections), deadline or fatal (bad requests, auth, payment,
+    invalid output), the last two of which are never retried.
+    """
+    if isinstance(error, DeadlineExceeded):
+        return Deadline
+    if is_rate_limit_error(error):
+        return RateLimit
+    if is_timeout_error(error) or _timeout_pattern.search(str(error)):
+        return Timeout
+    status = getattr(error, "status_code", None) or getattr(error, "status", None)
+    if isinstance(status, int):
+        return Transient if status >= 500 or status in (408, 409) else Fatal
+    if isinstance(error, ConnectionError) or "connection" in type(error).__name__.lower():
+        return Transient
+    if _transient_pattern.search(str(error)):
+        return Transient
+    return Fatal
+
+
+def error_label(error: BaseException) -> str:
+    """Short description of an error's class for log lines."""
+    return {
+        RateLimit: "Rate limit error",
+        Timeout: "Timeout error",
+        Transient: "Transient error",
+        Deadline: "Deadline exceeded",
+    }.get(classify_error(error), "Error")
+
+
+@contextmanager
+def deadline(seconds: Optional[float]) -> Iterator[None]:
+    """
+    Give every backend call made in this block (and the tasks it creates) at
+    most `seconds` from now, including retries; an enclosing, earlier
+    deadline still applies. None leaves the current deadline as it is.
+    """
+    current = _deadline.get()
+    if seconds is not None:
+        ends = time.monotonic() + seconds
+        current = ends if current is None else min(current, ends)
+    token = _deadline.set(current)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def time_left() -> Optional[float]:
+    """Seconds until the current deadline, or None without one."""
+    ends = _deadline.get()
+    return None if ends is None else ends - time.monotonic()
+
+
+class LatencyTracker:
+    """Latencies of the last `window` successful attempts against one pool."""
+
+    def __init__(self, window: int = 200):
+        self.samples: Deque[float] = collections.deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        if len(self.samples) < max(1, min_samples):
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+@dataclass
+class ResilienceStats:
+    calls: int = 0
+    retries: int = 0
+    timeouts: int = 0
+    hedges: int = 0
+    hedge_wins: int = 0
+    failures: Dict[str, int] = field(default_factory=dict)
+
+
+class Resilience:
+    """
+    Timeouts, retries and hedging around one backend (Firecrawl search or
+    the LLM).
+
+    Every attempt takes a slot in the given scheduler pool, so retries and
+    hedges are admitted and rate-limited like any other call, and is cut off
+    after `timeout` seconds or at the current `deadline`, whichever is
+    sooner. Rate limits, timeouts and transient errors are retried up to
+    `retries` times, sleeping a random delay of up to `base_delay * 2**n`
+    (capped at `max_delay`) in between ("full jitter", so failed callers
+    don't come back in lockstep); other errors are raised at once.
+
+    With `hedge` on, an attempt still running after the `hedge_quantile` of
+    the pool's recent latencies gets a duplicate in a second slot. The first
+    one to succeed is returned and the other is cancelled, which trims the
+    tail of stragglers at the cost of about 1 - hedge_quantile extra calls.
+    """
+
+    def __init__(self, name: str, timeout: Optional[float], retries: int = CallRetries,
+                 base_delay: float = RetryBaseDelay, max_delay: float = RetryMaxDelay, hedge: bool = False,
+                 hedge_quantile: float = HedgeQuantile, hedge_min_samples: int = HedgeMinSamples,
+                 hedge_min_delay: float = HedgeMinDelay):
+        self.name = name
+        self.timeout = timeout or None
+        self.retries = retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        self.stats = ResilienceStats()
+        self._latencies: Dict[str, LatencyTracker] = {}
+
+    def latencies(self, pool: ResourcePool) -> LatencyTracker:
+        if pool.name not in self._latencies:
+            self._latencies[pool.name] = LatencyTracker()
+        return self._latencies[pool.name]
+
+    def backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def attempt_timeout(self, timeout: Optional[float] = None) -> Optional[float]:
+        """
+        This attempt's timeout (`timeout`, else the backend's), shortened to
+        the time left before the deadline.
+        """
+        timeout = timeout or self.timeout
+        left = time_left()
+        if left is None:
+            return timeout
+        if left <= 0:
+            raise DeadlineExceeded(f"{self.name}: deadline reached")
+        return left if timeout is None else min(timeout, left)
+
+    def retry_delay(self, error: BaseException, attempt: int, retry_on: Sequence[str] = Retryable) -> Optional[float]:
+        """
+        Count a failed attempt (the `attempt`-th retry, from 0) and return how
+        long to back off before the next one, or None if `error` should be
+        raised: it isn't in `retry_on`, the retries are used up, or the
+        backoff would overrun the deadline.
+        """
+        kind = classify_error(error)
+        self.stats.failures[kind] = self.stats.failures.get(kind, 0) + 1
+        if kind not in retry_on or attempt >= self.retries:
+            return None
+        delay = self.backoff(attempt)
+        left = time_left()
+        if left is not None and left <= delay:
+            return None
+        self.stats.retries += 1
+        record("retries", 1)
+        return delay
+
+    async def call(self, pool: ResourcePool, request: Callable[[], Awaitable[T]], priority: int = 0,
+                   retry_on: Sequence[str] = Retryable, timeout: Optional[float] = None) -> T:
+        """
+        Run `request()` (a fresh coroutine per attempt) through `pool`.
+        `retry_on` narrows the error classes that are retried, e.g. to leave
+        rate limits to a fallback model instead; `timeout` replaces the
+        backend's per-attempt timeout for calls known to run long.
+        """
+        self.stats.calls += 1
+        attempt = 0
+        while True:
+            try:
+                return await self._hedged(pool, request, priority, self.attempt_timeout(timeout))
+            except Exception as e:
+                delay = self.retry_delay(e, attempt, retry_on)
+                if delay is None:
+                    raise
+                attempt += 1
+                await asyncio.sleep(delay)
+
+    async def _attempt(self, pool: ResourcePool, request: Callable[[], Awaitable[T]], priority: int,
+                       timeout: Optional[float]) -> T:
+        async with pool.slot(priority) as slot:
+            record("pool_wait", slot.waited)
+            started = time.monotonic()
+            try:
+                result = await asyncio.wait_for(request(), timeout)
+            except asyncio.TimeoutError:
+                self.stats.timeouts += 1
+                raise CallTimeout(f"{pool.name}: no response after {timeout:.1f}s") from None
+            self.latencies(pool).observe(time.monotonic() - started)
+        return result
+
+    def hedge_delay(self, pool: ResourcePool) -> Optional[float]:
+        if not self.hedge:
+            return None
+        delay = self.latencies(pool).quantile(self.hedge_quantile, self.hedge_min_samples)
+        return None if delay is None else max(self.hedge_min_delay, delay)
+
+    async def _hedged(self, pool: ResourcePool, request: Callable[[], Awaitable[T]], priority: int,
+                      timeout: Optional[float]) -> T:
+        delay = self.hedge_delay(pool)
+        if delay is None or (timeout is not None and delay >= timeout):
+            return await self._attempt(pool, request, priority, timeout)
+        first = asyncio.ensure_future(self._attempt(pool, request, priority, timeout))
+        running = {first}
+        try:
+            done, _ = await asyncio.wait(running, timeout=delay)
+            if done:
+                return first.result()
+            self.stats.hedges += 1
+            record("hedged", 1)
+            hedge = asyncio.ensure_future(self._attempt(pool, request, priority, self.attempt_timeout(timeout)))
+            running.add(hedge)
+            error: Optional[BaseException] = None
+            while running:
+                done, running = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.stats.hedge_wins += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error  # type: ignore
+        finally:
+            for task in running:
+                task.cancel()
+            await asyncio.gather(*running, return_exceptions=True)
+
+    def summary(self) -> str:
+        stats = self.stats
+        failures = ", ".join(f"{count} {kind}" for kind, count in sorted(stats.failures.items())) or "none"
+        hedged = f", {stats.hedges} hedged ({stats.hedge_wins} won by the hedge)" if self.hedge else ""
+        return (
+            f"{self.name} calls: {stats.calls}, {stats.retries} retries, {stats.timeouts} timed out{hedged}; "
+            f"failed attempts: {failures}"
+        )
+
+
+_resilience: Dict[str, Resilience] = {}
+
+
+def get_resilience(backend: str) -> Resilience:
+    """Return the process-wide resilience layer for "search" or "llm", configured from the environment."""
+    if backend not in _resilience:
+        if backend not in ("search", "llm"):
+            raise ValueError(f"Unknown backend: {backend}")
+        timeout = SearchTimeout if backend == "search" else LLMTimeout
+        _resilience[backend] = Resilience(backend, timeout=timeout, hedge=backend in HedgedBackends)
+    return _resilience[backend]
+
+
+def resilience_summary() -> str:
+    return "\n".join(get_resilience(backend).summary() for backend in ("search", "llm"))
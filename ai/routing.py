@@ -0,0 +1,36 @@
+from typing import Dict, List
+import os
+
+
+#######################################################################
+# Model route per stage: MODEL_<STAGE>=primary,fallback,... e.g. MODEL_REPORT=gpt-4.1,gpt-4.1-mini
+# A call moves on to the next model of its route when the current one is rate-limited or times out
+# Per-model pools: MODEL_CONCURRENCY / MODEL_RPM (ai/scheduler.py)
+#######################################################################
+
+# serp_queries: SERP query generation; extract: learnings from each search result (the high-volume stage);
+# feedback: clarifying questions; report: the final report, its sections and outline; answer / answer_check: specific answers
+Stages = ("serp_queries", "extract", "feedback", "report", "answer", "answer_check")
+
+# Built-in routes: small fast models where calls are many and latency-sensitive, a stronger one for the single report.
+# Stages without a route use the engine's model alone.
+DefaultRoutes: Dict[str, List[str]] = {
+    "serp_queries": ["gpt-4.1-nano", "gpt-4.1-mini"],
+    "extract": ["gpt-4.1-nano", "gpt-4.1-mini"],
+    "answer_check": ["gpt-4.1-nano", "gpt-4.1-mini"],
+    "report": ["gpt-4.1-mini", "gpt-4.1-nano"],
+}
+
+
+def parse_route(value: str) -> List[str]:
+    return [model.strip() for model in value.split(",") if model.strip()]
+
+
+def env_routes() -> Dict[str, List[str]]:
+    """Routes set through MODEL_<STAGE> variables."""
+    routes = {}
+    for stage in Stages:
+        route = parse_route(os.getenv(f"MODEL_{stage.upper()}", ""))
+        if route:
+            routes[stage] = route
+    return routes
@@ -0,0 +1,258 @@
+from typing import Dict, List, Optional, Tuple
+import asyncio
+import heapq
+import itertools
+import os
+import re
+import time
+
+
+
+_rate_limit_pattern = re.compile(r"\b429\b|rate.?limit|too many requests", re.IGNORECASE)
+
+
+def is_rate_limit_error(error: BaseException) -> bool:
+    """True for HTTP 429 / rate-limit errors from either OpenAI or Firecrawl."""
+    if getattr(error, "status_code", None) == 429 or getattr(error, "status", None) == 429:
+        return True
+    return bool(_rate_limit_pattern.search(str(error)))
+
+
+def is_timeout_error(error: BaseException) -> bool:
+    """True for asyncio/socket timeouts and the clients' own timeout errors (e.g. openai.APITimeoutError)."""
+    return isinstance(error, TimeoutError) or "timeout" in type(error).__name__.lower()
+
+
+class TokenBucket:
+    """Requests-per-minute limiter. A rate of None means unlimited."""
+
+    def __init__(self, rate_per_minute: Optional[float], burst: Optional[float] = None):
+        self.rate_per_minute = rate_per_minute
+        self.capacity = burst if burst is not None else max(1.0, (rate_per_minute or 0) / 60)
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self, now: float):
+        if self.rate_per_minute is None:
+            return
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate_per_minute / 60)
+        self._updated = now
+
+    def delay(self, now: float) -> float:
+        """Seconds until a token is available."""
+        if self.rate_per_minute is None:
+            return 0.0
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) * 60 / self.rate_per_minute
+
+    def consume(self, now: float):
+        if self.rate_per_minute is None:
+            return
+        self._refill(now)
+        self.tokens -= 1
+
+
+class ResourcePool:
+    """
+    Concurrency slots plus a requests-per-minute token bucket for one backend.
+
+    Waiters are served lowest `priority` first (FIFO among equals), so shallow
+    research nodes can be given precedence over deep ones. On a 429 the rate is
+    halved and the pool pauses; every success then adds the rate back
+    gradually until the configured RPM is reached again (AIMD).
+    """
+
+    def __init__(self, name: str, concurrency: int, rpm: Optional[float] = None,
+                 cooldown: float = 5.0, min_rpm: float = 1.0):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self.rpm = rpm
+        self.cooldown = cooldown
+        self.min_rpm = min_rpm
+        self.bucket = TokenBucket(rpm)
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.acquired = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self._paused_until = 0.0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._timer: Optional[asyncio.TimerHandle] = None
+
+    def _schedule_wake(self, delay: float):
+        if self._timer is not None:
+            self._timer.cancel()
+        self._timer = asyncio.get_running_loop().call_later(delay, self._wake)
+
+    def _wake(self):
+        self._timer = None
+        while self._waiters and self.in_flight < self.concurrency:
+            _, _, future = self._waiters[0]
+            if future.done():
+                # Cancelled while waiting
+                heapq.heappop(self._waiters)
+                continue
+            now = time.monotonic()
+            if now < self._paused_until:
+                self._schedule_wake(self._paused_until - now)
+                return
+            delay = self.bucket.delay(now)
+            if delay > 0:
+                self._schedule_wake(delay)
+                return
+            heapq.heappop(self._waiters)
+            self.bucket.consume(now)
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+            future.set_result(None)
+
+    async def acquire(self, priority: int = 0) -> float:
+        """Wait for a slot and a rate token. Returns the time spent waiting."""
+        started = time.monotonic()
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        self._wake()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                # Granted and cancelled in the same tick: hand the slot back
+                self.release()
+            raise
+        waited = time.monotonic() - started
+        self.acquired += 1
+        self.total_wait += waited
+        return waited
+
+    def release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def report_rate_limited(self, retry_after: Optional[float] = None):
+        """Multiplicative decrease: halve the rate and pause the pool."""
+        self.rate_limited += 1
+        current = self.bucket.rate_per_minute or self.concurrency * 60.0
+        self.bucket.rate_per_minute = max(self.min_rpm, current / 2)
+        self.bucket.tokens = min(self.bucket.tokens, 0.0)
+        self._paused_until = max(self._paused_until, time.monotonic() + (retry_after or self.cooldown))
+
+    def report_success(self):
+        """Additive increase back toward the configured rate."""
+        if self.bucket.rate_per_minute is None:
+            return
+        if self.rpm is None:
+            self.bucket.rate_per_minute += 1
+            if self.bucket.rate_per_minute >= self.concurrency * 60.0:
+                self.bucket.rate_per_minute = None
+        elif self.bucket.rate_per_minute < self.rpm:
+            self.bucket.rate_per_minute = min(self.rpm, self.bucket.rate_per_minute + 1)
+
+    def slot(self, priority: int = 0) -> "_Slot":
+        """`async with pool.slot(priority):` holds one slot for the duration of a call."""
+        return _Slot(self, priority)
+
+    def summary(self) -> str:
+        rate = f"{self.rpm:g} rpm" if self.rpm else "no rpm limit"
+        return (
+            f"{self.name}: {self.acquired} calls, peak {self.peak_in_flight}/{self.concurrency} in flight, "
+            f"{rate}, {self.rate_limited} rate-limited, {self.total_wait:.1f}s total wait"
+        )
+
+
+class _Slot:
+    def __init__(self, pool: ResourcePool, priority: int):
+        self.pool = pool
+        self.priority = priority
+        self.waited = 0.0
+
+    async def __aenter__(self):
+        self.waited = await self.pool.acquire(self.priority)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        # Adjust the rate before releasing: release() admits the next waiter, which must see the pause
+        if exc is None:
+            self.pool.report_success()
+        elif isinstance(exc, Exception) and is_rate_limit_error(exc):
+            self.pool.report_rate_limited()
+        self.pool.release()
+        return False
+
+
+class Scheduler:
+    """
+    Named resource pools shared by every research job in the process.
+
+    Each model gets a pool of its own, "llm:<model>", created on first use:
+    OpenAI rate-limits each model separately, so a 429 on one model pauses
+    only its pool and a fallback model is not held up by it. Pools take their
+    limits from `model_limits`, or else `llm_concurrency` and `llm_rpm`.
+    """
+
+    def __init__(self, pools: Dict[str, ResourcePool], llm_concurrency: int = 8, llm_rpm: Optional[float] = None,
+                 model_limits: Optional[Dict[str, Tuple[Optional[int], Optional[float]]]] = None):
+        self.pools = pools
+        self.llm_concurrency = llm_concurrency
+        self.llm_rpm = llm_rpm
+        self.model_limits = model_limits or {}
+
+    def pool(self, name: str) -> ResourcePool:
+        return self.pools[name]
+
+    def llm_pool(self, model: str) -> ResourcePool:
+        """The pool that calls to `model` are scheduled through."""
+        name = f"llm:{model}"
+        if name not in self.pools:
+            concurrency, rpm = self.model_limits.get(model, (None, None))
+            self.pools[name] = ResourcePool(
+                name,
+                concurrency=concurrency or self.llm_concurrency,
+                rpm=rpm if model in self.model_limits and rpm else self.llm_rpm,
+            )
+        return self.pools[name]
+
+    def llm_pools(self) -> List[ResourcePool]:
+        return [pool for name, pool in self.pools.items() if name.startswith("llm:")]
+
+    def summary(self) -> str:
+        return "\n".join(pool.summary() for pool in self.pools.values())
+
+
+def _optional_float(name: str) -> Optional[float]:
+    value = os.getenv(name, "").strip()
+    return float(value) if value and float(value) > 0 else None
+
+
+def _model_limits() -> Dict[str, Tuple[Optional[int], Optional[float]]]:
+    """Per-model (concurrency, rpm) from MODEL_CONCURRENCY and MODEL_RPM, e.g. "gpt-4.1=2,gpt-4.1-nano=16"."""
+    limits: Dict[str, Tuple[Optional[int], Optional[float]]] = {}
+    for variable, position in (("MODEL_CONCURRENCY", 0), ("MODEL_RPM", 1)):
+        for entry in os.getenv(variable, "").split(","):
+            model, _, value = entry.partition("=")
+            if not model.strip() or not value.strip():
+                continue
+            current = list(limits.get(model.strip(), (None, None)))
+            current[position] = int(value) if position == 0 else float(value)
+            limits[model.strip()] = (current[0], current[1])
+    return limits
+
+
+_scheduler: Optional[Scheduler] = None
+
+
+def get_scheduler() -> Scheduler:
+    """Return the process-wide scheduler, configured from the environment on first use."""
+    global _scheduler
+    if _scheduler is None:
+        _scheduler = Scheduler({
+            "search": ResourcePool(
+                "search",
+                concurrency=int(os.getenv("FIRECRAWL_CONCURRENCY", "1")),
+                rpm=_optional_float("FIRECRAWL_RPM"),
+            ),
+        }, llm_concurrency=int(os.getenv("LLM_CONCURRENCY", "8")), llm_rpm=_optional_float("LLM_RPM"),
+           model_limits=_model_limits())
+    return _scheduler
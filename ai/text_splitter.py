@@ -1,53 +1,89 @@
 from abc import ABC, abstractmethod
-from typing import List, Optional
+from collections import deque
+from typing import Callable, Iterator, List, Optional, Tuple
 import warnings
 
+# (start, end, length) of a piece of the text being split
+Span = Tuple[int, int, int]
+
 
 class TextSplitter(ABC):
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 length_function: Optional[Callable[[str], int]] = None):
         self.chunk_size = chunk_size
         self.chunk_overlap = chunk_overlap
-        
+        # None means len(); any other function (e.g. a token counter) is applied to each piece once
+        self.length_function = length_function
+
         if self.chunk_overlap >= self.chunk_size:
             raise ValueError('Cannot have chunk_overlap >= chunk_size')
-    
+
+    @classmethod
+    def from_tiktoken_encoder(cls, encoder, **kwargs):
+        """Measure chunk_size and chunk_overlap in tokens of a tiktoken encoder instead of characters."""
+        return cls(length_function=lambda text: len(encoder.encode(text, disallowed_special=())), **kwargs)
+
     @abstractmethod
     def split_text(self, text: str) -> List[str]:
         pass
-    
+
     def create_documents(self, texts: List[str]) -> List[str]:
         documents = []
         for text in texts:
             for chunk in self.split_text(text):
                 documents.append(chunk)
         return documents
-    
+
     def split_documents(self, documents: List[str]) -> List[str]:
         return self.create_documents(documents)
-    
+
+    def _length(self, text: str, start: int, end: int) -> int:
+        if self.length_function is None:
+            return end - start
+        return self.length_function(text[start:end])
+
     def _join_docs(self, docs: List[str], separator: str) -> Optional[str]:
         text = separator.join(docs).strip()
         return None if text == '' else text
-    
+
     def merge_splits(self, splits: List[str], separator: str) -> List[str]:
+        # Consecutive splits joined by the separator are one contiguous text, so
+        # every merged chunk is a slice of it
+        text = separator.join(splits)
+        spans = []
+        position = 0
+        for d in splits:
+            spans.append((position, position + len(d), self._length(text, position, position + len(d))))
+            position += len(d) + len(separator)
+        return self._merge_spans(text, spans, separator)
+
+    def _merge_spans(self, text: str, spans: List[Span], separator: str) -> List[str]:
+        """
+        Merge adjacent pieces of `text` into chunks of at most chunk_size,
+        carrying up to chunk_overlap of each chunk into the next.
+
+        The window is a deque of spans, so evicting the overlap is O(1) per
+        piece, and each chunk is a single slice of `text` from the first to
+        the last span in the window.
+        """
         docs = []
-        current_doc = []
+        window: deque = deque()
         total = 0
-        
-        for d in splits:
-            _len = len(d)
+        separator_length = self._length(separator, 0, len(separator)) if separator else 0
+
+        for start, end, _len in spans:
             # Calculate separator length that would be added
-            separator_len = len(separator) if current_doc else 0
-            
+            separator_len = separator_length if window else 0
+
             if total + separator_len + _len > self.chunk_size:
                 if total > self.chunk_size:
                     warnings.warn(
                         f"Created a chunk of size {total}, "
                         f"which is longer than the specified {self.chunk_size}"
                     )
-                if current_doc:
-                    doc = self._join_docs(current_doc, separator)
-                    if doc is not None:
+                if window:
+                    doc = text[window[0][0]:window[-1][1]].strip()
+                    if doc:
                         docs.append(doc)
                     # Keep on popping if:
                     # - we have a larger chunk than in the chunk overlap
@@ -56,71 +92,121 @@ class TextSplitter(ABC):
                         total > self.chunk_overlap or
                         (total + separator_len + _len > self.chunk_size and total > 0)
                     ):
-                        if not current_doc:
+                        if not window:
                             break
                         # Remove the first element and recalculate total
-                        removed = current_doc.pop(0)
-                        total -= len(removed)
+                        total -= window.popleft()[2]
                         # Also remove the separator that was after it (if any)
-                        if current_doc:
-                            total -= len(separator)
+                        if window:
+                            total -= separator_length
             # Recalculate separator length after potential pops
-            separator_len = len(separator) if current_doc else 0
-            current_doc.append(d)
+            separator_len = separator_length if window else 0
+            window.append((start, end, _len))
             total += separator_len + _len
-        
-        doc = self._join_docs(current_doc, separator)
-        if doc is not None:
-            docs.append(doc)
-        
+
+        if window:
+            doc = text[window[0][0]:window[-1][1]].strip()
+            if doc:
+                docs.append(doc)
+
         return docs
 
 
 class RecursiveCharacterTextSplitter(TextSplitter):
-    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200, 
-                 separators: List[str] = None): # type: ignore
-        super().__init__(chunk_size, chunk_overlap)
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 separators: List[str] = None, # type: ignore
+                 length_function: Optional[Callable[[str], int]] = None):
+        super().__init__(chunk_size, chunk_overlap, length_function)
         if separators is None:
             self.separators = ['\n\n', '\n', '.', ',', '>', '<', ' ', '']
         else:
             self.separators = separators
-    
+
     def split_text(self, text: str) -> List[str]:
-        final_chunks = []
-        
-        # Get appropriate separator to use
+        final_chunks: List[str] = []
+        self._split_span(text, 0, len(text), final_chunks)
+        return final_chunks
+
+    def _pick_separator(self, text: str, start: int, end: int) -> str:
         separator = self.separators[-1] if self.separators else ''
         for s in self.separators:
             if s == '':
-                separator = s
-                break
-            if s in text:
-                separator = s
+                return s
+            if text.find(s, start, end) != -1:
+                return s
+        return separator
+
+    @staticmethod
+    def _iter_pieces(text: str, start: int, end: int, separator: str) -> Iterator[Tuple[int, int]]:
+        """Offsets of text[start:end].split(separator), without building the substrings."""
+        find = text.find
+        step = len(separator)
+        position = start
+        found = find(separator, position, end)
+        while found != -1:
+            yield position, found
+            position = found + step
+            found = find(separator, position, end)
+        yield position, end
+
+    def _merge_characters(self, text: str, start: int, end: int) -> List[str]:
+        """
+        `_merge_spans` over single characters with an empty separator, computed
+        directly: windows of chunk_size characters advancing by
+        chunk_size - chunk_overlap, the last one running to the end.
+        """
+        docs = []
+        step = self.chunk_size - self.chunk_overlap
+        position = start
+        while position < end:
+            stop = position + self.chunk_size
+            if stop >= end:
+                stop = end
+            doc = text[position:stop].strip()
+            if doc:
+                docs.append(doc)
+            if stop == end:
                 break
-        
-        # Now that we have the separator, split the text
+            position += step
+        return docs
+
+    def _split_span(self, text: str, start: int, end: int, final_chunks: List[str]):
+        # Get appropriate separator to use
+        separator = self._pick_separator(text, start, end)
+
+        # With character lengths, single characters always fit and merge into fixed windows
+        if separator == '' and self.length_function is None and self.chunk_size > 1:
+            final_chunks.extend(self._merge_characters(text, start, end))
+            return
+
         if separator:
-            splits = text.split(separator)
+            pieces = self._iter_pieces(text, start, end, separator)
         else:
-            splits = list(text)
-        
+            pieces = ((i, i + 1) for i in range(start, end))
+
         # Now go merging things, recursively splitting longer texts.
-        good_splits = []
-        for s in splits:
-            if len(s) < self.chunk_size:
-                good_splits.append(s)
+        good_splits: List[Span] = []
+        length_function = self.length_function
+        for piece_start, piece_end in pieces:
+            if length_function is None:
+                length = piece_end - piece_start
+            else:
+                length = length_function(text[piece_start:piece_end])
+            if length < self.chunk_size:
+                good_splits.append((piece_start, piece_end, length))
             else:
                 if good_splits:
-                    merged_text = self.merge_splits(good_splits, separator)
-                    final_chunks.extend(merged_text)
+                    final_chunks.extend(self._merge_spans(text, good_splits, separator))
                     good_splits = []
-                
-                if s:  # Only process non-empty strings
-                    other_info = self.split_text(s)
-                    final_chunks.extend(other_info)
-        
+
+                if piece_end > piece_start:  # Only process non-empty strings
+                    if separator == '' or (piece_start, piece_end) == (start, end):
+                        # Nothing left to split on: keep the oversized piece whole
+                        chunk = text[piece_start:piece_end].strip()
+                        if chunk:
+                            final_chunks.append(chunk)
+                    else:
+                        self._split_span(text, piece_start, piece_end, final_chunks)
+
         if good_splits:
-            merged_text = self.merge_splits(good_splits, separator)
-            final_chunks.extend(merged_text)
-        
-        return final_chunks
\ No newline at end of file
+            final_chunks.extend(self._merge_spans(text, good_splits, separator))
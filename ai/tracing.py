@@ -0,0 +1,233 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Deque, Dict, Iterator, Optional, Tuple
+import collections
+import functools
+import json
+import os
+import time
+
+from rich.table import Table
+
+
+#######################################################################
+# Chrome trace JSON written at the end of a run (load it in chrome://tracing or ui.perfetto.dev); empty disables it
+TracePath = os.getenv("TRACE_PATH", "trace.json")
+# Spans kept for the trace file; older ones only count towards the per-stage summary (long batch runs)
+TraceMaxSpans = int(os.getenv("TRACE_MAX_SPANS", "50000"))
+#######################################################################
+
+# Numeric span attributes that the summary adds up per stage
+Counters = ("pool_wait", "prompt_tokens", "completion_tokens", "bytes")
+
+
+@dataclass
+class Span:
+    name: str
+    lane: str
+    start: float
+    end: Optional[float] = None
+    args: Dict[str, Any] = field(default_factory=dict)
+
+    def add(self, key: str, value: float):
+        """Accumulate a counter such as tokens or wait time on this span."""
+        self.args[key] = self.args.get(key, 0) + value
+        for usage in _current_meters.get():
+            usage[key] = usage.get(key, 0) + value
+
+    @property
+    def duration(self) -> float:
+        return (self.end if self.end is not None else time.perf_counter()) - self.start
+
+
+_current_span: ContextVar[Optional[Span]] = ContextVar("current_span", default=None)
+# The research node (SERP query) the current task works for; one row per node in the trace viewer
+_current_lane: ContextVar[str] = ContextVar("current_lane", default="main")
+# Open `meter()` totals that every counter added in this context also goes to
+_current_meters: ContextVar[Tuple[Dict[str, float], ...]] = ContextVar("current_meters", default=())
+
+
+class Tracer:
+    """
+    Records timed spans across the research tree.
+
+    Spans nest through a context variable, so concurrent branches each see
+    their own parent, and counters recorded by the providers and scheduler
+    (tokens, pool wait, bytes) land on the innermost open span. `summary`
+    aggregates spans by name; `write_chrome_trace` exports the spans as
+    Chrome trace "complete" events, one row per research node.
+
+    Only the last `max_spans` spans are kept. Older ones are folded into the
+    per-stage totals, so the summary still covers the whole process while
+    memory stays bounded under long batch runs.
+    """
+
+    def __init__(self, max_spans: int = TraceMaxSpans):
+        self.origin = time.perf_counter()
+        self.max_spans = max(1, max_spans)
+        self.spans: Deque[Span] = collections.deque()
+        self._folded: Dict[str, Dict[str, float]] = {}
+
+    @contextmanager
+    def span(self, name: str, **args) -> Iterator[Span]:
+        span = self.start_span(name, **args)
+        token = _current_span.set(span)
+        try:
+            yield span
+        finally:
+            _current_span.reset(token)
+            span.end = time.perf_counter()
+
+    def start_span(self, name: str, **args) -> Span:
+        """
+        Start a span without making it current, for code that cannot hold a
+        context manager open, such as an async generator across its yields.
+        Set `span.end` to finish it.
+        """
+        span = Span(name=name, lane=_current_lane.get(), start=time.perf_counter(), args=dict(args))
+        self.spans.append(span)
+        if len(self.spans) > self.max_spans:
+            self._fold(self._folded, self.spans.popleft())
+        return span
+
+    @staticmethod
+    def _fold(stages: Dict[str, Dict[str, float]], span: Span):
+        if span.name not in stages:
+            stages[span.name] = {"calls": 0, "seconds": 0.0, "max": 0.0, **{c: 0 for c in Counters}}
+        stage = stages[span.name]
+        stage["calls"] += 1
+        stage["seconds"] += span.duration
+        stage["max"] = max(stage["max"], span.duration)
+        for counter in Counters:
+            stage[counter] += span.args.get(counter, 0)
+
+    @contextmanager
+    def lane(self, name: str) -> Iterator[None]:
+        token = _current_lane.set(name)
+        try:
+            yield
+        finally:
+            _current_lane.reset(token)
+
+    def stages(self) -> Dict[str, Dict[str, float]]:
+        stages = {name: dict(stage) for name, stage in self._folded.items()}
+        for span in self.spans:
+            self._fold(stages, span)
+        return stages
+
+    def summary_table(self) -> Table:
+        table = Table(title=f"Run trace ({time.perf_counter() - self.origin:.1f}s wall)")
+        for column in ("stage", "calls", "total s", "mean s", "max s", "pool wait s", "prompt tok", "completion tok", "bytes"):
+            table.add_column(column, justify="left" if column == "stage" else "right")
+        for name, stage in sorted(self.stages().items(), key=lambda item: -item[1]["seconds"]):
+            table.add_row(
+                name, str(stage["calls"]), f"{stage['seconds']:.2f}", f"{stage['seconds'] / stage['calls']:.2f}",
+                f"{stage['max']:.2f}", f"{stage['pool_wait']:.2f}", f"{stage['prompt_tokens']:,}",
+                f"{stage['completion_tokens']:,}", f"{stage['bytes']:,}",
+            )
+        return table
+
+    def summary(self) -> str:
+        return "\n".join(
+            f"{name}: {stage['calls']} calls, {stage['seconds']:.2f}s total, {stage['pool_wait']:.2f}s pool wait, "
+            f"{stage['prompt_tokens']:,} prompt / {stage['completion_tokens']:,} completion tokens, {stage['bytes']:,} bytes"
+            for name, stage in sorted(self.stages().items(), key=lambda item: -item[1]["seconds"])
+        )
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        lanes: Dict[str, int] = {}
+        events = []
+        for span in self.spans:
+            tid = lanes.setdefault(span.lane, len(lanes) + 1)
+            events.append({
+                "name": span.name,
+                "cat": span.name.split(".")[0],
+                "ph": "X",
+                "ts": round((span.start - self.origin) * 1e6),
+                "dur": round(span.duration * 1e6),
+                "pid": 1,
+                "tid": tid,
+                "args": span.args,
+            })
+        for lane, tid in lanes.items():
+            events.append({"name": "thread_name", "ph": "M", "pid": 1, "tid": tid, "args": {"name": lane}})
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def write_chrome_trace(self, path: str = TracePath) -> Optional[str]:
+        if not path:
+            return None
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f, default=str)
+        return path
+
+    def report(self, console=None):
+        """Print the per-stage summary and write the Chrome trace file."""
+        if not self.spans:
+            return
+        path = self.write_chrome_trace()
+        if console:
+            console.print(self.summary_table())
+            if path:
+                console.print(f"[bold cyan]Trace written to {path}[/bold cyan]")
+        else:
+            print(self.summary())
+            if path:
+                print(f"Trace written to {path}")
+
+
+_tracer: Optional[Tracer] = None
+
+
+def get_tracer() -> Tracer:
+    """Return the process-wide tracer."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer()
+    return _tracer
+
+
+def traced(name: str):
+    """Decorator: run an async function inside a span named `name` on the process-wide tracer."""
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            with get_tracer().span(name):
+                return await func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def set_lane(name: str):
+    """
+    Label spans started by the current task (and tasks it creates) with `name`.
+    Every asyncio task runs in its own copy of the context, so this never
+    leaks into sibling branches.
+    """
+    _current_lane.set(name)
+
+
+def current_span() -> Optional[Span]:
+    return _current_span.get()
+
+
+def record(key: str, value: float):
+    """Add `value` to counter `key` on the innermost open span, if any."""
+    span = _current_span.get()
+    if span is not None:
+        span.add(key, value)
+
+
+@contextmanager
+def meter() -> Iterator[Dict[str, float]]:
+    """
+    Total the counters (tokens, bytes, pool wait) recorded by the calling task
+    and every task it creates while the block is open, e.g. to enforce a token
+    budget on one research run while others share the process-wide tracer.
+    """
+    usage: Dict[str, float] = {}
+    token = _current_meters.set(_current_meters.get() + (usage,))
+    try:
+        yield usage
+    finally:
+        _current_meters.reset(token)
@@ -0,0 +1,193 @@
+from dotenv import load_dotenv
+
+# Load .env before importing the research modules: they read their process-wide settings (pools, caches, timeouts)
+# from the environment when imported, and each engine reads its research settings from it when first used
+load_dotenv()
+
+from deep_research import ResearchResult
+from engine import ResearchEngine, get_engine
+from planner import ResearchBudget
+from ai.cleaning import get_page_cleaner
+from ai.tracing import get_tracer, set_lane
+from checkpoint import ResearchJournal
+from typing import Any, AsyncIterator, Dict, Optional
+import argparse
+import asyncio
+import aiofiles
+import json
+import os
+import re
+import time
+
+from rich.console import Console
+from rich.text import Text
+console = Console()
+
+# Job ids name the per-job report and journal files, so they must be plain file names
+_job_id_pattern = re.compile(r"^\w[\w.-]*$")
+
+
+async def read_jobs(path: str) -> AsyncIterator[Dict[str, Any]]:
+    """Stream job records from a JSONL file, one research question per line."""
+    async with aiofiles.open(path, "r", encoding="utf-8") as f:
+        line_number = 0
+        async for line in f:
+            line_number += 1
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError as e:
+                console.print(Text(f"Skipping malformed line {line_number}: {e}", style="bold red"))
+                continue
+            if not isinstance(record, dict):
+                # Still yielded, so the job shows up as failed in the output
+                yield {"id": str(line_number), "invalid": f"line {line_number} is not a JSON object"}
+                continue
+            record.setdefault("id", str(line_number))
+            yield record
+
+
+async def run_job(engine: ResearchEngine, record: Dict[str, Any], report_dir: Optional[str] = None,
+                  journal_dir: Optional[str] = None) -> Dict[str, Any]:
+    """Run one research job and return the record to write to the output file."""
+    if "invalid" in record:
+        raise ValueError(record["invalid"])
+    job_id = str(record["id"])
+    if (report_dir or journal_dir) and not _job_id_pattern.match(job_id):
+        raise ValueError(f"job id {job_id!r} is not a plain file name (letters, digits, '_', '-' and '.')")
+    query = record["query"]
+    breadth = int(record.get("breadth", 4))
+    depth = int(record.get("depth", 2))
+    mode = str(record.get("mode", "report")).lower()
+    started = time.perf_counter()
+
+    # A per-job journal lets a rerun of the batch resume interrupted jobs
+    journal = ResearchJournal(os.path.join(journal_dir, f"{job_id}.jsonl")) if journal_dir else None
+    try:
+        research_mode = os.getenv("RESEARCH_MODE", "").lower()
+        pipelined = record.get("pipeline", research_mode == "pipeline")
+        # A "budget" object ({"searches": ..., "tokens": ..., "seconds": ...}) opts a job into budgeted research
+        if "budget" in record:
+            budget = ResearchBudget(**record["budget"])
+        else:
+            budget = ResearchBudget.from_env() if research_mode == "budget" else None
+        early_answer = None
+        if mode == "answer" and record.get("early_stop", engine.settings.early_answer):
+            early_answer = await engine.research_answer(query=query, breadth=breadth, depth=depth,
+                                                        pipelined=pipelined, budget=budget, journal=journal)
+            research_results = ResearchResult(learnings=early_answer.learnings, visitedUrls=early_answer.visitedUrls)
+        else:
+            research_results: ResearchResult = await engine.research(query=query, breadth=breadth, depth=depth,
+                                                                     pipelined=pipelined, budget=budget, journal=journal)
+    finally:
+        if journal:
+            journal.close()
+    output: Dict[str, Any] = {
+        "id": job_id,
+        "query": query,
+        "breadth": breadth,
+        "depth": depth,
+        "mode": mode,
+        "learnings": research_results.learnings,
+        "visitedUrls": research_results.visitedUrls,
+    }
+    if early_answer is not None:
+        output["answer"] = early_answer.answer
+        output["converged"] = early_answer.converged
+    elif mode == "answer":
+        output["answer"] = await engine.answer(query=query, learnings=research_results.learnings)
+    else:
+        output["report"] = await engine.report(
+            query=query,
+            learnings=research_results.learnings,
+            visited_urls=research_results.visitedUrls,
+        )
+    if report_dir:
+        # One file per job; jobs never share report.md / answer.md
+        extension = "answer.md" if mode == "answer" else "report.md"
+        path = os.path.join(report_dir, f"{job_id}.{extension}")
+        async with aiofiles.open(path, "w", encoding="utf-8") as f:
+            await f.write(output["answer"] if mode == "answer" else output["report"])
+        output["path"] = path
+    output["seconds"] = round(time.perf_counter() - started, 2)
+    return output
+
+
+async def run_batch(input_path: str, output_path: str, jobs: int = 4, report_dir: Optional[str] = None,
+                    journal_dir: Optional[str] = None, engine: Optional[ResearchEngine] = None):
+    """
+    Run every job in `input_path` with at most `jobs` research trees in flight,
+    appending one result line to `output_path` as each job finishes.
+
+    All jobs share one engine (clients and connections) and the process-wide
+    limits (FIRECRAWL_CONCURRENCY and LLM_CONCURRENCY).
+    """
+    engine = engine or get_engine()
+    if report_dir:
+        os.makedirs(report_dir, exist_ok=True)
+    if journal_dir:
+        os.makedirs(journal_dir, exist_ok=True)
+    queue: asyncio.Queue = asyncio.Queue(maxsize=jobs)
+    write_lock = asyncio.Lock()
+    counts = {"done": 0, "failed": 0}
+
+    async with aiofiles.open(output_path, "a", encoding="utf-8") as out:
+        async def write_result(result: Dict[str, Any]):
+            async with write_lock:
+                await out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                await out.flush()
+
+        async def worker():
+            while True:
+                record = await queue.get()
+                if record is None:
+                    return
+                set_lane(f"job {record.get('id')}")
+                try:
+                    result = await run_job(engine, record, report_dir=report_dir, journal_dir=journal_dir)
+                    counts["done"] += 1
+                    console.print(Text(f"Finished job {record['id']} in {result['seconds']}s", style="bold green"))
+                except Exception as e:
+                    result = {"id": str(record.get("id")), "query": record.get("query"), "error": str(e)}
+                    counts["failed"] += 1
+                    console.print(Text(f"Job {record.get('id')} failed: {e}", style="bold red"))
+                await write_result(result)
+
+        workers = [asyncio.create_task(worker()) for _ in range(jobs)]
+        try:
+            async for record in read_jobs(input_path):
+                await queue.put(record)
+        finally:
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+    return counts
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Run many research jobs from a JSONL file.")
+    parser.add_argument("input", help='JSONL file, one {"query", "breadth", "depth", "mode"} record per line')
+    parser.add_argument("output", help="JSONL file that results are appended to as jobs finish")
+    parser.add_argument("--jobs", type=int, default=4, help="number of research jobs to run at once")
+    parser.add_argument("--report-dir", default=None, help="also write each report/answer to <report-dir>/<id>.<mode>.md")
+    parser.add_argument("--journal-dir", default=None, help="checkpoint each job to <journal-dir>/<id>.jsonl so reruns resume")
+    args = parser.parse_args()
+    engine = get_engine()
+    try:
+        counts = await run_batch(args.input, args.output, jobs=args.jobs, report_dir=args.report_dir,
+                                 journal_dir=args.journal_dir, engine=engine)
+        console.print(Text(f"Batch complete: {counts['done']} succeeded, {counts['failed']} failed", style="bold cyan"))
+    finally:
+        get_tracer().report(console)
+        console.print(Text(get_page_cleaner().summary(), style="bold cyan"))
+        get_page_cleaner().close()
+        await engine.close()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(main())
+    except KeyboardInterrupt:
+        print("\nBatch interrupted by user. Exiting.")
@@ -0,0 +1,203 @@
+"""
+Offline stand-ins for Firecrawl and OpenAI.
+
+`FakeFirecrawl` and `FakeOpenAI` are handed to a `ResearchEngine` in place
+of the Firecrawl app and the OpenAI client, so a benchmark exercises the
+real scheduler, caches, tracing and prompt building while every network
+call is simulated with a configurable latency distribution (including
+stalled calls), rate limit, 429 rate and 503 rate.
+"""
+from pydantic import BaseModel
+from typing import Any, Dict, List, Optional, get_args, get_origin
+from dataclasses import dataclass
+import asyncio
+import collections
+import random
+import time
+import zlib
+
+
+@dataclass
+class Latency:
+    """
+    Log-normal latency in seconds: `median` with spread `sigma`, capped at
+    `maximum`. A `stall_rate` share of calls hang for `stall` seconds
+    instead, like a request stuck on a slow upstream.
+    """
+    median: float = 0.2
+    sigma: float = 0.5
+    maximum: float = 30.0
+    stall_rate: float = 0.0
+    stall: float = 30.0
+
+    def sample(self, rng: random.Random) -> float:
+        if self.stall_rate and rng.random() < self.stall_rate:
+            return self.stall
+        if self.median <= 0:
+            return 0.0
+        return min(self.maximum, rng.lognormvariate(0, self.sigma) * self.median)
+
+
+class FakeRateLimitError(Exception):
+    """Raised like the real clients do on HTTP 429; `is_rate_limit_error` recognizes it."""
+    status_code = 429
+
+    def __init__(self, backend: str):
+        super().__init__(f"{backend}: Status code 429. Rate limit exceeded")
+
+
+class FakeServerError(Exception):
+    """An HTTP 503 from the backend, retryable like the real ones."""
+    status_code = 503
+
+    def __init__(self, backend: str):
+        super().__init__(f"{backend}: Status code 503. Service Unavailable")
+
+
+@dataclass
+class BackendStats:
+    calls: int = 0
+    rate_limited: int = 0
+    server_errors: int = 0
+    in_flight: int = 0
+    peak_in_flight: int = 0
+    busy_seconds: float = 0.0
+
+
+class _FakeBackend:
+    def __init__(self, name: str, latency: Latency, rpm: Optional[float], error_rate: float, seed: int,
+                 server_error_rate: float = 0.0):
+        self.name = name
+        self.latency = latency
+        self.rpm = rpm
+        self.error_rate = error_rate
+        self.server_error_rate = server_error_rate
+        self.rng = random.Random(seed)
+        self.stats = BackendStats()
+        # Admission times within the last minute, for the RPM limit
+        self._window: collections.deque = collections.deque()
+
+    async def _call(self):
+        """Simulate one request: admission against the RPM window, random 429s and 503s, then latency."""
+        stats = self.stats
+        now = time.monotonic()
+        while self._window and now - self._window[0] > 60:
+            self._window.popleft()
+        stats.calls += 1
+        if (self.rpm and len(self._window) >= self.rpm) or self.rng.random() < self.error_rate:
+            stats.rate_limited += 1
+            await asyncio.sleep(0.01)
+            raise FakeRateLimitError(self.name)
+        if self.server_error_rate and self.rng.random() < self.server_error_rate:
+            stats.server_errors += 1
+            await asyncio.sleep(0.01)
+            raise FakeServerError(self.name)
+        self._window.append(now)
+        stats.in_flight += 1
+        stats.peak_in_flight = max(stats.peak_in_flight, stats.in_flight)
+        started = time.perf_counter()
+        try:
+            await asyncio.sleep(self.latency.sample(self.rng))
+        finally:
+            stats.in_flight -= 1
+            stats.busy_seconds += time.perf_counter() - started
+
+
+class FakeFirecrawl(_FakeBackend):
+    """Drop-in for `AsyncFirecrawlApp.search` returning synthetic markdown pages."""
+
+    def __init__(self, latency: Latency = Latency(1.5, 0.6), rpm: Optional[float] = None, error_rate: float = 0.0,
+                 page_chars: int = 20000, url_pool: int = 0, seed: int = 0, server_error_rate: float = 0.0):
+        super().__init__("firecrawl", latency, rpm, error_rate, seed, server_error_rate)
+        self.page_chars = page_chars
+        # With a non-zero pool, URLs repeat across queries like real SERPs do
+        self.url_pool = url_pool
+
+    def page(self, query: str, i: int) -> str:
+        paragraph = f"Findings about {query} from source {i}: figures, dates and named entities. "
+        return ("\n\n".join([paragraph * 4] * (self.page_chars // (len(paragraph) * 4 + 2) + 1)))[:self.page_chars]
+
+    async def search(self, query: str, limit: Optional[int] = 5, **kwargs) -> Dict[str, Any]:
+        await self._call()
+        limit = limit or 5
+        data = []
+        for i in range(limit):
+            slug = self.rng.randrange(self.url_pool) if self.url_pool else f"{zlib.crc32(query.encode())}-{i}"
+            data.append({"url": f"https://example.com/{slug}", "title": f"{query} {i}", "markdown": self.page(query, i)})
+        return {"success": True, "data": data}
+
+
+def synthesize(schema: type, rng: random.Random, list_size: int = 3) -> BaseModel:
+    """Build a plausible instance of any pydantic output schema from its field annotations."""
+    values = {}
+    for name, info in schema.model_fields.items():
+        values[name] = _synthesize_value(info.annotation, name, rng, list_size)
+    return schema(**values)
+
+
+def _synthesize_value(annotation, name: str, rng: random.Random, list_size: int):
+    origin = get_origin(annotation)
+    if origin in (list, List):
+        (item,) = get_args(annotation) or (str,)
+        return [_synthesize_value(item, name, rng, list_size) for _ in range(list_size)]
+    if isinstance(annotation, type) and issubclass(annotation, BaseModel):
+        return synthesize(annotation, rng, list_size)
+    if annotation is int:
+        return rng.randrange(list_size)
+    if annotation is bool:
+        return rng.random() < 0.5
+    if annotation is float:
+        return rng.random()
+    return f"synthetic {name} {rng.randrange(10 ** 6)}"
+
+
+class _FakeResponses:
+    def __init__(self, owner: "FakeOpenAI"):
+        self.owner = owner
+
+    async def parse(self, model: str, input: List[Dict[str, str]], text_format, **kwargs):
+        await self.owner._call()
+        return _FakeParsedResponse(synthesize(text_format, self.owner.rng, self.owner.list_size))
+
+    async def create(self, model: str, input: List[Dict[str, str]], stream: bool = False, **kwargs):
+        await self.owner._call()
+        return _FakeStream(self.owner.stream_tokens)
+
+
+@dataclass
+class _FakeParsedResponse:
+    output_parsed: Any
+
+
+@dataclass
+class _FakeDelta:
+    delta: str
+    type: str = "response.output_text.delta"
+
+
+class _FakeStream:
+    def __init__(self, tokens: int):
+        self.tokens = tokens
+
+    async def __aiter__(self):
+        for i in range(self.tokens):
+            if i % 50 == 0:
+                await asyncio.sleep(0.001)
+            yield _FakeDelta(f"token{i} ")
+
+    async def close(self):
+        pass
+
+
+class FakeOpenAI(_FakeBackend):
+    """Stand-in for the shared `AsyncOpenAI` client: `responses.parse` and streaming `responses.create`."""
+
+    def __init__(self, latency: Latency = Latency(2.0, 0.5), rpm: Optional[float] = None, error_rate: float = 0.0,
+                 list_size: int = 3, stream_tokens: int = 2000, seed: int = 1, server_error_rate: float = 0.0):
+        super().__init__("openai", latency, rpm, error_rate, seed, server_error_rate)
+        self.list_size = list_size
+        self.stream_tokens = stream_tokens
+        self.responses = _FakeResponses(self)
+
+    async def close(self):
+        pass
@@ -0,0 +1,157 @@
+"""
+End-to-end research benchmark against the offline fakes.
+
+    python -m benchmarks.research --breadth 2,3,4 --depth 1,2 --llm-latency 1.0
+
+Runs `deep_research` (or the pipelined or budgeted variant) once per breadth x depth
+cell with fresh scheduler pools and reports wall time, peak Python memory,
+calls made, 429s, retries and hedges, and the concurrency each backend
+actually saw. `--stall-rate` and `--server-error-rate` add hung calls and
+503s to measure the tail with and without `--hedge`.
+"""
+import os
+
+# Never touch the real services or the on-disk caches from a benchmark
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+os.environ.setdefault("FIRECRAWL_API_KEY", "offline-benchmark")
+os.environ["FIRECRAWL_CACHE"] = "off"
+os.environ["CORPUS"] = "off"
+os.environ["LLM_CACHE"] = "0"
+os.environ["TRACE_PATH"] = ""
+
+from benchmarks.fakes import FakeFirecrawl, FakeOpenAI, Latency
+from typing import Any, Dict, List
+import argparse
+import asyncio
+import json
+import time
+import tracemalloc
+
+from rich.console import Console
+from rich.table import Table
+
+import ai.resilience
+import ai.scheduler
+import ai.tracing
+import deep_research
+from engine import ResearchEngine
+from planner import ResearchBudget
+
+console = Console()
+
+
+def reset():
+    """Give each cell fresh scheduler pools, resilience stats and trace, and silence the research logging."""
+    deep_research.console = Console(quiet=True)
+    ai.scheduler._scheduler = None
+    ai.resilience._resilience.clear()
+    ai.tracing._tracer = None
+
+
+async def run_cell(args, breadth: int, depth: int) -> Dict[str, Any]:
+    firecrawl = FakeFirecrawl(
+        latency=Latency(args.search_latency, args.sigma, stall_rate=args.stall_rate, stall=args.stall),
+        rpm=args.search_rpm,
+        error_rate=args.error_rate,
+        page_chars=args.page_chars,
+        url_pool=args.url_pool,
+        seed=args.seed,
+        server_error_rate=args.server_error_rate,
+    )
+    llm = FakeOpenAI(latency=Latency(args.llm_latency, args.sigma, stall_rate=args.stall_rate, stall=args.stall),
+                     rpm=args.llm_rpm, error_rate=args.error_rate, seed=args.seed + 1,
+                     server_error_rate=args.server_error_rate)
+    reset()
+    engine = ResearchEngine(firecrawl=firecrawl, openai_client=llm)
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    budget = ResearchBudget(searches=args.budget_searches or None) if args.budget else None
+    result = await engine.research("offline benchmark topic", breadth=breadth, depth=depth, pipelined=args.pipeline, budget=budget)
+    wall = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    scheduler = ai.scheduler.get_scheduler()
+    resilience = [ai.resilience.get_resilience(backend).stats for backend in ("search", "llm")]
+    return {
+        "breadth": breadth,
+        "depth": depth,
+        "mode": "budget" if args.budget else "pipeline" if args.pipeline else "recursive",
+        "wall_s": round(wall, 3),
+        "peak_mb": round(peak / 2 ** 20, 2),
+        "learnings": len(result.learnings),  # type: ignore
+        "search_calls": firecrawl.stats.calls,
+        "llm_calls": llm.stats.calls,
+        "rate_limited": firecrawl.stats.rate_limited + llm.stats.rate_limited,
+        "server_errors": firecrawl.stats.server_errors + llm.stats.server_errors,
+        "retries": sum(stats.retries for stats in resilience),
+        "timeouts": sum(stats.timeouts for stats in resilience),
+        "hedges": sum(stats.hedges for stats in resilience),
+        "search_peak": firecrawl.stats.peak_in_flight,
+        "llm_peak": llm.stats.peak_in_flight,
+        # Average requests in flight over the run: busy time divided by wall time
+        "search_mean": round(firecrawl.stats.busy_seconds / wall, 2),
+        "llm_mean": round(llm.stats.busy_seconds / wall, 2),
+        "llm_pool_wait_s": round(sum(pool.total_wait for pool in scheduler.llm_pools()), 2),
+    }
+
+
+def print_table(rows: List[Dict[str, Any]]):
+    table = Table(title="deep_research offline benchmark")
+    for column in rows[0]:
+        table.add_column(column, justify="right")
+    for row in rows:
+        table.add_row(*(str(v) for v in row.values()))
+    console.print(table)
+
+
+def int_list(value: str) -> List[int]:
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+async def main():
+    parser = argparse.ArgumentParser(description="Benchmark deep_research offline over a breadth x depth grid.")
+    parser.add_argument("--breadth", type=int_list, default=[2, 3, 4])
+    parser.add_argument("--depth", type=int_list, default=[1, 2])
+    parser.add_argument("--pipeline", action="store_true", help="benchmark deep_research_pipelined instead")
+    parser.add_argument("--budget", action="store_true", help="benchmark deep_research_budgeted instead")
+    parser.add_argument("--budget-searches", type=int, default=0, help="search budget for --budget (0: unlimited)")
+    parser.add_argument("--search-concurrency", type=int, default=None, help="FIRECRAWL_CONCURRENCY for the run")
+    parser.add_argument("--llm-concurrency", type=int, default=None, help="LLM_CONCURRENCY for the run")
+    parser.add_argument("--search-latency", type=float, default=1.5, help="median Firecrawl latency in seconds")
+    parser.add_argument("--llm-latency", type=float, default=2.0, help="median LLM latency in seconds")
+    parser.add_argument("--sigma", type=float, default=0.5, help="log-normal spread of both latencies")
+    parser.add_argument("--search-rpm", type=float, default=None, help="fake Firecrawl rate limit; excess calls get a 429")
+    parser.add_argument("--llm-rpm", type=float, default=None, help="fake OpenAI rate limit; excess calls get a 429")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="probability that any call fails with a 429")
+    parser.add_argument("--server-error-rate", type=float, default=0.0, help="probability that any call fails with a 503")
+    parser.add_argument("--stall-rate", type=float, default=0.0, help="probability that any call hangs for --stall seconds")
+    parser.add_argument("--stall", type=float, default=30.0, help="how long a stalled call hangs")
+    parser.add_argument("--hedge", default=None, help='HEDGE for the run, e.g. "search,llm"')
+    parser.add_argument("--page-chars", type=int, default=20000, help="size of each synthetic markdown page")
+    parser.add_argument("--url-pool", type=int, default=0, help="draw URLs from this many pages so SERPs overlap (0: all unique)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="also write the rows to this JSON file")
+    args = parser.parse_args()
+    # Read by get_scheduler() when reset() has it rebuild the pools for each cell
+    if args.search_concurrency:
+        os.environ["FIRECRAWL_CONCURRENCY"] = str(args.search_concurrency)
+    if args.llm_concurrency:
+        os.environ["LLM_CONCURRENCY"] = str(args.llm_concurrency)
+    if args.hedge is not None:
+        ai.resilience.HedgedBackends = {b.strip() for b in args.hedge.lower().split(",") if b.strip()}
+
+    rows = []
+    for depth in args.depth:
+        for breadth in args.breadth:
+            rows.append(await run_cell(args, breadth, depth))
+            console.print(f"[cyan]breadth={breadth} depth={depth}: {rows[-1]['wall_s']}s[/cyan]")
+    print_table(rows)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(rows, f, indent=2)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,86 @@
+"""
+Microbenchmarks for prompt trimming and text splitting on large inputs.
+
+    python -m benchmarks.text --sizes 1,4,16
+
+Each case is timed on synthetic markdown of the given sizes (in MB) and
+reported as best-of-N seconds and MB/s.
+"""
+import os
+
+os.environ.setdefault("OPENAI_API_KEY", "offline-benchmark")
+
+from typing import Callable, List
+import argparse
+import random
+import time
+
+from rich.console import Console
+from rich.table import Table
+
+from ai.providers import trim_prompt, trim_prompts
+from ai.text_splitter import RecursiveCharacterTextSplitter
+
+console = Console()
+
+
+def prose(size: int, seed: int = 0) -> str:
+    """Markdown-like text with paragraphs, lines, sentences and commas."""
+    rng = random.Random(seed)
+    words = ["research", "market", "2024", "revenue", "growth", "model", "data", "policy", "energy", "battery"]
+    parts = []
+    length = 0
+    while length < size:
+        sentence = " ".join(rng.choice(words) for _ in range(rng.randint(5, 20))) + ", and more. "
+        parts.append(sentence)
+        length += len(sentence)
+        if rng.random() < 0.1:
+            parts.append("\n\n" if rng.random() < 0.5 else "\n")
+    return "".join(parts)[:size]
+
+
+def unbroken(size: int) -> str:
+    """Text with no separators at all, e.g. a base64 blob or minified script scraped into a page."""
+    return ("abcdefghij" * (size // 10 + 1))[:size]
+
+
+def best_of(repeats: int, func: Callable[[], object]) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        started = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark trim_prompt and RecursiveCharacterTextSplitter.")
+    parser.add_argument("--sizes", default="1,4", help="comma-separated input sizes in MB")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+    sizes: List[float] = [float(s) for s in args.sizes.split(",") if s.strip()]
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
+    table = Table(title="Text microbenchmarks")
+    for column in ("case", "MB", "seconds", "MB/s"):
+        table.add_column(column, justify="left" if column == "case" else "right")
+
+    for mb in sizes:
+        size = int(mb * 2 ** 20)
+        text = prose(size)
+        blob = unbroken(size)
+        pages = [prose(size // 10, seed=i) for i in range(10)]
+        cases = {
+            "trim_prompt 128k tokens": lambda: trim_prompt(text, 128000),
+            "trim_prompts 10 pages / 100k": lambda: trim_prompts(pages, total_budget=100000, per_prompt_limit=25000),
+            "split_text prose": lambda: splitter.split_text(text),
+            "split_text no separators": lambda: splitter.split_text(blob),
+        }
+        for name, func in cases.items():
+            seconds = best_of(args.repeats, func)
+            table.add_row(name, f"{mb:g}", f"{seconds:.3f}", f"{mb / seconds:.1f}" if seconds else "inf")
+    console.print(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+from dataclasses import asdict
+from typing import Any, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
+
+
+class ResearchJournal:
+    """
+    Append-only JSONL journal of a deep_research tree.
+
+    Every node records its generated SERP queries, and every SERP query records
+    its Firecrawl result and then its learnings and follow-up questions as soon
+    as they are available. Reopening the same file replays the journal so an
+    interrupted run skips all completed work instead of calling Firecrawl or
+    the LLM again.
+
+    Writes never await, so entries from concurrent branches cannot interleave.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._serp_queries: Dict[str, List[Dict[str, Any]]] = {}
+        self._searches: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._results: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.last_progress: Optional[Dict[str, Any]] = None
+        self.root: Optional[Dict[str, Any]] = None
+        if os.path.exists(path):
+            self._replay()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, "a", encoding="utf-8")
+
+    def start_over(self):
+        """
+        Forget the replayed run and journal a new one into an empty file. The
+        old journal is kept next to it as `<path>.prev`, replacing any earlier one.
+        """
+        self.close()
+        if os.path.exists(self.path):
+            os.replace(self.path, self.path + ".prev")
+        self._serp_queries.clear()
+        self._searches.clear()
+        self._results.clear()
+        self.last_progress = None
+        self.root = None
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _replay(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # A torn final line from a killed process; everything before it is intact
+                    continue
+                kind = entry.get("type")
+                if kind == "root":
+                    self.root = entry["run"]
+                elif kind == "serp_queries":
+                    self._serp_queries[entry["node"]] = entry["queries"]
+                elif kind == "search":
+                    self._searches[(entry["node"], entry["query"])] = entry["result"]
+                elif kind == "learnings":
+                    self._results[(entry["node"], entry["query"])] = entry
+                elif kind == "progress":
+                    self.last_progress = entry["progress"]
+
+    def _append(self, entry: Dict[str, Any]):
+        self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self._file.flush()
+
+    @staticmethod
+    def node_key(query: str, breadth: int, depth: int) -> str:
+        payload = json.dumps([query, breadth, depth], ensure_ascii=False)
+        return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+    def record_root(self, run: Dict[str, Any]):
+        """Remember the top-level query and settings so a resumed run can reuse them."""
+        self.root = run
+        self._append({"type": "root", "run": run})
+
+    @property
+    def completed_queries(self) -> int:
+        return len(self._results)
+
+    def serp_queries(self, node: str) -> Optional[List[Dict[str, Any]]]:
+        return self._serp_queries.get(node)
+
+    def record_serp_queries(self, node: str, queries: List[Dict[str, Any]]):
+        self._serp_queries[node] = queries
+        self._append({"type": "serp_queries", "node": node, "queries": queries})
+
+    def search_result(self, node: str, query: str) -> Optional[Dict[str, Any]]:
+        return self._searches.get((node, query))
+
+    def record_search_result(self, node: str, query: str, result: Dict[str, Any]):
+        # Only what process_serp_result reads is worth persisting
+        slim = {
+            "data": [
+                {"url": item.get("url"), "markdown": item.get("markdown")}
+                for item in result.get("data", [])
+            ]
+        }
+        self._searches[(node, query)] = slim
+        self._append({"type": "search", "node": node, "query": query, "result": slim})
+
+    def node_result(self, node: str, query: str) -> Optional[Dict[str, Any]]:
+        """Return the stored ResearchResult fields and follow-up questions for a completed SERP query."""
+        return self._results.get((node, query))
+
+    def record_node_result(self, node: str, query: str, result, follow_up_questions: List[str]):
+        entry = {
+            "type": "learnings",
+            "node": node,
+            "query": query,
+            "result": asdict(result),
+            "followUpQuestions": follow_up_questions,
+        }
+        self._results[(node, query)] = entry
+        self._append(entry)
+
+    def record_progress(self, progress):
+        self.last_progress = asdict(progress)
+        self._append({"type": "progress", "progress": self.last_progress})
+
+    def close(self):
+        if not self._file.closed:
+            self._file.close()
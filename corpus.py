@@ -0,0 +1,196 @@
+from ai.relevance import tokenize
+from typing import Any, Container, Dict, Iterable, List, Optional
+from dataclasses import dataclass
+import itertools
+import math
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+
+#######################################################################
+# Every page scraped through Firecrawl is kept in a local full-text index and SERP queries are answered from it first,
+# unless the engine's `corpus` setting (CORPUS=off) disables both
+CorpusPath = os.getenv("CORPUS_PATH", os.path.join(".cache", "corpus.sqlite"))
+# Pages fetched longer ago than this (seconds) are not served, so the web is asked again
+CorpusMaxAge = float(os.getenv("CORPUS_MAX_AGE", str(30 * 24 * 3600)))
+# A stored page counts as a hit only if it contains at least this fraction of the query's terms
+CorpusMinCoverage = float(os.getenv("CORPUS_MIN_COVERAGE", "0.75"))
+#######################################################################
+
+# Partial-coverage lookups OR together one AND per allowed term subset; past this many, every term is required
+_max_match_clauses = 64
+
+
+@dataclass
+class CorpusStats:
+    lookups: int = 0
+    pages_served: int = 0
+    pages_added: int = 0
+
+    @property
+    def pages_per_lookup(self) -> float:
+        return self.pages_served / self.lookups if self.lookups else 0.0
+
+
+class CorpusIndex:
+    """
+    Persistent full-text index of scraped pages in a single SQLite file.
+
+    Pages live in a plain table (URL, title, fetch time, zlib-compressed
+    markdown); an FTS5 table with the porter tokenizer indexes their title and
+    text without storing a second copy (`content=''`), so the file stays close
+    to the compressed size of the corpus. A lookup first matches pages holding
+    every query term and only widens to pages holding `min_coverage` of them
+    when that comes up short (see `match_expressions`), so FTS5 ranks a small
+    candidate set with bm25 rather than every page sharing a common word.
+    Re-adding a URL replaces the stored page and its index entry.
+    """
+
+    def __init__(self, path: str, max_age: Optional[float] = CorpusMaxAge, min_coverage: float = CorpusMinCoverage):
+        self.path = path
+        self.max_age = max_age
+        self.min_coverage = min_coverage
+        self.stats = CorpusStats()
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL UNIQUE,
+                title TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                content BLOB NOT NULL
+            )"""
+        )
+        self._conn.execute(
+            "CREATE VIRTUAL TABLE IF NOT EXISTS pages_fts USING fts5(title, content, content='', tokenize='porter unicode61')"
+        )
+        self._conn.commit()
+
+    @staticmethod
+    def match_expressions(query: str, min_coverage: float = 1.0) -> List[str]:
+        """
+        FTS5 queries for `query`, to be run in order: pages holding every term,
+        then, if `min_coverage` is below 1, pages holding at least that fraction
+        of the terms. Terms are matched after the index's own stemming and are
+        quoted, so user text can't inject FTS syntax.
+
+        "At least k of n terms" is written as an OR of every k-term AND; it is
+        left out when that takes too many clauses, so every term is required.
+        """
+        terms = [f'"{t}"' for t in dict.fromkeys(tokenize(query))]
+        if not terms:
+            return []
+        expressions = [" AND ".join(terms)]
+        # The epsilon keeps float error (0.7 * 10 = 7.000000000000001) from requiring an extra term
+        required = min(len(terms), max(1, math.ceil(min_coverage * len(terms) - 1e-9)))
+        if required < len(terms) and math.comb(len(terms), required) <= _max_match_clauses:
+            expressions.append(" OR ".join(
+                f"({' AND '.join(group)})" if required > 1 else group[0]
+                for group in itertools.combinations(terms, required)
+            ))
+        return expressions
+
+    def add_pages(self, items: Iterable[Dict[str, Any]], fetched_at: Optional[float] = None):
+        """Store (or refresh) Firecrawl result items with markdown, in one transaction."""
+        fetched_at = fetched_at or time.time()
+        rows = [
+            (item["url"], item.get("title") or "", item["markdown"])
+            for item in items if item.get("url") and item.get("markdown")
+        ]
+        if not rows:
+            return
+        with self._lock, self._conn:
+            for url, title, markdown in rows:
+                old = self._conn.execute("SELECT id, title, content FROM pages WHERE url = ?", (url,)).fetchone()
+                if old is not None:
+                    # Contentless FTS5 rows are removed by repeating the values they were indexed with
+                    self._conn.execute(
+                        "INSERT INTO pages_fts (pages_fts, rowid, title, content) VALUES ('delete', ?, ?, ?)",
+                        (old[0], old[1], zlib.decompress(old[2]).decode("utf-8")),
+                    )
+                    self._conn.execute("DELETE FROM pages WHERE id = ?", (old[0],))
+                cursor = self._conn.execute(
+                    "INSERT INTO pages (url, title, fetched_at, content) VALUES (?, ?, ?, ?)",
+                    (url, title, fetched_at, zlib.compress(markdown.encode("utf-8"), 6)),
+                )
+                self._conn.execute(
+                    "INSERT INTO pages_fts (rowid, title, content) VALUES (?, ?, ?)",
+                    (cursor.lastrowid, title, markdown),
+                )
+            self.stats.pages_added += len(rows)
+
+    def search(self, query: str, limit: int, exclude_urls: Container[str] = (),
+               fetched_before: Optional[float] = None) -> List[Dict[str, Any]]:
+        """
+        Up to `limit` fresh pages for `query`, best first, as Firecrawl-style
+        items ({"url", "title", "markdown"}). Pages in `exclude_urls` and pages
+        fetched at or after `fetched_before` are skipped.
+        """
+        expressions = self.match_expressions(query, self.min_coverage)
+        if not expressions or limit <= 0:
+            return []
+        oldest = time.time() - self.max_age if self.max_age is not None else 0.0
+        newest = fetched_before if fetched_before is not None else float("inf")
+        hits = []
+        seen = set()
+        with self._lock:
+            self.stats.lookups += 1
+        for expression in expressions:
+            with self._lock:
+                # Over-fetch: pages this run has already seen are filtered out below
+                rows = self._conn.execute(
+                    """SELECT p.url, p.title, p.content FROM pages_fts
+                       JOIN pages p ON p.id = pages_fts.rowid
+                       WHERE pages_fts MATCH ? AND p.fetched_at >= ? AND p.fetched_at < ?
+                       ORDER BY pages_fts.rank LIMIT ?""",
+                    (expression, oldest, newest, limit * 4),
+                ).fetchall()
+            for url, title, content in rows:
+                if url in exclude_urls or url in seen:
+                    continue
+                seen.add(url)
+                hits.append({"url": url, "title": title, "markdown": zlib.decompress(content).decode("utf-8")})
+                if len(hits) >= limit:
+                    break
+            if len(hits) >= limit:
+                break
+        with self._lock:
+            self.stats.pages_served += len(hits)
+        return hits
+
+    def optimize(self):
+        """Merge the FTS5 index segments; worth running after large bulk loads."""
+        with self._lock, self._conn:
+            self._conn.execute("INSERT INTO pages_fts (pages_fts) VALUES ('optimize')")
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM pages").fetchone()[0]
+
+    def summary(self) -> str:
+        return (
+            f"Local corpus: {self.stats.pages_served} pages served over {self.stats.lookups} lookups, "
+            f"{self.stats.pages_added} pages added"
+        )
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+_corpus: Optional[CorpusIndex] = None
+
+
+def get_corpus() -> CorpusIndex:
+    """Return the process-wide corpus index."""
+    global _corpus
+    if _corpus is None:
+        _corpus = CorpusIndex(CorpusPath)
+    return _corpus
@@ -1,14 +1,23 @@
-from firecrawl import AsyncFirecrawlApp, ScrapeOptions
-from ai.providers import generate_structured_response_async, get_model, trim_prompt
-from prompts import system_prompt_func
+from firecrawl import ScrapeOptions
+from ai.providers import generate_structured_response_async, trim_prompt, trim_prompts_counted, count_tokens
+from ai.relevance import select_relevant_chunks
+from ai.tracing import set_lane, traced
+from ai.batching import BatchStats, MicroBatcher
+from ai.cleaning import get_page_cleaner
+from ai.resilience import ReportTimeout, error_label
+from search_cache import get_search_cache
+from url_registry import UrlRegistry
+from checkpoint import ResearchJournal
+from research_state import ResearchPath, ResearchStore
+from learning_index import dedupe_learnings
+from engine import get_engine
 from pydantic import BaseModel, Field
-from typing import List, Optional,Callable,  Any, Dict
+from typing import List, Optional,Callable,  Any, Dict, Union
 import math
 
-from dotenv import load_dotenv
 import asyncio
-import os 
 from dataclasses import dataclass
+import weakref
 
 
 
@@ -24,15 +33,16 @@ def strip_rich_markup(text):
 
 
 
-load_dotenv()
 #######################################################################
-ConcurrencyLimit = int(os.getenv("FIRECRAWL_CONCURRENCY", "1"))
-semaphore = asyncio.Semaphore(ConcurrencyLimit)
-
-model = get_model()
-firecrawl = AsyncFirecrawlApp(api_key=os.getenv("FIRECRAWL_API_KEY", ""))
-system_prompt = system_prompt_func()
+# Firecrawl and LLM concurrency/rate limits live in the scheduler's "search" and per-model "llm:<model>" pools (ai/scheduler.py)
+# Which model each stage uses comes from ResearchEngine.route (ai/routing.py)
+# The model, system prompt and Firecrawl app come from the current ResearchEngine (engine.py)
+# Cleaning, relevance ranking and extraction batching follow the current engine's settings (settings.py)
 #######################################################################
+
+# Most learnings extracted from one SERP query's results
+LearningsPerQuery = 3
+
 class QueryItem(BaseModel):
     query: str = Field(..., description="The SERP query")
     researchGoal: str = Field(
@@ -57,6 +67,13 @@ class FollowUpSchema(BaseModel):
         ..., 
         description="List of follow-up questions to research the topic further, max of {numFollowUpQuestions}"
     )
+
+class BatchFollowUpItem(FollowUpSchema):
+    index: int = Field(..., description="The number of the <result> these learnings and questions are for")
+
+
+class BatchFollowUpSchema(BaseModel):
+    results: List[BatchFollowUpItem] = Field(..., description="One entry per <result>")
 ####################################################################################
 
 class FinalReportSchema(BaseModel):
@@ -84,7 +101,9 @@ class ResearchResult:
     learnings: List[str]
     visitedUrls: List[str]
 ###################################################################################################
-async def generate_serp_queries(query: str, num_queries: int = 3, learnings: list[str] | None = None):
+@traced("generate_serp_queries")
+async def generate_serp_queries(query: str, num_queries: int = 3, learnings: list[str] | None = None,
+                                priority: int = 0):
     user_content = (
         f"Given the following prompt from the user, generate a list of SERP queries to "
         f"research the topic. Return a maximum of {num_queries} queries, but feel free "
@@ -93,6 +112,8 @@ async def generate_serp_queries(query: str, num_queries: int = 3, learnings: lis
     )
     
     if learnings:
+        # Paraphrased learnings from sibling branches would only repeat themselves in the prompt
+        learnings = dedupe_learnings(learnings)
         user_content += (
             "Here are some learnings from previous research; use them to generate more "
             "specific queries:\n" + "\n".join(f"- {l}" for l in learnings)
@@ -104,9 +125,10 @@ async def generate_serp_queries(query: str, num_queries: int = 3, learnings: lis
         print("user_content:", user_content)
     response = await generate_structured_response_async(
         prompt=user_content,
-        system_prompt=system_prompt,
-        model=model,
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("serp_queries"),
         format_schema=SerpSchema,
+        priority=priority,
     )
     if console:
         console.print(Text("SERP queries generated!", style="bold green"))
@@ -116,21 +138,8 @@ async def generate_serp_queries(query: str, num_queries: int = 3, learnings: lis
     return response_parsed.queries[:num_queries]  # type: ignore
 
 
-async def process_serp_result(query,result,num_learnings= 3 , num_follow_up_questions = 3):
-    contents = [
-        trim_prompt(item["markdown"], 25000)
-        for item in result.get("data", [])
-        if item.get("markdown")
-    ]
-
-    if console:
-        console.print(Panel.fit(Text(f"Ran: {query} | {len(contents)} contents found", style="bold magenta"), border_style="magenta"))
-    else:
-        print(f"Ran {query}, found {len(contents)} contents")
-    # Prepare prompt
-    content_block = "\n".join(f"<content>\n{c}\n</content>" for c in contents)
-    prompt = trim_prompt(
-        f"""Given the following contents from a SERP search for the query <query>{query}</query>, generate a list of learnings from the contents. \
+def serp_result_prompt(query: str, num_learnings: int, content_block: str) -> str:
+    return f"""Given the following contents from a SERP search for the query <query>{query}</query>, generate a list of learnings from the contents. \
 Return a maximum of {num_learnings} learnings, but feel free to return less if the contents are clear. \
 Make sure each learning is unique and not similar to each other. The learnings should be concise and to the point, \
 as detailed and information dense as possible. Make sure to include any entities like people, places, companies, \
@@ -138,20 +147,198 @@ products, things, etc in the learnings, as well as any exact metrics, numbers, o
 The learnings will be used to research the topic further.
 
 <contents>{content_block}</contents>"""
+
+
+def batch_serp_result_prompt(requests: List["ExtractionRequest"]) -> str:
+    results = "\n".join(
+        f'<result number="{i}">\n<query>{r.query}</query>\n'
+        f"<limits>at most {r.num_learnings} learnings, at most {r.num_follow_up_questions} follow-up questions</limits>\n"
+        f"<contents>{r.content_block}</contents>\n</result>"
+        for i, r in enumerate(requests, start=1)
     )
+    return f"""Each numbered <result> below holds the contents from a separate SERP search for its <query>. \
+For each result, generate a list of learnings from its contents only, and follow-up questions to research its query further, \
+staying within its <limits>. Return one entry per result, with the result's number as its index. \
+Make sure each learning is unique and not similar to each other. The learnings should be concise and to the point, \
+as detailed and information dense as possible. Make sure to include any entities like people, places, companies, \
+products, things, etc in the learnings, as well as any exact metrics, numbers, or dates. \
+The learnings will be used to research the topic further.
+
+{results}"""
+
+
+@dataclass
+class ExtractionRequest:
+    """The prepared contents of one SERP result, waiting for learning extraction."""
+    query: str
+    content_block: str
+    num_learnings: int
+    num_follow_up_questions: int
+    priority: int = 0
+
+
+async def extract_learnings(request: ExtractionRequest) -> Optional[FollowUpSchema]:
+    """The single-result extraction call."""
+    prompt = serp_result_prompt(request.query, request.num_learnings, request.content_block)
     response = await generate_structured_response_async(
         prompt=prompt,
-        system_prompt=system_prompt,
-        model=model,
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("extract"),
         format_schema=FollowUpSchema,
+        priority=request.priority,
     )
-    return response.output_parsed
+    return response.output_parsed  # type: ignore
 
 
-async def write_final_report(prompt: str, learnings: list[str], visited_urls: list[str]
-                             ):
+@traced("extract_learnings_batch")
+async def extract_learnings_batch(requests: List[ExtractionRequest]) -> List[Union[Optional[FollowUpSchema], BaseException]]:
+    """
+    Extract learnings for several small SERP results in one call, through the
+    `BatchFollowUpSchema` wrapper. Results the model skips or numbers wrongly
+    are retried one by one, and so is every result if the batched call
+    itself fails; a result whose own call fails gets that error back alone.
+    """
+    if len(requests) == 1:
+        return [await extract_learnings(requests[0])]
+    try:
+        response = await generate_structured_response_async(
+            prompt=batch_serp_result_prompt(requests),
+            system_prompt=get_engine().system_prompt,
+            model=get_engine().route("extract"),
+            format_schema=BatchFollowUpSchema,
+            priority=min(r.priority for r in requests),
+        )
+        entries = response.output_parsed.results if response.output_parsed is not None else []  # type: ignore
+    except Exception as e:
+        if console:
+            console.print(Text(f"{error_label(e)} in batched extraction of {len(requests)} results, extracting them one by one: {e}", style="bold red"))
+        else:
+            print(f"{error_label(e)} in batched extraction of {len(requests)} results, extracting them one by one: {e}")
+        entries = []
+    extracted: Dict[int, Union[Optional[FollowUpSchema], BaseException]] = {}
+    for entry in entries:
+        request = requests[entry.index - 1] if 1 <= entry.index <= len(requests) else None
+        if request is not None and entry.index not in extracted:
+            extracted[entry.index] = FollowUpSchema(
+                learnings=entry.learnings[:request.num_learnings],
+                followUpQuestions=entry.followUpQuestions[:request.num_follow_up_questions],
+            )
+    missing = [i for i in range(1, len(requests) + 1) if i not in extracted]
+    retried = await asyncio.gather(*(extract_learnings(requests[i - 1]) for i in missing), return_exceptions=True)
+    for i, parsed in zip(missing, retried):
+        extracted[i] = parsed
+    return [extracted[i] for i in range(1, len(requests) + 1)]
+
+
+# One batcher per research run, keyed by its UrlRegistry. A flush runs in the context of the submitter that opened
+# the batch, so a batcher shared by several runs (e.g. the jobs of batch.py on one engine) would apply that run's
+# deadline and token meter to the others' extractions. A run uses one engine, so a batch never mixes models or keys.
+_extraction_batchers: "weakref.WeakKeyDictionary[UrlRegistry, MicroBatcher]" = weakref.WeakKeyDictionary()
+# Totals over all of an engine's runs
+_extraction_stats: "weakref.WeakKeyDictionary[Any, BatchStats]" = weakref.WeakKeyDictionary()
+
+
+def extraction_batch_stats() -> BatchStats:
+    """Batched extraction totals of the current engine."""
+    engine = get_engine()
+    if engine not in _extraction_stats:
+        _extraction_stats[engine] = BatchStats()
+    return _extraction_stats[engine]
+
+
+def get_extraction_batcher(url_registry: UrlRegistry) -> MicroBatcher:
+    """The extraction batcher of the research run that `url_registry` belongs to."""
+    batcher = _extraction_batchers.get(url_registry)
+    if batcher is None:
+        settings = get_engine().settings
+        batcher = MicroBatcher(extract_learnings_batch, max_tokens=settings.extraction_batch_tokens,
+                               max_wait=settings.extraction_batch_wait, stats=extraction_batch_stats())
+        _extraction_batchers[url_registry] = batcher
+    return batcher
+
+
+@traced("process_serp_result")
+async def process_serp_result(query,result,num_learnings=LearningsPerQuery, num_follow_up_questions = 3,
+                              url_registry: Optional[UrlRegistry] = None, priority: int = 0,
+                              research_goal: str = ""):
+    settings = get_engine().settings
+    contents = []
+    # Token count of each entry of `contents` where the cleaning workers already know it, else None
+    lengths: List[Optional[int]] = []
+    pages = []
+    # URLs of the pages in `pages`: the ones this call claimed and sends to the model
+    page_urls = []
+    duplicates = 0
+    for item in result.get("data", []):
+        if not item.get("markdown"):
+            continue
+        url = item.get("url")
+        if url_registry is not None and url and not url_registry.claim(url):
+            # Already fed to the model by another node: point at what it produced instead
+            duplicates += 1
+            known = url_registry.learnings_for(url)
+            if known:
+                contents.append(
+                    f"Previously researched page {url}. Learnings already extracted from it:\n"
+                    + "\n".join(f"- {l}" for l in known)
+                )
+                lengths.append(None)
+            continue
+        pages.append(item["markdown"])
+        page_urls.append(url)
+    if settings.content_cleaning:
+        # Boilerplate, link and image noise would otherwise be paid for in prompt tokens
+        kept = await get_page_cleaner().clean_indexed(pages, url_registry.claim_content if url_registry is not None else None)
+        pages = [cleaned for _, cleaned, _ in kept]
+        page_urls = [page_urls[i] for i, _, _ in kept]
+        page_lengths: List[Optional[int]] = [tokens for _, _, tokens in kept]
+    else:
+        page_lengths = [None] * len(pages)
+    if settings.relevance_ranking and pages:
+        # Only scraped pages are ranked; pointers to earlier learnings are short and always kept whole
+        ranked = await asyncio.to_thread(
+            select_relevant_chunks, pages, f"{query}\n{research_goal}", settings.relevance_page_tokens, count_tokens,
+            lengths=page_lengths,
+        )
+        page_lengths = [n if new is old else None for new, old, n in zip(ranked, pages, page_lengths)]
+        pages = ranked
+    contents.extend(pages)
+    lengths.extend(page_lengths)
+
+    if console:
+        console.print(Panel.fit(Text(f"Ran: {query} | {len(contents)} contents found, {duplicates} already seen", style="bold magenta"), border_style="magenta"))
+    else:
+        print(f"Ran {query}, found {len(contents)} contents, {duplicates} already seen")
+    if not contents:
+        return FollowUpSchema(learnings=[], followUpQuestions=[])
+    # Budget all pages together in one pass: each gets at most 25k tokens and together
+    # they fill whatever the context leaves after the instructions
+    context_size = settings.context_size
+    wrapper_tokens = count_tokens("<content>\n\n</content>\n")
+    overhead = count_tokens(serp_result_prompt(query, num_learnings, "")) + len(contents) * wrapper_tokens
+    # Only pages of unknown length or over their budget are encoded, and that happens off the event loop
+    contents, lengths = await asyncio.to_thread(
+        trim_prompts_counted, contents, context_size - overhead, 25000, lengths,
+    )
+    content_block = "\n".join(f"<content>\n{c}\n</content>" for c in contents)
+    request = ExtractionRequest(query, content_block, num_learnings, num_follow_up_questions, priority)
+    # Small results share a call with other small ones; large ones keep a call to themselves
+    # Without a run to batch within, nothing is batched (see get_extraction_batcher)
+    batching = url_registry is not None and settings.extraction_batch_item_tokens > 0 and settings.extraction_batch_tokens > 0
+    tokens = sum(lengths) + len(contents) * wrapper_tokens if batching else None
+    if tokens is not None and tokens <= settings.extraction_batch_item_tokens:
+        parsed = await get_extraction_batcher(url_registry).submit(request, tokens)  # type: ignore
+    else:
+        parsed = await extract_learnings(request)
+    if url_registry is not None and parsed is not None:
+        # Only pages this call sent: pages claimed by other nodes already point at their own learnings
+        url_registry.record_learnings([url for url in page_urls if url], parsed.learnings)
+    return parsed
+
+
+def final_report_prompt(prompt: str, learnings: list[str]) -> str:
     learnings_string = "\n".join(f"<learning>\n{learning}\n</learning>" for learning in learnings)
-    full_prompt = trim_prompt(
+    return trim_prompt(
         f"""Given the following prompt from the user, write a final report on the topic using the learnings from research. 
 Make it as detailed as possible, aim for 3 or more pages, include ALL the learnings from research:
 
@@ -161,22 +348,33 @@ Here are all the learnings from previous research:
 
 <learnings>
 {learnings_string}
-</learnings>"""
+</learnings>""",
+        get_engine().settings.context_size,
     )
+
+
+def sources_section(visited_urls: list[str]) -> str:
+    return "\n\n## Sources\n\n" + "\n".join(f"- {url}" for url in visited_urls)
+
+
+@traced("write_final_report")
+async def write_final_report(prompt: str, learnings: list[str], visited_urls: list[str]
+                             ):
+    full_prompt = final_report_prompt(prompt, learnings)
     response = await generate_structured_response_async(
         prompt=full_prompt,
-        system_prompt=system_prompt,
-        model=model,
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("report"),
+        timeout=ReportTimeout,
         format_schema=FinalReportSchema,
     )
     response_parsed = response.output_parsed.reportMarkdown # type: ignore
-    urls_section = "\n\n## Sources\n\n" + "\n".join(f"- {url}" for url in visited_urls)
-    return response_parsed + urls_section  # type: ignore
+    return response_parsed + sources_section(visited_urls)  # type: ignore
 
 
-async def write_final_answer(prompt: str, learnings: list[str]):
+def final_answer_prompt(prompt: str, learnings: list[str]) -> str:
     learnings_string = "\n".join(f"<learning>\n{learning}\n</learning>" for learning in learnings)
-    full_prompt = trim_prompt(
+    return trim_prompt(
         f"""Given the following prompt from the user, write a final answer on the topic using the learnings from research. 
 Follow the format specified in the prompt. Do not yap or babble or include any other text than the answer besides the format specified in the prompt. 
 Keep the answer as concise as possible - usually it should be just a few words or maximum a sentence. 
@@ -189,12 +387,17 @@ Here are all the learnings from research on the topic that you can use to help a
 
 <learnings>
 {learnings_string}
-</learnings>"""
+</learnings>""",
+        get_engine().settings.context_size,
     )
+
+
+@traced("write_final_answer")
+async def write_final_answer(prompt: str, learnings: list[str]):
     response = await generate_structured_response_async(
-        prompt=full_prompt,
-        system_prompt=system_prompt,
-        model=model,
+        prompt=final_answer_prompt(prompt, learnings),
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("answer"),
         format_schema=FinalAnswerSchema,
     )
     response_parsed = response.output_parsed.exactAnswer  # type: ignore
@@ -203,18 +406,38 @@ Here are all the learnings from research on the topic that you can use to help a
 def report_progress(
     update: Dict[str, Any], 
     progress: 'ResearchProgress', 
-    on_progress: Optional[Callable[['ResearchProgress'], None]] = None
+    on_progress: Optional[Callable[['ResearchProgress'], None]] = None,
+    journal: Optional[ResearchJournal] = None
 ):
     for key, value in update.items():
         setattr(progress, key, value)
+    if journal:
+        journal.record_progress(progress)
     if on_progress:
         on_progress(progress)
 
 
 async def deep_research(query: str,breadth:int, depth:int,learnings: Optional[List[str]] = None,
-    visited_urls: Optional[List[str]] = None,on_progress:  Optional[Callable[[ResearchProgress], None]] = None):
-    learnings = learnings or []
-    visited_urls = visited_urls or []
+    visited_urls: Optional[List[str]] = None,on_progress:  Optional[Callable[[ResearchProgress], None]] = None,
+    url_registry: Optional[UrlRegistry] = None, journal: Optional[ResearchJournal] = None,
+    path: Optional[ResearchPath] = None, store: Optional[ResearchStore] = None) -> Optional[ResearchResult]:
+    """
+    Recursively research `query`.
+
+    The root call creates one ResearchStore for the whole tree (or uses the
+    caller's `store`, to watch learnings as they arrive) and returns its
+    contents, in the order they were found. Recursive calls receive the
+    `path` of learnings and URLs gathered above them, add to the shared store
+    and return None.
+    """
+    # The root call owns the registry and store that every branch of the tree shares
+    owns_registry = url_registry is None
+    if url_registry is None:
+        url_registry = UrlRegistry()
+    owns_store = path is None
+    if path is None:
+        path = ResearchPath(store if store is not None else ResearchStore()).child(learnings or [], visited_urls or [])
+    store = path.store
     progress = ResearchProgress(
         currentDepth=depth,
         totalDepth=depth,
@@ -227,18 +450,26 @@ async def deep_research(query: str,breadth:int, depth:int,learnings: Optional[Li
         console.print(Panel.fit(Text(f"Generating SERP queries for: {query}", style="bold cyan"), border_style="cyan"))
     else:
         print("generating SERP queries...")
-    serp_queries = await generate_serp_queries(
-    query=query,
-    learnings=learnings,
-    num_queries=breadth
-)
+    node = ResearchJournal.node_key(query, breadth, depth)
+    journaled_queries = journal.serp_queries(node) if journal else None
+    if journaled_queries is not None:
+        serp_queries = [QueryItem(**q) for q in journaled_queries]
+    else:
+        serp_queries = await generate_serp_queries(
+        query=query,
+        learnings=path.learnings(),
+        num_queries=breadth,
+        priority=-depth
+    )
+        if journal:
+            journal.record_serp_queries(node, [q.model_dump() for q in serp_queries])
     
     if not serp_queries:
         if console:
             console.print(Text("No SERP queries generated, returning current state", style="bold red"))
         else:
             print("No SERP queries generated, returning current state")
-        return ResearchResult(learnings=learnings, visitedUrls=visited_urls)
+        return ResearchResult(learnings=store.learnings, visitedUrls=store.urls) if owns_store else None
     
     report_progress(
     {
@@ -250,34 +481,54 @@ async def deep_research(query: str,breadth:int, depth:int,learnings: Optional[Li
 )   
     async def limited_deep_query(
         serp_query,
-        semaphore,
         breadth,
         depth,
-        learnings,
-        visited_urls,
+        path,
         progress,
         on_progress):
+        # Each node runs in its own task: label its spans with its SERP query
+        set_lane(serp_query.query)
         try:
-            # Initialize variables that might be used outside semaphore context
+            # Shallow nodes (more depth remaining) are scheduled ahead of deep ones
+            priority = -depth
             new_breadth = math.ceil(breadth / 2)
             new_depth = depth - 1
             next_query = ""
-            all_learnings = learnings
-            all_urls = visited_urls
             
-            async with semaphore:
+            stored = journal.node_result(node, serp_query.query) if journal else None
+            if stored is not None:
+                # Completed in an earlier run: replay it without calling Firecrawl or the LLM
                 if console:
-                    console.print(Panel.fit(Text(f"Searching with Firecrawl: {serp_query.query}", style="bold blue"), border_style="blue"))
+                    console.print(Text(f"Resuming from journal: {serp_query.query}", style="bold cyan"))
                 else:
-                    print(f"searching with firecrawl for: {serp_query.query}")
-                result = await firecrawl.search(
-                    query=serp_query.query,
-                    limit=5,
-                    scrape_options=ScrapeOptions(formats=["markdown"]),
-                    timeout=15000
+                    print(f"resuming from journal: {serp_query.query}")
+                new_urls = stored["result"]["visitedUrls"]
+                new_learnings = FollowUpSchema(
+                    learnings=stored["result"]["learnings"],
+                    followUpQuestions=stored["followUpQuestions"],
                 )
+                url_registry.record_learnings(new_urls, new_learnings.learnings)
+            else:
+                result = journal.search_result(node, serp_query.query) if journal else None
+                if result is None:
+                    if console:
+                        console.print(Panel.fit(Text(f"Searching with Firecrawl: {serp_query.query}", style="bold blue"), border_style="blue"))
+                    else:
+                        print(f"searching with firecrawl for: {serp_query.query}")
+                    result = await get_search_cache().search(
+                        get_engine().firecrawl,
+                        query=serp_query.query,
+                        limit=5,
+                        scrape_options=ScrapeOptions(formats=["markdown"]),
+                        timeout=15000,
+                        priority=priority,
+                        url_registry=url_registry,
+                    )
+                    if journal:
+                        journal.record_search_result(node, serp_query.query, result)  # type: ignore
                 new_urls = [item['url'] for item in result["data"] if item.get('url')] # type: ignore
-                
+
+                # The search slot is already released; extraction only holds an LLM slot
                 if console:
                     console.print(Text("Processing SERP result...", style="bold green"))
                 else:
@@ -286,44 +537,56 @@ async def deep_research(query: str,breadth:int, depth:int,learnings: Optional[Li
                     query=serp_query.query,
                     result=result,
                     num_follow_up_questions=new_breadth,
+                    url_registry=url_registry,
+                    priority=priority,
+                    research_goal=serp_query.researchGoal,
                 )
-                all_learnings = learnings + new_learnings.learnings # type: ignore
-                all_urls = visited_urls + new_urls
-                
-                # Prepare data for potential recursive call
-                if new_depth > 0:
-                    if console:
-                        console.print(Text(f"Researching deeper... Breadth: {new_breadth} Depth: {new_depth}", style="bold yellow"))
-                    else:
-                        print(f"Researching deeper, breadth: {new_breadth}, depth: {new_depth}")
-                    report_progress(
-                        {
-                            "currentDepth": new_depth,
-                            "currentBreadth": new_breadth,
-                            "completedQueries": progress.completedQueries + 1,
-                            "currentQuery": serp_query.query,
-                        },
-                        progress=progress,
-                        on_progress=on_progress
+                if journal:
+                    journal.record_node_result(
+                        node,
+                        serp_query.query,
+                        ResearchResult(learnings=new_learnings.learnings, visitedUrls=new_urls),  # type: ignore
+                        new_learnings.followUpQuestions,  # type: ignore
                     )
-                    next_query = (
-                        f"Previous research goal: {serp_query.researchGoal}\n"
-                        f"Follow-up research directions: {', '.join(new_learnings.followUpQuestions)}" # type: ignore
-                    ).strip()
-                    if console:
-                        console.print(Panel.fit(Text(f"Next query: {next_query}", style="bold magenta"), border_style="magenta"))
-                    else:
-                        print(f"Next query: {next_query}")
+            # Intern this node's findings; children reference them through the path
+            child_path = path.child(new_learnings.learnings, new_urls, source=serp_query.query) # type: ignore
             
-            # Make recursive call outside of semaphore context
+            # Prepare data for potential recursive call
             if new_depth > 0:
-                return await deep_research(
+                if console:
+                    console.print(Text(f"Researching deeper... Breadth: {new_breadth} Depth: {new_depth}", style="bold yellow"))
+                else:
+                    print(f"Researching deeper, breadth: {new_breadth}, depth: {new_depth}")
+                report_progress(
+                    {
+                        "currentDepth": new_depth,
+                        "currentBreadth": new_breadth,
+                        "completedQueries": progress.completedQueries + 1,
+                        "currentQuery": serp_query.query,
+                    },
+                    progress=progress,
+                    on_progress=on_progress,
+                    journal=journal
+                )
+                next_query = (
+                    f"Previous research goal: {serp_query.researchGoal}\n"
+                    f"Follow-up research directions: {', '.join(new_learnings.followUpQuestions)}" # type: ignore
+                ).strip()
+                if console:
+                    console.print(Panel.fit(Text(f"Next query: {next_query}", style="bold magenta"), border_style="magenta"))
+                else:
+                    print(f"Next query: {next_query}")
+            
+            # Make recursive call
+            if new_depth > 0:
+                await deep_research(
                     query=next_query,
                     breadth=new_breadth,
                     depth=new_depth,
-                    learnings=all_learnings,
-                    visited_urls=all_urls,
                     on_progress=on_progress,
+                    url_registry=url_registry,
+                    journal=journal,
+                    path=child_path,
                 )
             else:
                 report_progress(
@@ -333,38 +596,39 @@ async def deep_research(query: str,breadth:int, depth:int,learnings: Optional[Li
                         "currentQuery": serp_query.query,
                     },
                     progress=progress,
-                    on_progress=on_progress
+                    on_progress=on_progress,
+                    journal=journal
                 )
-                return ResearchResult(learnings=all_learnings, visitedUrls=all_urls)
         
         except Exception as e:
-            if "Timeout" in str(e):
-                if console:
-                    console.print(Text(f"Timeout error running query: {serp_query.query}: {e}", style="bold red"))
-                else:
-                    print(f"Timeout error running query: {serp_query.query}: {e}")
+            # Retryable failures were already retried by the resilience layer (ai/resilience.py); this branch is dropped
+            if console:
+                console.print(Text(f"{error_label(e)} running query: {serp_query.query}: {e}", style="bold red"))
             else:
-                if console:
-                    console.print(Text(f"Error running query: {serp_query.query}: {e}", style="bold red"))
-                else:
-                    print(f"Error running query: {serp_query.query}: {e}")
-            return ResearchResult(learnings=learnings, visitedUrls=visited_urls)
+                print(f"{error_label(e)} running query: {serp_query.query}: {e}")
     
     tasks = [
         limited_deep_query(
             serp_query,
-            semaphore,
             breadth=breadth,
             depth=depth,
-            learnings=learnings,
-            visited_urls=visited_urls,
+            path=path,
             progress=progress,
             on_progress=on_progress
         )
         for serp_query in serp_queries
     ]
-    results = await asyncio.gather(*tasks)
-    return ResearchResult(
-        learnings=list(set(l for r in results for l in r.learnings)),
-        visitedUrls=list(set(u for r in results for u in r.visitedUrls))
-    )
\ No newline at end of file
+    await asyncio.gather(*tasks)
+    if owns_registry:
+        if console:
+            console.print(Text(f"Skipped {url_registry.duplicates_avoided} already-seen pages across {len(url_registry)} unique URLs", style="bold cyan"))
+        else:
+            print(f"Skipped {url_registry.duplicates_avoided} already-seen pages across {len(url_registry)} unique URLs")
+    if not owns_store:
+        return None
+    if console:
+        console.print(Text(f"Merged {store.duplicates_merged} near-duplicate learnings into {len(store)} unique ones", style="bold cyan"))
+    else:
+        print(f"Merged {store.duplicates_merged} near-duplicate learnings into {len(store)} unique ones")
+    # Every branch wrote into the same store: the merged result is its contents, in discovery order
+    return ResearchResult(learnings=store.learnings, visitedUrls=store.urls)
\ No newline at end of file
@@ -0,0 +1,128 @@
+from deep_research import ResearchProgress, ResearchResult, final_answer_prompt, write_final_answer
+from ai.providers import generate_structured_response_async
+from ai.resilience import error_label
+from ai.tracing import traced
+from engine import get_engine
+from research_state import ResearchStore
+from pydantic import BaseModel, Field
+from typing import Awaitable, Callable, List, Optional
+from dataclasses import dataclass, field
+import deep_research
+import asyncio
+import re
+
+from rich.text import Text
+
+
+class AnswerCheckSchema(BaseModel):
+    exactAnswer: str = Field(
+        ...,
+        description="The final answer, make it short and concise, just the answer, no other text"
+    )
+    confidence: float = Field(
+        ...,
+        description="How certain the learnings make this answer, from 0 (a guess) to 1 (stated directly and consistently)"
+    )
+
+
+@dataclass
+class AnswerResult:
+    answer: str
+    learnings: List[str]
+    visitedUrls: List[str]
+    # True when research was stopped because the answer converged
+    converged: bool = False
+    checks: List[AnswerCheckSchema] = field(default_factory=list)
+
+
+_answer_noise = re.compile(r"[^\w.%$€£-]+")
+
+
+def normalize_answer(answer: str) -> str:
+    return _answer_noise.sub(" ", answer.lower()).strip(" .")
+
+
+def answers_agree(checks: List[AnswerCheckSchema], min_confidence: float) -> bool:
+    """Whether every check gives the same (normalized) answer with at least `min_confidence`."""
+    answers = {normalize_answer(c.exactAnswer) for c in checks}
+    return len(answers) == 1 and "" not in answers and all(c.confidence >= min_confidence for c in checks)
+
+
+@traced("answer.check")
+async def check_answer(prompt: str, learnings: List[str]) -> AnswerCheckSchema:
+    """The answer the learnings so far support, and how confident the model is in it."""
+    response = await generate_structured_response_async(
+        prompt=final_answer_prompt(prompt, learnings)
+        + "\n\nAlso rate your confidence that the learnings above establish this answer. "
+        "Give a low confidence if they are incomplete, indirect or contradictory.",
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("answer_check"),
+        format_schema=AnswerCheckSchema,
+        # Ahead of every research node (their priorities are -depth): a converged answer cancels them
+        priority=-1000,
+    )
+    return response.output_parsed  # type: ignore
+
+
+async def research_answer(research: Callable[[ResearchStore, Callable[[ResearchProgress], None]], Awaitable[ResearchResult]],
+                          prompt: str, breadth: int, check_every: Optional[int] = None,
+                          agreement: Optional[int] = None, min_confidence: Optional[float] = None) -> AnswerResult:
+    """
+    Answer `prompt` while researching it, and stop researching once the answer
+    has converged.
+
+    `research(store, on_progress)` starts any of the research modes on the
+    given store. Every `check_every` new learnings (default: the engine's
+    `answer_check_learnings`, else the most the first tree level can yield:
+    `breadth` queries of up to `LearningsPerQuery` learnings each), the
+    learnings so far are given to a cheap answer check. When the
+    last `agreement` checks give the same answer with at least
+    `min_confidence`, the outstanding branches are cancelled and that answer
+    is returned without a final answer call. If the tree finishes first, the
+    answer is written from all the learnings as usual. `agreement` and
+    `min_confidence` default to the engine's settings.
+    """
+    console = deep_research.console
+    settings = get_engine().settings
+    check_every = check_every or settings.answer_check_learnings or breadth * deep_research.LearningsPerQuery
+    agreement = agreement or settings.answer_agreement
+    min_confidence = settings.answer_confidence if min_confidence is None else min_confidence
+    store = ResearchStore()
+    grown = asyncio.Event()
+    task = asyncio.ensure_future(research(store, lambda progress: grown.set()))
+    checks: List[AnswerCheckSchema] = []
+    checked = 0
+    converged = False
+    try:
+        while not task.done():
+            waiter = asyncio.ensure_future(grown.wait())
+            await asyncio.wait({task, waiter}, return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            grown.clear()
+            if task.done() or len(store) - checked < check_every:
+                continue
+            checked = len(store)
+            try:
+                check = await check_answer(prompt, store.learnings)
+            except Exception as e:
+                # The check is optional: research goes on and the next batch of learnings is checked again
+                console.print(Text(f"{error_label(e)} checking the answer: {e}", style="bold red"))
+                continue
+            if check is None:
+                continue
+            checks.append(check)
+            console.print(Text(f"Answer check after {checked} learnings: {check.exactAnswer} (confidence {check.confidence:.2f})", style="bold yellow"))
+            if len(checks) >= agreement and answers_agree(checks[-agreement:], min_confidence):
+                converged = True
+                console.print(Text("Answer converged; cancelling the remaining research", style="bold green"))
+                break
+    finally:
+        if not task.done():
+            task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+    if not converged:
+        # Surface a failure of the research itself
+        task.result()
+    learnings = store.learnings
+    answer = checks[-1].exactAnswer if converged else await write_final_answer(prompt=prompt, learnings=learnings)
+    return AnswerResult(answer=answer, learnings=learnings, visitedUrls=store.urls, converged=converged, checks=checks)
@@ -0,0 +1,196 @@
+from ai.providers import close_async_client, get_model, new_async_client, use_async_client
+from ai.routing import DefaultRoutes, Stages, env_routes
+from prompts import system_prompt_func
+from settings import ResearchSettings
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Union
+import os
+
+
+class ResearchEngine:
+    """
+    Owns the resources a research job needs: the Firecrawl app, the OpenAI
+    client, the model name and the system prompt.
+
+    Nothing is created until it is first used, so importing and constructing
+    an engine is cheap. One engine can serve many concurrent research jobs in
+    a process, and several engines with different keys or models can run side
+    by side: `activate()` makes an engine current for the calling task and
+    every task it spawns, and the research code looks its resources up with
+    `get_engine()`.
+
+        async with ResearchEngine(model="gpt-4.1-mini") as engine:
+            result = await engine.research("...", breadth=4, depth=2)
+            report = await engine.report("...", result.learnings, result.visitedUrls)
+
+    Each stage of the pipeline asks `route(stage)` for its models: a primary
+    model plus fallbacks for when it is rate-limited or times out. Routes come
+    from `models`, then the MODEL_<STAGE> variables, and then, unless a single
+    `model` was given for everything, from `ai.routing.DefaultRoutes`.
+
+    `settings` (a `settings.ResearchSettings`) holds the knobs of the research
+    itself: cleaning, relevance ranking, extraction batching, the corpus, the
+    report mode and early answers. Without them, the engine reads them from the
+    environment when first needed.
+
+    Without an explicit engine, a process-wide default configured from the
+    environment is used.
+    """
+
+    def __init__(self, model: Optional[str] = None, firecrawl_api_key: Optional[str] = None,
+                 openai_api_key: Optional[str] = None, system_prompt: Optional[str] = None,
+                 firecrawl: Any = None, openai_client: Any = None,
+                 models: Optional[Dict[str, Union[str, Sequence[str]]]] = None,
+                 settings: Optional[ResearchSettings] = None):
+        unknown = set(models or {}) - set(Stages)
+        if unknown:
+            raise ValueError(f"Unknown stages in models: {', '.join(sorted(unknown))}; expected some of {', '.join(Stages)}")
+        self._model = model
+        # An explicit model replaces the built-in routes for every stage
+        self._single_model = model is not None
+        self._routes = {stage: [route] if isinstance(route, str) else list(route) for stage, route in (models or {}).items()}
+        self._routes_from_env = env_routes()
+        self._firecrawl_api_key = firecrawl_api_key
+        self._openai_api_key = openai_api_key
+        self._system_prompt = system_prompt
+        self._settings = settings
+        # Injected resources (e.g. the offline fakes in benchmarks/) are used as-is and never closed here
+        self._firecrawl = firecrawl
+        self._openai_client = openai_client
+        self._owns_openai_client = False
+
+    @property
+    def model(self) -> str:
+        if self._model is None:
+            self._model = get_model()
+        return self._model
+
+    @property
+    def settings(self) -> ResearchSettings:
+        if self._settings is None:
+            self._settings = ResearchSettings.from_env()
+        return self._settings
+
+    def route(self, stage: str) -> List[str]:
+        """The models to try, in order, for calls made by `stage` (one of `ai.routing.Stages`)."""
+        if stage in self._routes:
+            return self._routes[stage]
+        if stage in self._routes_from_env:
+            return self._routes_from_env[stage]
+        if not self._single_model and stage in DefaultRoutes:
+            return DefaultRoutes[stage]
+        return [self.model]
+
+    def describe_routes(self) -> str:
+        return "; ".join(f"{stage}: {' > '.join(self.route(stage))}" for stage in Stages)
+
+    @property
+    def system_prompt(self) -> str:
+        if self._system_prompt is None:
+            self._system_prompt = system_prompt_func()
+        return self._system_prompt
+
+    @property
+    def firecrawl(self):
+        if self._firecrawl is None:
+            from firecrawl import AsyncFirecrawlApp
+            self._firecrawl = AsyncFirecrawlApp(api_key=self._firecrawl_api_key or os.getenv("FIRECRAWL_API_KEY", ""))
+        return self._firecrawl
+
+    @property
+    def openai_client(self):
+        """The engine's own OpenAI client, or None to use the process-wide shared one."""
+        if self._openai_client is None and self._openai_api_key:
+            self._openai_client = new_async_client(api_key=self._openai_api_key)
+            self._owns_openai_client = True
+        return self._openai_client
+
+    @contextmanager
+    def activate(self):
+        """Make this engine current for the calling task and the tasks it creates."""
+        token = _current_engine.set(self)
+        try:
+            with use_async_client(self.openai_client):
+                yield self
+        finally:
+            _current_engine.reset(token)
+
+    # The research modules import this one, so they are imported on first use
+    # rather than at the top; that also keeps `import engine` fast.
+
+    async def research(self, query: str, breadth: int, depth: int, pipelined: bool = False,
+                       budget: Any = None, **kwargs):
+        """
+        Run `deep_research` (or `deep_research_pipelined`) and return its ResearchResult.
+        With a `planner.ResearchBudget`, run `deep_research_budgeted` under it instead.
+        """
+        from deep_research import deep_research
+        from pipeline import deep_research_pipelined
+        from planner import deep_research_budgeted
+        with self.activate():
+            if budget is not None:
+                return await deep_research_budgeted(query=query, breadth=breadth, depth=depth, budget=budget, **kwargs)
+            research = deep_research_pipelined if pipelined else deep_research
+            return await research(query=query, breadth=breadth, depth=depth, **kwargs)
+
+    async def research_answer(self, query: str, breadth: int, depth: int, pipelined: bool = False,
+                              budget: Any = None, **kwargs):
+        """
+        Research `query` like `research` while checking the answer as learnings
+        arrive, and stop early once it converges. Returns an `early_answer.AnswerResult`.
+        """
+        from early_answer import research_answer
+
+        def research(store, on_progress):
+            return self.research(query, breadth, depth, pipelined=pipelined, budget=budget,
+                                 store=store, on_progress=on_progress, **kwargs)
+
+        with self.activate():
+            return await research_answer(research, query, breadth)
+
+    async def report(self, query: str, learnings: List[str], visited_urls: List[str]) -> str:
+        from report import write_report
+        with self.activate():
+            return await write_report(query, learnings, visited_urls)
+
+    async def answer(self, query: str, learnings: List[str]) -> str:
+        from deep_research import write_final_answer
+        with self.activate():
+            return await write_final_answer(prompt=query, learnings=learnings)
+
+    async def feedback(self, query: str, num_questions: int = 3) -> List[str]:
+        from feedback import generate_feedback
+        with self.activate():
+            return await generate_feedback(query=query, num_questions=num_questions)
+
+    async def close(self):
+        """Release the connections this engine opened. The default engine also closes the shared client."""
+        if self._owns_openai_client and self._openai_client is not None:
+            await self._openai_client.close()
+            self._openai_client = None
+            self._owns_openai_client = False
+        if self is _default_engine:
+            await close_async_client()
+
+    async def __aenter__(self) -> "ResearchEngine":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+        return False
+
+
+_current_engine: ContextVar[Optional[ResearchEngine]] = ContextVar("current_engine", default=None)
+_default_engine: Optional[ResearchEngine] = None
+
+
+def get_engine() -> ResearchEngine:
+    """The engine activated in this context, else the process-wide default."""
+    global _default_engine
+    engine = _current_engine.get()
+    if engine is not None:
+        return engine
+    if _default_engine is None:
+        _default_engine = ResearchEngine()
+    return _default_engine
@@ -1,9 +1,7 @@
-from prompts import system_prompt_func
-from ai.providers import get_model, generate_structured_response_async
+from ai.providers import generate_structured_response_async
+from engine import get_engine
 from typing import List
 from pydantic import BaseModel, Field
-system_prompt = system_prompt_func()
-model = get_model()  
 # 1. Define the Pydantic schema (equivalent to the Zod schema)
 class FeedbackSchema(BaseModel):
     """Defines the structure for the follow-up questions."""
@@ -31,8 +29,8 @@ async def generate_feedback(query: str, num_questions: int = 3) -> List[str]:
 
     response = await generate_structured_response_async(
         prompt=prompt,
-        system_prompt=system_prompt,
-        model=model,
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("feedback"),
         format_schema=FeedbackSchema
     )
 
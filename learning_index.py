@@ -0,0 +1,147 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+import hashlib
+import os
+import random
+import re
+
+
+#######################################################################
+# Word-shingle Jaccard similarity at or above which two learnings are treated as the same fact
+LearningDedupThreshold = float(os.getenv("LEARNING_DEDUP_THRESHOLD", "0.6"))
+#######################################################################
+
+_word_pattern = re.compile(r"\w+", re.UNICODE)
+_number_pattern = re.compile(r"\d")
+_prime = (1 << 61) - 1
+
+
+def _words(text: str) -> List[str]:
+    return _word_pattern.findall(text.lower())
+
+
+def shingles(text: str, size: int = 2) -> Set[str]:
+    words = _words(text)
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def numbers(text: str) -> Set[str]:
+    """Numeric tokens of a learning: paraphrases share them, different facts usually don't."""
+    return {w for w in _words(text) if _number_pattern.search(w)}
+
+
+def jaccard(a: Set[str], b: Set[str]) -> float:
+    if not a and not b:
+        return 1.0
+    return len(a & b) / len(a | b)
+
+
+class LearningIndex:
+    """
+    Incremental near-duplicate index over learnings.
+
+    Each learning is reduced to a MinHash signature of its word bigrams, and
+    the signature is split into LSH bands, so `add` only compares a new
+    learning with the few earlier ones that collide with it in some band.
+    Candidates are confirmed with the exact Jaccard similarity of their
+    shingle sets and must mention the same numbers, so "revenue was $5B in
+    2022" never absorbs "revenue was $6B in 2023".
+
+    Every learning resolves to a canonical id (the first variant seen), and
+    each canonical learning keeps the sources of all its duplicates.
+    """
+
+    def __init__(self, threshold: float = LearningDedupThreshold, num_perm: int = 64, bands: int = 16, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be a multiple of bands")
+        self.threshold = threshold
+        self.bands = bands
+        self.rows = num_perm // bands
+        rng = random.Random(seed)
+        self._permutations = [(rng.randrange(1, _prime), rng.randrange(0, _prime)) for _ in range(num_perm)]
+        self._buckets: List[Dict[Tuple[int, ...], List[int]]] = [{} for _ in range(bands)]
+        self._ids: Dict[str, int] = {}
+        self._shingles: List[Set[str]] = []
+        self._numbers: List[Set[str]] = []
+        self._sources: List[List[str]] = []
+        # Paraphrases folded into an earlier learning (exact repeats are not counted)
+        self.duplicates_merged = 0
+
+    @staticmethod
+    def _hash(shingle: str) -> int:
+        return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def _signature(self, shingle_set: Set[str]) -> List[int]:
+        hashes = [self._hash(s) for s in shingle_set] or [0]
+        return [min((a * h + b) % _prime for h in hashes) for a, b in self._permutations]
+
+    def _band_keys(self, signature: List[int]) -> List[Tuple[int, ...]]:
+        return [tuple(signature[i * self.rows:(i + 1) * self.rows]) for i in range(self.bands)]
+
+    def find(self, learning: str) -> Optional[int]:
+        """Canonical id of an exact or near duplicate of `learning`, if one was added."""
+        existing = self._ids.get(learning)
+        if existing is not None:
+            return existing
+        shingle_set = shingles(learning)
+        return self._match(shingle_set, numbers(learning), self._band_keys(self._signature(shingle_set)))
+
+    def _match(self, shingle_set: Set[str], number_set: Set[str], band_keys: List[Tuple[int, ...]]) -> Optional[int]:
+        best, best_score = None, self.threshold
+        seen = set()
+        for band, key in enumerate(band_keys):
+            for candidate in self._buckets[band].get(key, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                if self._numbers[candidate] != number_set:
+                    continue
+                score = jaccard(shingle_set, self._shingles[candidate])
+                if score >= best_score:
+                    best, best_score = candidate, score
+        return best
+
+    def add(self, learning: str, source: Optional[str] = None) -> Tuple[int, bool]:
+        """
+        Add a learning and return (canonical id, is_new). A duplicate is merged
+        into the learning it matches, recording `source` as extra provenance.
+        """
+        existing = self._ids.get(learning)
+        if existing is None:
+            shingle_set = shingles(learning)
+            number_set = numbers(learning)
+            band_keys = self._band_keys(self._signature(shingle_set))
+            existing = self._match(shingle_set, number_set, band_keys)
+            if existing is None:
+                learning_id = len(self._shingles)
+                self._ids[learning] = learning_id
+                self._shingles.append(shingle_set)
+                self._numbers.append(number_set)
+                self._sources.append([source] if source is not None else [])
+                for band, key in enumerate(band_keys):
+                    self._buckets[band].setdefault(key, []).append(learning_id)
+                return learning_id, True
+            # Remember the paraphrase so the next exact repeat is a dict lookup
+            self._ids[learning] = existing
+            self.duplicates_merged += 1
+        if source is not None and source not in self._sources[existing]:
+            self._sources[existing].append(source)
+        return existing, False
+
+    def sources(self, learning_id: int) -> List[str]:
+        return list(self._sources[learning_id])
+
+    def __len__(self) -> int:
+        return len(self._shingles)
+
+
+def dedupe_learnings(learnings: Iterable[str], threshold: float = LearningDedupThreshold) -> List[str]:
+    """Drop exact and near-duplicate learnings, keeping the first of each group in order."""
+    index = LearningIndex(threshold=threshold)
+    kept = []
+    for learning in learnings:
+        _, is_new = index.add(learning)
+        if is_new:
+            kept.append(learning)
+    return kept
@@ -0,0 +1,231 @@
+from deep_research import (
+    QueryItem, ResearchProgress, ResearchResult, report_progress,
+    generate_serp_queries, process_serp_result,
+)
+from ai.scheduler import get_scheduler
+from ai.tracing import set_lane
+from engine import get_engine
+from search_cache import get_search_cache
+from url_registry import UrlRegistry
+from checkpoint import ResearchJournal
+from research_state import ResearchPath, ResearchStore
+from firecrawl import ScrapeOptions
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+from dataclasses import dataclass
+import deep_research
+import asyncio
+import math
+
+from rich.panel import Panel
+from rich.text import Text
+
+
+@dataclass
+class _Node:
+    """A research question waiting to be expanded into SERP queries."""
+    query: str
+    breadth: int
+    depth: int
+    path: ResearchPath
+
+
+@dataclass
+class _SearchJob:
+    serp_query: QueryItem
+    node: _Node
+
+
+@dataclass
+class _ExtractJob:
+    job: _SearchJob
+    result: Dict[str, Any]
+    new_urls: List[str]
+
+
+async def deep_research_pipelined(query: str, breadth: int, depth: int, learnings: Optional[List[str]] = None,
+    visited_urls: Optional[List[str]] = None, on_progress: Optional[Callable[[ResearchProgress], None]] = None,
+    url_registry: Optional[UrlRegistry] = None, journal: Optional[ResearchJournal] = None,
+    queue_size: Optional[int] = None, store: Optional[ResearchStore] = None) -> ResearchResult:
+    """
+    Producer/consumer variant of `deep_research`.
+
+    Three stages run concurrently across the whole tree, connected by queues:
+    query generation turns nodes into SERP queries, search turns SERP queries
+    into Firecrawl results, and extraction turns results into learnings and
+    child nodes. Each stage keeps its own backend busy, so a branch waiting on
+    the LLM never holds up searches for other branches. The search and
+    extraction queues are bounded; the feedback edge from extraction back to
+    query generation is not, so the cycle cannot deadlock.
+
+    Produces the same ResearchResult as `deep_research` for the same inputs,
+    and reads and writes the same journal entries. Like `deep_research`, it
+    fills the caller's `store` if one is given.
+    """
+    console = deep_research.console
+    scheduler = get_scheduler()
+    search_workers = scheduler.pool("search").concurrency
+    llm_workers = scheduler.llm_concurrency
+    queue_size = queue_size or max(search_workers, llm_workers) * 2
+    url_registry = url_registry or UrlRegistry()
+
+    plan_queue: asyncio.Queue = asyncio.Queue()
+    search_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    extract_queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+    store = store if store is not None else ResearchStore()
+    # Work items queued or in progress anywhere in the pipeline; the run is over when it reaches zero
+    pending = 1
+    finished = asyncio.Event()
+    progress = ResearchProgress(
+        currentDepth=depth,
+        totalDepth=depth,
+        currentBreadth=breadth,
+        totalBreadth=breadth,
+        totalQueries=0,
+        completedQueries=0,
+    )
+
+    def settle():
+        nonlocal pending
+        pending -= 1
+        if pending == 0:
+            finished.set()
+
+    async def plan(node: _Node):
+        nonlocal pending
+        set_lane(node.query)
+        key = ResearchJournal.node_key(node.query, node.breadth, node.depth)
+        journaled_queries = journal.serp_queries(key) if journal else None
+        try:
+            if journaled_queries is not None:
+                serp_queries = [QueryItem(**q) for q in journaled_queries]
+            else:
+                serp_queries = await generate_serp_queries(
+                    query=node.query,
+                    learnings=node.path.learnings(),
+                    num_queries=node.breadth,
+                    priority=-node.depth,
+                )
+                if journal:
+                    journal.record_serp_queries(key, [q.model_dump() for q in serp_queries])
+        except Exception as e:
+            console.print(Text(f"Error generating SERP queries: {e}", style="bold red"))
+            serp_queries = []
+        if not serp_queries:
+            settle()
+            return
+        report_progress({"totalQueries": progress.totalQueries + len(serp_queries)}, progress=progress, on_progress=on_progress)
+        pending += len(serp_queries) - 1
+        for serp_query in serp_queries:
+            await search_queue.put(_SearchJob(serp_query=serp_query, node=node))
+
+    async def search(job: _SearchJob):
+        set_lane(job.serp_query.query)
+        key = ResearchJournal.node_key(job.node.query, job.node.breadth, job.node.depth)
+        stored = journal.node_result(key, job.serp_query.query) if journal else None
+        if stored is not None:
+            # Completed in an earlier run: skip both search and extraction
+            console.print(Text(f"Resuming from journal: {job.serp_query.query}", style="bold cyan"))
+            url_registry.record_learnings(stored["result"]["visitedUrls"], stored["result"]["learnings"])
+            advance(job, stored["result"]["learnings"], stored["followUpQuestions"], stored["result"]["visitedUrls"])
+            return
+        result = journal.search_result(key, job.serp_query.query) if journal else None
+        if result is None:
+            console.print(Panel.fit(Text(f"Searching with Firecrawl: {job.serp_query.query}", style="bold blue"), border_style="blue"))
+            result = await get_search_cache().search(
+                get_engine().firecrawl,
+                query=job.serp_query.query,
+                limit=5,
+                scrape_options=ScrapeOptions(formats=["markdown"]),
+                timeout=15000,
+                priority=-job.node.depth,
+                url_registry=url_registry,
+            )
+            if journal:
+                journal.record_search_result(key, job.serp_query.query, result)
+        new_urls = [item['url'] for item in result["data"] if item.get('url')]
+        await extract_queue.put(_ExtractJob(job=job, result=result, new_urls=new_urls))
+
+    def advance(job: _SearchJob, new_learnings: List[str], follow_up_questions: List[str], new_urls: List[str]):
+        """
+        Turn a finished SERP query into a child node, or settle it at the
+        bottom of the tree. Handing the work item on is the last step, so a
+        failure before it leaves the item to the worker's error handling.
+        """
+        node = job.node
+        new_breadth = math.ceil(node.breadth / 2)
+        new_depth = node.depth - 1
+        child_path = node.path.child(new_learnings, new_urls, source=job.serp_query.query)
+        report_progress(
+            {
+                "currentDepth": new_depth,
+                "currentBreadth": new_breadth,
+                "completedQueries": progress.completedQueries + 1,
+                "currentQuery": job.serp_query.query,
+            },
+            progress=progress,
+            on_progress=on_progress,
+            journal=journal,
+        )
+        if new_depth > 0:
+            next_query = (
+                f"Previous research goal: {job.serp_query.researchGoal}\n"
+                f"Follow-up research directions: {', '.join(follow_up_questions)}"
+            ).strip()
+            plan_queue.put_nowait(_Node(next_query, new_breadth, new_depth, child_path))
+        else:
+            settle()
+
+    async def extract(item: _ExtractJob):
+        set_lane(item.job.serp_query.query)
+        node = item.job.node
+        new_learnings = await process_serp_result(
+            query=item.job.serp_query.query,
+            result=item.result,
+            num_follow_up_questions=math.ceil(node.breadth / 2),
+            url_registry=url_registry,
+            priority=-node.depth,
+            research_goal=item.job.serp_query.researchGoal,
+        )
+        if journal:
+            journal.record_node_result(
+                ResearchJournal.node_key(node.query, node.breadth, node.depth),
+                item.job.serp_query.query,
+                ResearchResult(learnings=new_learnings.learnings, visitedUrls=item.new_urls),  # type: ignore
+                new_learnings.followUpQuestions,  # type: ignore
+            )
+        advance(item.job, new_learnings.learnings, new_learnings.followUpQuestions, item.new_urls)  # type: ignore
+
+    async def worker(queue: asyncio.Queue, handle: Callable[[Any], Awaitable[None]], describe: Callable[[Any], str]):
+        """
+        Run `handle` on each queued item. Every item ends up handed on or
+        settled: if `handle` raises, the item is dropped, the error is
+        logged and the item is settled, so `pending` still reaches zero.
+        """
+        while True:
+            item = await queue.get()
+            try:
+                await handle(item)
+            except Exception as e:
+                console.print(Text(f"Error running query: {describe(item)}: {e}", style="bold red"))
+                settle()
+
+    plan_queue.put_nowait(_Node(query, breadth, depth, ResearchPath(store).child(learnings or [], visited_urls or [])))
+    workers = (
+        [asyncio.create_task(worker(plan_queue, plan, lambda node: node.query)) for _ in range(llm_workers)]
+        + [asyncio.create_task(worker(search_queue, search, lambda job: job.serp_query.query)) for _ in range(search_workers)]
+        + [asyncio.create_task(worker(extract_queue, extract, lambda item: item.job.serp_query.query)) for _ in range(llm_workers)]
+    )
+    try:
+        await finished.wait()
+    finally:
+        # Before Python 3.12, asyncio.wait_for can swallow a cancellation that arrives as its call
+        # completes, and the worker goes back to its queue; cancel again until every worker is gone
+        running = set(workers)
+        while running:
+            for worker in running:
+                worker.cancel()
+            _, running = await asyncio.wait(running, timeout=1)
+
+    console.print(Text(f"Skipped {url_registry.duplicates_avoided} already-seen pages across {len(url_registry)} unique URLs", style="bold cyan"))
+    console.print(Text(f"Merged {store.duplicates_merged} near-duplicate learnings into {len(store)} unique ones", style="bold cyan"))
+    return ResearchResult(learnings=store.learnings, visitedUrls=store.urls)
@@ -0,0 +1,284 @@
+from deep_research import (
+    QueryItem, ResearchProgress, ResearchResult, report_progress,
+    generate_serp_queries, process_serp_result,
+)
+from ai.resilience import deadline
+from ai.scheduler import get_scheduler
+from ai.tracing import meter, set_lane
+from engine import get_engine
+from search_cache import get_search_cache
+from url_registry import UrlRegistry
+from checkpoint import ResearchJournal
+from research_state import ResearchPath, ResearchStore
+from firecrawl import ScrapeOptions
+from typing import Callable, Deque, List, Optional, Tuple
+from dataclasses import dataclass, field
+import deep_research
+import asyncio
+import collections
+import heapq
+import itertools
+import math
+import os
+import time
+
+from rich.panel import Panel
+from rich.text import Text
+
+
+#######################################################################
+# Budget mode (RESEARCH_MODE=budget): total searches, LLM tokens and seconds for one run; 0 means unlimited,
+# except that searches default to what the fixed-halving tree of the same breadth and depth would make
+BudgetSearches = int(os.getenv("RESEARCH_BUDGET_SEARCHES", "0"))
+BudgetTokens = int(os.getenv("RESEARCH_BUDGET_TOKENS", "0"))
+BudgetSeconds = float(os.getenv("RESEARCH_BUDGET_SECONDS", "0"))
+# Stop early once the last SATURATION_WINDOW searches found, on average, less than this fraction of new learnings
+SaturationNovelty = float(os.getenv("SATURATION_NOVELTY", "0.15"))
+SaturationWindow = int(os.getenv("SATURATION_WINDOW", "4"))
+#######################################################################
+
+
+@dataclass
+class ResearchBudget:
+    """Limits for one budgeted run. None (or 0 from the environment) leaves an axis unlimited."""
+    searches: Optional[int] = None
+    tokens: Optional[int] = None
+    seconds: Optional[float] = None
+
+    @staticmethod
+    def tree_searches(breadth: int, depth: int) -> int:
+        """Searches `deep_research` makes at most: `breadth` at the root, halving at every level."""
+        total, nodes = 0, 1
+        for _ in range(depth):
+            total += nodes * breadth
+            nodes *= breadth
+            breadth = math.ceil(breadth / 2)
+        return total
+
+    @classmethod
+    def from_env(cls) -> "ResearchBudget":
+        return cls(
+            searches=BudgetSearches or None,
+            tokens=BudgetTokens or None,
+            seconds=BudgetSeconds or None,
+        )
+
+    def describe(self) -> str:
+        limits = [
+            f"{self.searches} searches" if self.searches else "",
+            f"{self.tokens:,} tokens" if self.tokens else "",
+            f"{self.seconds:g}s" if self.seconds else "",
+        ]
+        return ", ".join(l for l in limits if l) or "unlimited"
+
+
+@dataclass(order=True)
+class _Frontier:
+    """A follow-up question waiting for expansion, ordered best first."""
+    # Negated novelty of the search that raised it, then shallowest first, then arrival order
+    sort_key: Tuple[float, int, int]
+    query: str = field(compare=False)
+    depth: int = field(compare=False)
+    novelty: float = field(compare=False)
+    path: ResearchPath = field(compare=False)
+
+
+async def deep_research_budgeted(query: str, breadth: int, depth: int, budget: Optional[ResearchBudget] = None,
+    learnings: Optional[List[str]] = None, visited_urls: Optional[List[str]] = None,
+    on_progress: Optional[Callable[[ResearchProgress], None]] = None,
+    url_registry: Optional[UrlRegistry] = None, journal: Optional[ResearchJournal] = None,
+    saturation_novelty: float = SaturationNovelty, saturation_window: int = SaturationWindow,
+    store: Optional[ResearchStore] = None) -> ResearchResult:
+    """
+    Budget-driven variant of `deep_research`.
+
+    Instead of halving the breadth at every level and always recursing to
+    `depth`, each SERP query is scored by its novelty: the fraction of its
+    learnings that were new to the run's store (paraphrases of earlier
+    learnings don't count, see `LearningIndex`). Its follow-up questions join
+    a frontier ordered by that score, and the best frontier nodes are expanded
+    next with up to `breadth * novelty` SERP queries, so productive branches
+    get more searches and exhausted ones none at all. `depth` bounds how deep
+    any branch may go.
+
+    The run stops when the frontier is empty, when any limit in `budget` is
+    reached (searches default to `ResearchBudget.tree_searches`, so a budgeted
+    run never searches more than the recursive one), or when the last `saturation_window` searches averaged less than
+    `saturation_novelty`. Searches and tokens are checked before each call is
+    issued, so calls already in flight may overshoot them slightly; the time
+    limit cancels whatever is still running.
+    """
+    console = deep_research.console
+    budget = budget or ResearchBudget.from_env()
+    if budget.searches is None:
+        budget = ResearchBudget(ResearchBudget.tree_searches(breadth, depth), budget.tokens, budget.seconds)
+    url_registry = url_registry or UrlRegistry()
+    store = store if store is not None else ResearchStore()
+    # Nodes expanded at once; each starts with an LLM call, so as many as the LLM pool runs concurrently
+    parallel = get_scheduler().llm_concurrency
+    frontier: List[_Frontier] = []
+    order = itertools.count()
+    recent: Deque[float] = collections.deque(maxlen=max(1, saturation_window))
+    searches = 0
+    stop_reason = ""
+    started = time.monotonic()
+    progress = ResearchProgress(
+        currentDepth=depth,
+        totalDepth=depth,
+        currentBreadth=breadth,
+        totalBreadth=breadth,
+        totalQueries=0,
+        completedQueries=0,
+    )
+
+    def exhausted(usage) -> str:
+        """Why no further calls may be issued, or "" while the budget and novelty allow them."""
+        if stop_reason:
+            return stop_reason
+        if budget.searches is not None and searches >= budget.searches:
+            return "search budget spent"
+        if budget.tokens is not None and usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0) >= budget.tokens:
+            return "token budget spent"
+        if budget.seconds is not None and time.monotonic() - started >= budget.seconds:
+            return "time budget spent"
+        if len(recent) == recent.maxlen and sum(recent) / len(recent) < saturation_novelty:
+            return "saturated"
+        return ""
+
+    def push(query: str, depth: int, novelty: float, path: ResearchPath):
+        heapq.heappush(frontier, _Frontier((-novelty, -depth, next(order)), query, depth, novelty, path))
+
+    async def run_query(serp_query: QueryItem, node: _Frontier, node_key: str, node_breadth: int, usage):
+        nonlocal searches
+        set_lane(serp_query.query)
+        priority = -(depth - node.depth)
+        try:
+            stored = journal.node_result(node_key, serp_query.query) if journal else None
+            if stored is not None:
+                console.print(Text(f"Resuming from journal: {serp_query.query}", style="bold cyan"))
+                new_urls = stored["result"]["visitedUrls"]
+                new_learnings = stored["result"]["learnings"]
+                follow_up_questions = stored["followUpQuestions"]
+                url_registry.record_learnings(new_urls, new_learnings)
+            else:
+                result = journal.search_result(node_key, serp_query.query) if journal else None
+                if result is None:
+                    # Reserve the search before awaiting, so concurrent queries can't all pass the check
+                    if exhausted(usage):
+                        return
+                    searches += 1
+                    console.print(Panel.fit(Text(f"Searching with Firecrawl: {serp_query.query}", style="bold blue"), border_style="blue"))
+                    result = await get_search_cache().search(
+                        get_engine().firecrawl,
+                        query=serp_query.query,
+                        limit=5,
+                        scrape_options=ScrapeOptions(formats=["markdown"]),
+                        timeout=15000,
+                        priority=priority,
+                        url_registry=url_registry,
+                    )
+                    if journal:
+                        journal.record_search_result(node_key, serp_query.query, result)
+                new_urls = [item['url'] for item in result["data"] if item.get('url')]
+                extracted = await process_serp_result(
+                    query=serp_query.query,
+                    result=result,
+                    num_follow_up_questions=math.ceil(node_breadth / 2),
+                    url_registry=url_registry,
+                    priority=priority,
+                    research_goal=serp_query.researchGoal,
+                )
+                new_learnings = extracted.learnings  # type: ignore
+                follow_up_questions = extracted.followUpQuestions  # type: ignore
+                if journal:
+                    journal.record_node_result(
+                        node_key,
+                        serp_query.query,
+                        ResearchResult(learnings=new_learnings, visitedUrls=new_urls),
+                        follow_up_questions,
+                    )
+        except Exception as e:
+            console.print(Text(f"Error running query: {serp_query.query}: {e}", style="bold red"))
+            return
+
+        known = len(store)
+        child_path = node.path.child(new_learnings, new_urls, source=serp_query.query)
+        novelty = (len(store) - known) / len(new_learnings) if new_learnings else 0.0
+        recent.append(novelty)
+        report_progress(
+            {
+                "currentDepth": node.depth - 1,
+                "completedQueries": progress.completedQueries + 1,
+                "currentQuery": serp_query.query,
+            },
+            progress=progress,
+            on_progress=on_progress,
+            journal=journal,
+        )
+        console.print(Text(f"Novelty {novelty:.0%} for: {serp_query.query}", style="bold yellow"))
+        if node.depth > 1 and novelty > 0 and follow_up_questions:
+            next_query = (
+                f"Previous research goal: {serp_query.researchGoal}\n"
+                f"Follow-up research directions: {', '.join(follow_up_questions)}"
+            ).strip()
+            push(next_query, node.depth - 1, novelty, child_path)
+
+    async def expand(node: _Frontier, usage):
+        set_lane(node.query)
+        # Siblings finishing since this node was scheduled may have spent the budget; don't plan queries no one will run
+        if exhausted(usage):
+            return
+        # The root gets the full breadth; every later node gets a share proportional to its novelty
+        node_breadth = max(1, min(breadth, round(breadth * node.novelty)))
+        if budget.searches is not None:
+            node_breadth = max(1, min(node_breadth, budget.searches - searches))
+        node_key = ResearchJournal.node_key(node.query, node_breadth, node.depth)
+        journaled_queries = journal.serp_queries(node_key) if journal else None
+        try:
+            if journaled_queries is not None:
+                serp_queries = [QueryItem(**q) for q in journaled_queries]
+            else:
+                serp_queries = await generate_serp_queries(
+                    query=node.query,
+                    learnings=node.path.learnings(),
+                    num_queries=node_breadth,
+                    priority=-(depth - node.depth),
+                )
+                if journal:
+                    journal.record_serp_queries(node_key, [q.model_dump() for q in serp_queries])
+        except Exception as e:
+            console.print(Text(f"Error generating SERP queries: {e}", style="bold red"))
+            return
+        serp_queries = serp_queries[:node_breadth]
+        report_progress({"totalQueries": progress.totalQueries + len(serp_queries)}, progress=progress, on_progress=on_progress)
+        await asyncio.gather(*(run_query(q, node, node_key, node_breadth, usage) for q in serp_queries))
+
+    console.print(Panel.fit(Text(f"Budgeted research: {budget.describe()}, depth up to {depth}", style="bold cyan"), border_style="cyan"))
+    push(query, depth, 1.0, ResearchPath(store).child(learnings or [], visited_urls or []))
+    # Per-call timeouts and retries stay within the time budget
+    with meter() as usage, deadline(budget.seconds):
+        running = set()
+        while frontier or running:
+            stop_reason = exhausted(usage)
+            while frontier and len(running) < parallel and not stop_reason:
+                running.add(asyncio.create_task(expand(heapq.heappop(frontier), usage)))
+            if not running:
+                break
+            timeout = None if budget.seconds is None else max(0.0, budget.seconds - (time.monotonic() - started))
+            done, running = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done and timeout is not None:
+                stop_reason = "time budget spent"
+                for task in running:
+                    task.cancel()
+                await asyncio.gather(*running, return_exceptions=True)
+                running = set()
+        tokens = int(usage.get("prompt_tokens", 0) + usage.get("completion_tokens", 0))
+
+    summary = (
+        f"Stopped ({stop_reason or 'frontier exhausted'}) after {searches} searches, {tokens:,} tokens "
+        f"and {time.monotonic() - started:.1f}s; {len(frontier)} frontier nodes left unexpanded"
+    )
+    console.print(Text(summary, style="bold cyan"))
+    console.print(Text(f"Skipped {url_registry.duplicates_avoided} already-seen pages across {len(url_registry)} unique URLs", style="bold cyan"))
+    console.print(Text(f"Merged {store.duplicates_merged} near-duplicate learnings into {len(store)} unique ones", style="bold cyan"))
+    return ResearchResult(learnings=store.learnings, visitedUrls=store.urls)
@@ -0,0 +1,173 @@
+from deep_research import final_report_prompt, sources_section, write_final_report
+from ai.providers import generate_structured_response_async, stream_text_response, count_tokens, trim_prompts
+from ai.clustering import cluster_by_topic
+from ai.resilience import ReportTimeout
+from ai.tracing import traced
+from engine import get_engine
+from pydantic import BaseModel, Field
+from contextlib import aclosing
+from typing import AsyncIterator, List, Optional
+import deep_research
+import asyncio
+
+from rich.panel import Panel
+from rich.text import Text
+
+
+class ReportSectionSchema(BaseModel):
+    title: str = Field(..., description="Short title of this section of the report")
+    sectionMarkdown: str = Field(..., description="Body of the section in Markdown, without the section title")
+
+
+class ReportOutlineSchema(BaseModel):
+    title: str = Field(..., description="Title of the full report")
+    introductionMarkdown: str = Field(..., description="Introduction / executive summary of the full report in Markdown")
+    conclusionMarkdown: str = Field(..., description="Conclusion of the full report in Markdown")
+    sectionOrder: List[int] = Field(..., description="Numbers of all the sections, in the order they should appear")
+
+
+@traced("report.section")
+async def write_report_section(prompt: str, learnings: List[str]) -> ReportSectionSchema:
+    learnings_string = "\n".join(f"<learning>\n{learning}\n</learning>" for learning in learnings)
+    response = await generate_structured_response_async(
+        prompt=f"""Given the following prompt from the user, write one section of a larger report on the topic. \
+The section covers only the learnings below, which were grouped together by topic; other sections cover the rest. \
+Make it as detailed as possible and include ALL of these learnings:
+
+<prompt>{prompt}</prompt>
+
+<learnings>
+{learnings_string}
+</learnings>""",
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("report"),
+        timeout=ReportTimeout,
+        format_schema=ReportSectionSchema,
+    )
+    return response.output_parsed  # type: ignore
+
+
+def report_outline_prompt(prompt: str, sections_string: str) -> str:
+    return f"""Given the following prompt from the user and the drafted sections of a report on the topic, \
+write the report's title, an introduction that summarizes the key findings across all sections, and a conclusion. \
+Also give the order in which the sections should appear so the report reads well.
+
+<prompt>{prompt}</prompt>
+
+<sections>
+{sections_string}
+</sections>"""
+
+
+@traced("report.outline")
+async def write_report_outline(prompt: str, sections: List[ReportSectionSchema]) -> ReportOutlineSchema:
+    """
+    Reduce step: the model reads the drafts and writes what spans them. The
+    drafts themselves go into the report verbatim, so trimming what the
+    model reads here never drops content from the report.
+    """
+    context_size = get_engine().settings.context_size
+    drafts = [f"## Section {i}: {section.title}\n\n{section.sectionMarkdown}" for i, section in enumerate(sections)]
+    overhead = count_tokens(report_outline_prompt(prompt, "")) + len(drafts) * count_tokens("<section>\n\n</section>\n")
+    drafts = trim_prompts(drafts, total_budget=context_size - overhead)
+    sections_string = "\n".join(f"<section>\n{draft}\n</section>" for draft in drafts)
+    response = await generate_structured_response_async(
+        prompt=report_outline_prompt(prompt, sections_string),
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("report"),
+        timeout=ReportTimeout,
+        format_schema=ReportOutlineSchema,
+    )
+    return response.output_parsed  # type: ignore
+
+
+def section_order(order: List[int], count: int) -> List[int]:
+    """The model's order, without invalid or repeated numbers, plus any section it left out."""
+    seen = []
+    for i in order:
+        if 0 <= i < count and i not in seen:
+            seen.append(i)
+    return seen + [i for i in range(count) if i not in seen]
+
+
+@traced("write_final_report_map_reduce")
+async def write_final_report_map_reduce(prompt: str, learnings: List[str], visited_urls: List[str],
+                                        section_tokens: Optional[int] = None) -> str:
+    """
+    Hierarchical variant of `write_final_report` for large learning sets.
+
+    Learnings are clustered by topic into groups of at most `section_tokens`
+    tokens (default: the engine's `report_section_tokens`), one section is drafted per group concurrently (bounded by the
+    report model's scheduler pool), and a final call writes the title, introduction,
+    conclusion and section order. Latency grows with groups / LLM concurrency
+    instead of total prompt size, and every learning reaches a section prompt
+    untrimmed.
+    """
+    if not learnings:
+        # Nothing to cluster: an outline over zero sections would be a wasted call
+        return await write_final_report(prompt, learnings, visited_urls)
+    console = deep_research.console
+    section_tokens = section_tokens or get_engine().settings.report_section_tokens
+    lengths = [count_tokens(learning) for learning in learnings]
+    clusters = cluster_by_topic(learnings, lengths, section_tokens)
+    if console:
+        console.print(Panel.fit(Text(f"Drafting {len(clusters)} report sections from {len(learnings)} learnings...", style="bold green"), border_style="green"))
+    else:
+        print(f"Drafting {len(clusters)} report sections from {len(learnings)} learnings...")
+    sections = await asyncio.gather(*(
+        write_report_section(prompt, [learnings[i] for i in cluster]) for cluster in clusters
+    ))
+    outline = await write_report_outline(prompt, sections)
+
+    parts = [f"# {outline.title}", outline.introductionMarkdown]
+    for i in section_order(outline.sectionOrder, len(sections)):
+        parts.append(f"## {sections[i].title}\n\n{sections[i].sectionMarkdown}")
+    parts.append(f"## Conclusion\n\n{outline.conclusionMarkdown}")
+    return "\n\n".join(parts) + sources_section(visited_urls)
+
+
+def use_map_reduce(prompt: str, learnings: List[str]) -> bool:
+    """
+    Whether to write the report with map-reduce. In "auto" mode that is only
+    when the single-call prompt would have to be trimmed to the context size,
+    i.e. when one call can't see every learning.
+    """
+    settings = get_engine().settings
+    if settings.report_mode == "map_reduce":
+        return bool(learnings)
+    if settings.report_mode != "auto" or not learnings:
+        return False
+    context_size = settings.context_size
+    overhead = count_tokens(final_report_prompt(prompt, [])) + len(learnings) * count_tokens("<learning>\n\n</learning>\n")
+    return overhead + sum(count_tokens(learning) for learning in learnings) > context_size
+
+
+async def write_report(prompt: str, learnings: List[str], visited_urls: List[str]) -> str:
+    """Write the final report in one call or map-reduce, according to the engine's `report_mode`."""
+    if use_map_reduce(prompt, learnings):
+        return await write_final_report_map_reduce(prompt, learnings, visited_urls)
+    return await write_final_report(prompt, learnings, visited_urls)
+
+
+async def stream_report(prompt: str, learnings: List[str], visited_urls: List[str]) -> AsyncIterator[str]:
+    """
+    Yield the final report as Markdown text deltas, ending with the Sources section.
+
+    The single-call report is streamed token by token. A map-reduce report has
+    to finish its sections before the outline can be written, so it arrives
+    as one piece.
+    """
+    if use_map_reduce(prompt, learnings):
+        yield await write_final_report_map_reduce(prompt, learnings, visited_urls)
+        return
+    stream = stream_text_response(
+        prompt=final_report_prompt(prompt, learnings) + "\n\nRespond with the report in Markdown only.",
+        system_prompt=get_engine().system_prompt,
+        model=get_engine().route("report"),
+        timeout=ReportTimeout,
+    )
+    # Closing this generator closes the stream too, which gives its report pool slot back
+    async with aclosing(stream):
+        async for delta in stream:
+            yield delta
+    yield sources_section(visited_urls)
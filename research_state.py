@@ -0,0 +1,131 @@
+from typing import Dict, Iterable, List, Optional, Tuple
+from learning_index import LearningIndex
+
+
+class ResearchStore:
+    """
+    Append-only, interned store of the learnings and URLs of one research tree.
+
+    Each distinct learning or URL is stored once, in the order it was first
+    produced, together with the SERP query that produced it. Learnings go
+    through a `LearningIndex`, so a paraphrase of an earlier learning resolves
+    to that learning and only adds its SERP query as provenance. Nodes refer to
+    entries by integer id (see `ResearchPath`) instead of copying lists, and
+    the final merge is just the store's contents: linear time, duplicate-free
+    and in insertion order.
+    """
+
+    def __init__(self):
+        self._learnings: List[str] = []
+        # Assigns ids in the same order as _learnings, so its ids index that list
+        self._learning_index = LearningIndex()
+        self._urls: List[str] = []
+        self._url_ids: Dict[str, int] = {}
+        self._url_sources: List[Optional[str]] = []
+
+    @staticmethod
+    def _intern(value: str, values: List[str], ids: Dict[str, int],
+                sources: List[Optional[str]], source: Optional[str]) -> int:
+        existing = ids.get(value)
+        if existing is not None:
+            return existing
+        ids[value] = len(values)
+        values.append(value)
+        sources.append(source)
+        return ids[value]
+
+    def add_learnings(self, learnings: Iterable[str], source: Optional[str] = None) -> Tuple[int, ...]:
+        ids = []
+        for learning in learnings:
+            learning_id, is_new = self._learning_index.add(learning, source)
+            if is_new:
+                self._learnings.append(learning)
+            ids.append(learning_id)
+        return tuple(ids)
+
+    def add_urls(self, urls: Iterable[str], source: Optional[str] = None) -> Tuple[int, ...]:
+        return tuple(
+            self._intern(u, self._urls, self._url_ids, self._url_sources, source)
+            for u in urls
+        )
+
+    def learning(self, learning_id: int) -> str:
+        return self._learnings[learning_id]
+
+    def url(self, url_id: int) -> str:
+        return self._urls[url_id]
+
+    def learning_source(self, learning: str) -> Optional[str]:
+        """The SERP query that first produced `learning` or a near duplicate of it."""
+        sources = self.learning_sources(learning)
+        return sources[0] if sources else None
+
+    def learning_sources(self, learning: str) -> List[str]:
+        """Every SERP query that produced `learning` or a near duplicate of it."""
+        learning_id = self._learning_index.find(learning)
+        return [] if learning_id is None else self._learning_index.sources(learning_id)
+
+    @property
+    def duplicates_merged(self) -> int:
+        return self._learning_index.duplicates_merged
+
+    def url_source(self, url: str) -> Optional[str]:
+        url_id = self._url_ids.get(url)
+        return None if url_id is None else self._url_sources[url_id]
+
+    @property
+    def learnings(self) -> List[str]:
+        return list(self._learnings)
+
+    @property
+    def urls(self) -> List[str]:
+        return list(self._urls)
+
+    def __len__(self) -> int:
+        return len(self._learnings)
+
+
+class ResearchPath:
+    """
+    A node's view of the store: the learnings and URLs gathered on the path
+    from the root to this node.
+
+    Paths are persistent linked lists, so creating a child costs only the
+    entries that node added, no matter how deep the tree is.
+    """
+
+    __slots__ = ("store", "parent", "learning_ids", "url_ids")
+
+    def __init__(self, store: ResearchStore, parent: Optional["ResearchPath"] = None,
+                 learning_ids: Tuple[int, ...] = (), url_ids: Tuple[int, ...] = ()):
+        self.store = store
+        self.parent = parent
+        self.learning_ids = learning_ids
+        self.url_ids = url_ids
+
+    def child(self, learnings: Iterable[str], urls: Iterable[str], source: Optional[str] = None) -> "ResearchPath":
+        """Intern a node's new learnings and URLs and return the path extended by them."""
+        return ResearchPath(
+            self.store,
+            self,
+            self.store.add_learnings(learnings, source),
+            self.store.add_urls(urls, source),
+        )
+
+    def _segments(self) -> List["ResearchPath"]:
+        segments = []
+        node: Optional[ResearchPath] = self
+        while node is not None:
+            segments.append(node)
+            node = node.parent
+        segments.reverse()
+        return segments
+
+    def learnings(self) -> List[str]:
+        """Learnings on this path, root first, without duplicates."""
+        ids = dict.fromkeys(i for segment in self._segments() for i in segment.learning_ids)
+        return [self.store.learning(i) for i in ids]
+
+    def urls(self) -> List[str]:
+        ids = dict.fromkeys(i for segment in self._segments() for i in segment.url_ids)
+        return [self.store.url(i) for i in ids]
@@ -1,10 +1,30 @@
-from ai.providers import get_model
-from deep_research import deep_research, write_final_answer, write_final_report, ResearchResult
-from feedback import generate_feedback
+from dotenv import load_dotenv
+
+# Load .env before importing the research modules: they read their process-wide settings (pools, caches, timeouts)
+# from the environment when imported, and each engine reads its research settings from it when first used
+load_dotenv()
+
+from ai.cleaning import get_page_cleaner
+from ai.providers import response_cache_summary
+from ai.resilience import resilience_summary
+from ai.scheduler import get_scheduler
+from ai.tracing import get_tracer
+from deep_research import ResearchResult, extraction_batch_stats
+from engine import ResearchEngine, get_engine
+from planner import ResearchBudget
+from report import stream_report
+from search_cache import get_search_cache
+from checkpoint import ResearchJournal
+from corpus import get_corpus
+from contextlib import aclosing
+from typing import AsyncIterator
 import asyncio
+import os
 import aiofiles
+import time
 
 from rich.console import Console
+from rich.live import Live
 from rich.markdown import Markdown
 from rich.panel import Panel
 from rich.text import Text
@@ -15,8 +35,6 @@ def strip_rich_markup(text):
     # Remove [style]...[/style] tags for input prompts
     return re.sub(r'\[.*?\](.*?)\[/.*?\]', r'\1', text)
 
-model = get_model()
-
 # Helper function for consistent logging
 def log(*args):
     """Prints messages to the console."""
@@ -32,11 +50,8 @@ async def ask_question(prompt: str) -> str:
         return await asyncio.to_thread(input, prompt)
 
 
-async def run():
-    if console:
-        console.print(Panel.fit(Text(f"Using model: {model}", style="bold cyan"), border_style="cyan"))
-    else:
-        print(f"Using model: {model}")
+async def ask_research_request(engine: ResearchEngine):
+    """Interactively collect the query, breadth, depth and report type."""
     initial_query = await ask_question("What would you like to research?")
     if console:
         console.print(Panel.fit(Text(f"Initial query: {initial_query}", style="bold magenta bold"), border_style="magenta"))
@@ -68,7 +83,7 @@ async def run():
             console.print(Panel.fit(Text("Creating research plan...", style="bold cyan"), border_style="cyan"))
         else:
             print("Creating research plan...")
-        follow_up_questions = await generate_feedback(query= initial_query)
+        follow_up_questions = await engine.feedback(query= initial_query)
         if console:
             console.print(Text("\nTo better understand your research needs, please answer these follow-up questions:", style="bold yellow"))
         else:
@@ -79,14 +94,65 @@ async def run():
             answers.append(answer)
         qa_block = "\n".join([f"Q: {q}\nA: {a}" for q, a in zip(follow_up_questions, answers)])
         combined_query = f"Initial Query: {initial_query}\nFollow-up Questions and Answers:\n{qa_block}"
+    return combined_query, breadth, depth, is_report
+
+
+async def run(engine: ResearchEngine):
     if console:
-        console.print(Panel.fit(Text("Starting research...", style="bold green"), border_style="green"))
+        console.print(Panel.fit(Text(f"Using models: {engine.describe_routes()}", style="bold cyan"), border_style="cyan"))
     else:
-        print("\nStarting research...\n")
-    research_results: ResearchResult = await deep_research(
-        query= combined_query,
-        breadth= breadth,
-        depth= depth)
+        print(f"Using models: {engine.describe_routes()}")
+    journal_path = os.getenv("RESEARCH_JOURNAL")
+    journal = ResearchJournal(journal_path) if journal_path else None
+    try:
+        resume = False
+        if journal and journal.root:
+            answer = await ask_question(
+                f"Resume previous research ({journal.completed_queries} queries completed) on: "
+                f"{journal.root['query'][:200]}? (y/n, default y): "
+            )
+            resume = answer.strip().lower() != "n"
+            if not resume:
+                # A new run must not replay the old one's queries and results
+                journal.start_over()
+        if resume:
+            combined_query = journal.root["query"]  # type: ignore
+            breadth = journal.root["breadth"]  # type: ignore
+            depth = journal.root["depth"]  # type: ignore
+            is_report = journal.root["isReport"]  # type: ignore
+        else:
+            combined_query, breadth, depth, is_report = await ask_research_request(engine)
+            if journal:
+                journal.record_root({"query": combined_query, "breadth": breadth, "depth": depth, "isReport": is_report})
+        if console:
+            console.print(Panel.fit(Text("Starting research...", style="bold green"), border_style="green"))
+        else:
+            print("\nStarting research...\n")
+        # RESEARCH_MODE=pipeline overlaps search, extraction and query generation across the tree;
+        # RESEARCH_MODE=budget spends RESEARCH_BUDGET_* on the branches that keep finding new learnings
+        research_mode = os.getenv("RESEARCH_MODE", "").lower()
+        early_answer = None
+        if not is_report and engine.settings.early_answer:
+            # ANSWER_EARLY_STOP: stop researching once consecutive answer checks agree
+            early_answer = await engine.research_answer(
+                query= combined_query,
+                breadth= breadth,
+                depth= depth,
+                pipelined= research_mode == "pipeline",
+                budget= ResearchBudget.from_env() if research_mode == "budget" else None,
+                journal= journal)
+            research_results = ResearchResult(learnings=early_answer.learnings, visitedUrls=early_answer.visitedUrls)
+        else:
+            research_results: ResearchResult = await engine.research(
+                query= combined_query,
+                breadth= breadth,
+                depth= depth,
+                pipelined= research_mode == "pipeline",
+                budget= ResearchBudget.from_env() if research_mode == "budget" else None,
+                journal= journal)
+    finally:
+        if journal:
+            journal.close()
     learnings = research_results.learnings
     visited_urls = research_results.visitedUrls
 
@@ -100,13 +166,34 @@ async def run():
     else:
         print("\n\nLearnings:\n\n" + "\n".join(learnings))
         print(f"\n\nVisited URLs ({len(visited_urls)}):\n\n" + "\n".join(visited_urls))
+    if console:
+        console.print(Text(get_search_cache().summary(), style="bold cyan"))
+        if engine.settings.corpus:
+            console.print(Text(get_corpus().summary(), style="bold cyan"))
+        console.print(Text(response_cache_summary(), style="bold cyan"))
+        console.print(Text(get_scheduler().summary(), style="bold cyan"))
+        console.print(Text(resilience_summary(), style="bold cyan"))
+        console.print(Text(f"Extraction batching: {extraction_batch_stats().summary()}", style="bold cyan"))
+        console.print(Text(get_page_cleaner().summary(), style="bold cyan"))
+    else:
+        print(get_search_cache().summary())
+        if engine.settings.corpus:
+            print(get_corpus().summary())
+        print(response_cache_summary())
+        print(get_scheduler().summary())
+        print(resilience_summary())
+        print(f"Extraction batching: {extraction_batch_stats().summary()}")
+        print(get_page_cleaner().summary())
     if console:
         console.print(Panel.fit(Text("Writing final report...", style="bold green"), border_style="green"))
     else:
         print("Writing final report...")
-    if is_report:
-        report = await write_final_report(
-            prompt= combined_query,
+    if is_report and os.getenv("REPORT_STREAM", "1").strip().lower() not in ("0", "false", "no", "off"):
+        with engine.activate(), get_tracer().span("stream_report"):
+            await stream_report_to_file(stream_report(combined_query, learnings, visited_urls), "report.md")
+    elif is_report:
+        report = await engine.report(
+            query= combined_query,
             learnings= learnings,
             visited_urls= visited_urls
         )
@@ -120,10 +207,13 @@ async def run():
             print("\n\nFinal Report:\n\n" + report)
             print("\nReport has been saved to report.md")
     else:
-        answer = await write_final_answer(
-            prompt= combined_query,
-            learnings= learnings
-        )
+        if early_answer is not None:
+            answer = early_answer.answer
+        else:
+            answer = await engine.answer(
+                query= combined_query,
+                learnings= learnings
+            )
         async with aiofiles.open("answer.md", "w", encoding="utf-8") as f:
             await f.write(answer)
         if console:
@@ -135,9 +225,69 @@ async def run():
             print("\nAnswer has been saved to answer.md")
 
 
+async def stream_report_to_file(deltas: AsyncIterator[str], path: str, refresh_interval: float = 0.25) -> str:
+    """
+    Append report deltas to `path` as they arrive and render the report so far.
+
+    Re-rendering Markdown costs time proportional to the text, and every file
+    write is a hop to a worker thread, so the live view is refreshed and the
+    file written at most every `refresh_interval` seconds rather than on
+    every delta. `deltas` is closed on the way out, even on error, so the
+    report stream gives its connection back to the pool.
+    """
+    parts = []
+    written = 0
+
+    async def write_pending(f):
+        nonlocal written
+        if written < len(parts):
+            await f.write("".join(parts[written:]))
+            await f.flush()
+            written = len(parts)
+
+    async with aclosing(deltas), aiofiles.open(path, "w", encoding="utf-8") as f:
+        if console:
+            console.print(Panel.fit(Text("Final Report:", style="bold cyan"), border_style="cyan"))
+            with Live(Markdown(""), console=console, vertical_overflow="visible", auto_refresh=False) as live:
+                rendered_at = 0.0
+                async for delta in deltas:
+                    parts.append(delta)
+                    if time.monotonic() - rendered_at >= refresh_interval:
+                        await write_pending(f)
+                        live.update(Markdown("".join(parts)), refresh=True)
+                        rendered_at = time.monotonic()
+                live.update(Markdown("".join(parts)), refresh=True)
+        else:
+            print("\n\nFinal Report:\n")
+            written_at = 0.0
+            async for delta in deltas:
+                parts.append(delta)
+                print(delta, end="", flush=True)
+                if time.monotonic() - written_at >= refresh_interval:
+                    await write_pending(f)
+                    written_at = time.monotonic()
+            print()
+        await write_pending(f)
+    if console:
+        console.print(Text(f"\nReport has been saved to {path}", style="bold green"))
+    else:
+        print(f"\nReport has been saved to {path}")
+    return "".join(parts)
+
+
+async def main():
+    engine = get_engine()
+    try:
+        await run(engine)
+    finally:
+        get_tracer().report(console)
+        get_page_cleaner().close()
+        await engine.close()
+
+
 if __name__ == "__main__":
     try:
-        asyncio.run(run())
+        asyncio.run(main())
     except KeyboardInterrupt:
         log("\nProcess interrupted by user. Exiting.")
     except Exception as e:
@@ -0,0 +1,158 @@
+from ai.cache import DiskCache
+from ai.resilience import get_resilience
+from ai.scheduler import get_scheduler
+from ai.tracing import get_tracer, record
+from corpus import CorpusIndex, get_corpus
+from engine import get_engine
+from firecrawl import AsyncFirecrawlApp, ScrapeOptions
+from typing import Any, Dict, Optional
+from url_registry import UrlRegistry
+import asyncio
+import os
+
+
+#######################################################################
+# "on": read through the cache, "replay": serve only from the cache, "off": always hit Firecrawl
+SearchCacheMode = os.getenv("FIRECRAWL_CACHE", "on").strip().lower()
+SearchCachePath = os.getenv("FIRECRAWL_CACHE_PATH", os.path.join(".cache", "firecrawl.sqlite"))
+SearchCacheTTL = float(os.getenv("FIRECRAWL_CACHE_TTL", str(7 * 24 * 3600)))
+SearchCacheMaxBytes = int(os.getenv("FIRECRAWL_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+#######################################################################
+
+
+def current_corpus() -> Optional[CorpusIndex]:
+    """The corpus index, or None when the current engine's settings turn it off."""
+    return get_corpus() if get_engine().settings.corpus else None
+
+
+class SearchCacheMiss(Exception):
+    """Raised in replay mode when a search has no cached result."""
+
+
+class SearchCache:
+    """
+    Read-through cache in front of `AsyncFirecrawlApp.search`.
+
+    Results are keyed by the normalized query, `limit` and scrape options, so
+    the same search issued by another branch of the tree, or by an earlier run,
+    is answered from disk instead of spending Firecrawl quota.
+
+    Before either, the local corpus (`corpus.py`) is asked for fresh pages
+    matching the query; Firecrawl is only asked for the shortfall, and every
+    page it returns is added to the corpus.
+    """
+
+    def __init__(self, cache: Optional[DiskCache], mode: str = "on"):
+        if mode not in ("on", "off", "replay"):
+            raise ValueError(f"Unknown search cache mode: {mode}")
+        self.cache = cache
+        self.mode = mode if cache is not None else "off"
+
+    @staticmethod
+    def normalize_query(query: str) -> str:
+        return " ".join(query.lower().split())
+
+    def make_key(self, query: str, limit: Optional[int], scrape_options: Optional[ScrapeOptions]) -> str:
+        options = scrape_options.model_dump(exclude_none=True) if scrape_options else None
+        return DiskCache.make_key("firecrawl.search", self.normalize_query(query), limit, options)
+
+    async def search(
+        self,
+        app: AsyncFirecrawlApp,
+        query: str,
+        limit: Optional[int] = None,
+        scrape_options: Optional[ScrapeOptions] = None,
+        priority: int = 0,
+        url_registry: Optional[UrlRegistry] = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Search through the local corpus and the cache. Only actual Firecrawl
+        requests take a slot in the scheduler's "search" pool; corpus and cache
+        hits are free.
+
+        With the run's `url_registry`, the corpus only serves pages no branch
+        has claimed yet and that were fetched before the run started, so a
+        sibling query is not answered with the pages another branch of the
+        same run just scraped. The rest comes from the cached or fetched
+        result for the full `limit`, minus the pages the corpus supplied.
+        """
+        with get_tracer().span("firecrawl.search", query=query) as span:
+            wanted = limit or 5
+            corpus = current_corpus()
+            hits = []
+            if corpus is not None:
+                hits = await asyncio.to_thread(
+                    corpus.search, query, wanted,
+                    exclude_urls=url_registry if url_registry is not None else (),
+                    fetched_before=url_registry.started if url_registry is not None else None,
+                )
+            if hits:
+                span.args["corpus_pages"] = len(hits)
+            if len(hits) >= wanted:
+                result: Dict[str, Any] = {"success": True, "data": hits}
+            else:
+                # Asked with the full limit, so the shortfall shares a cache entry with the query's other lookups
+                result = await self._search(app, query, limit, scrape_options, priority, **kwargs)
+                if hits:
+                    urls = {item["url"] for item in hits}
+                    fresh = [item for item in result.get("data") or [] if item.get("url") not in urls]
+                    result = {**result, "data": hits + fresh[:wanted - len(hits)]}
+            span.add("bytes", sum(len((item.get("markdown") or "").encode("utf-8")) for item in result.get("data") or []))
+            return result
+
+    async def _fetch(self, app, query, limit, scrape_options, priority, **kwargs) -> Dict[str, Any]:
+        """
+        Call Firecrawl through the "search" pool, with the timeouts, retries
+        and hedging of `get_resilience("search")`, and keep the pages it
+        scraped in the corpus.
+        """
+        result = await get_resilience("search").call(
+            get_scheduler().pool("search"),
+            lambda: app.search(query=query, limit=limit, scrape_options=scrape_options, **kwargs),
+            priority,
+        )
+        corpus = current_corpus()
+        if corpus is not None and result.get("data"):  # type: ignore
+            await asyncio.to_thread(corpus.add_pages, result["data"])  # type: ignore
+        return result  # type: ignore
+
+    async def _search(self, app, query, limit, scrape_options, priority, **kwargs) -> Dict[str, Any]:
+        if self.mode == "off" or self.cache is None:
+            return await self._fetch(app, query, limit, scrape_options, priority, **kwargs)
+
+        key = self.make_key(query, limit, scrape_options)
+        cached = await asyncio.to_thread(self.cache.get, key)
+        if cached is not None:
+            record("cached", 1)
+            return cached
+        if self.mode == "replay":
+            raise SearchCacheMiss(f"No cached search result for: {query}")
+
+        result = await self._fetch(app, query, limit, scrape_options, priority, **kwargs)
+        if result.get("success", True) and result.get("data"):  # type: ignore
+            await asyncio.to_thread(self.cache.set, key, result)
+        return result  # type: ignore
+
+    def summary(self) -> str:
+        if self.mode == "off" or self.cache is None:
+            return "Search cache disabled"
+        stats = self.cache.stats
+        return (
+            f"Search cache ({self.mode}): {stats.hits} hits, {stats.misses} misses, "
+            f"hit rate {stats.hit_rate:.0%}, {stats.evictions} evicted"
+        )
+
+
+_search_cache: Optional[SearchCache] = None
+
+
+def get_search_cache() -> SearchCache:
+    """Return the process-wide search cache configured from the environment."""
+    global _search_cache
+    if _search_cache is None:
+        cache = None
+        if SearchCacheMode != "off":
+            cache = DiskCache(SearchCachePath, ttl=SearchCacheTTL, max_bytes=SearchCacheMaxBytes)
+        _search_cache = SearchCache(cache, mode=SearchCacheMode)
+    return _search_cache
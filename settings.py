@@ -0,0 +1,69 @@
+from dataclasses import dataclass, fields, replace
+from typing import Any
+import os
+
+
+def _flag(name: str, default: str) -> bool:
+    return os.getenv(name, default).strip().lower() in ("1", "true", "yes", "on")
+
+
+@dataclass(frozen=True)
+class ResearchSettings:
+    """
+    The settings that shape one research job, as opposed to the process-wide
+    pools, caches and timeouts in `ai/`. Every `ResearchEngine` carries its
+    own, so two engines in one process can research differently.
+
+    `from_env()` reads them when it is called, not when this module is
+    imported; the entry points (run.py, batch.py) load .env first.
+    """
+    # Strip navigation, cookie banners, link lists and images from scraped markdown before it is prompted
+    content_cleaning: bool = True
+    # Rank page chunks against the SERP query and keep only the best ones, up to relevance_page_tokens per page
+    relevance_ranking: bool = False
+    relevance_page_tokens: int = 4000
+    # SERP results of at most extraction_batch_item_tokens tokens are packed into shared extraction calls of up to
+    # extraction_batch_tokens tokens, waiting at most extraction_batch_wait seconds for more; 0 disables batching
+    extraction_batch_item_tokens: int = 3000
+    extraction_batch_tokens: int = 12000
+    extraction_batch_wait: float = 0.05
+    # Ask the local corpus for pages before Firecrawl (the index itself is process-wide, see corpus.py)
+    corpus: bool = True
+    # Tokens a single extraction or report call may use
+    context_size: int = 128000
+    # "auto": map-reduce only when the learnings don't fit in a single report call (context_size), "single": one
+    # call, "map_reduce": always
+    report_mode: str = "auto"
+    # Tokens of learnings handed to each section draft
+    report_section_tokens: int = 12000
+    # Specific answers: check the answer every answer_check_learnings new learnings (0: 3x the breadth) and stop
+    # researching once answer_agreement consecutive checks agree, each with at least answer_confidence
+    early_answer: bool = True
+    answer_check_learnings: int = 0
+    answer_agreement: int = 2
+    answer_confidence: float = 0.8
+
+    @classmethod
+    def from_env(cls) -> "ResearchSettings":
+        return cls(
+            content_cleaning=_flag("CONTENT_CLEANING", "1"),
+            relevance_ranking=_flag("RELEVANCE_RANKING", "0"),
+            relevance_page_tokens=int(os.getenv("RELEVANCE_PAGE_TOKENS", "4000")),
+            extraction_batch_item_tokens=int(os.getenv("EXTRACTION_BATCH_ITEM_TOKENS", "3000")),
+            extraction_batch_tokens=int(os.getenv("EXTRACTION_BATCH_TOKENS", "12000")),
+            extraction_batch_wait=float(os.getenv("EXTRACTION_BATCH_WAIT", "0.05")),
+            corpus=os.getenv("CORPUS", "on").strip().lower() != "off",
+            context_size=int(os.getenv("CONTEXT_SIZE", "128000")),
+            report_mode=os.getenv("REPORT_MODE", "auto").strip().lower(),
+            report_section_tokens=int(os.getenv("REPORT_SECTION_TOKENS", "12000")),
+            early_answer=_flag("ANSWER_EARLY_STOP", "1"),
+            answer_check_learnings=int(os.getenv("ANSWER_CHECK_LEARNINGS", "0")),
+            answer_agreement=int(os.getenv("ANSWER_AGREEMENT", "2")),
+            answer_confidence=float(os.getenv("ANSWER_CONFIDENCE", "0.8")),
+        )
+
+    def with_overrides(self, **overrides: Any) -> "ResearchSettings":
+        unknown = set(overrides) - {f.name for f in fields(self)}
+        if unknown:
+            raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+        return replace(self, **overrides)
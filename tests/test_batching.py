@@ -0,0 +1,48 @@
+import asyncio
+
+import deep_research
+from ai.batching import MicroBatcher
+from deep_research import ExtractionRequest, FollowUpSchema, extract_learnings_batch, get_extraction_batcher
+from url_registry import UrlRegistry
+
+
+def test_returned_exception_fails_only_its_item():
+    async def flush(items):
+        return [ValueError(item) if item == "bad" else item.upper() for item in items]
+
+    async def main():
+        batcher = MicroBatcher(flush, max_tokens=100, max_wait=0.01)
+        return await asyncio.gather(*(batcher.submit(item, 1) for item in ("a", "bad", "b")), return_exceptions=True)
+
+    good, bad, other = asyncio.run(main())
+    assert (good, other) == ("A", "B")
+    assert isinstance(bad, ValueError)
+
+
+def test_failed_batch_falls_back_to_single_extractions(monkeypatch):
+    calls = []
+
+    async def fake_response(prompt, system_prompt, model, format_schema, **kwargs):
+        calls.append(format_schema.__name__)
+        if format_schema.__name__ == "BatchFollowUpSchema":
+            raise ValueError("invalid batched output")
+        if "query two" in prompt:
+            raise ValueError("invalid single output")
+
+        class Response:
+            output_parsed = FollowUpSchema(learnings=["learning"], followUpQuestions=[])
+        return Response()
+
+    monkeypatch.setattr(deep_research, "generate_structured_response_async", fake_response)
+    monkeypatch.setattr(deep_research, "console", None)
+    requests = [ExtractionRequest(f"query {n}", "contents", 3, 3) for n in ("one", "two", "three")]
+    first, second, third = asyncio.run(extract_learnings_batch(requests))
+    assert calls.count("BatchFollowUpSchema") == 1 and calls.count("FollowUpSchema") == 3
+    assert first.learnings == ["learning"] and third.learnings == ["learning"]
+    assert isinstance(second, ValueError)
+
+
+def test_runs_never_share_a_batcher():
+    first, second = UrlRegistry(), UrlRegistry()
+    assert get_extraction_batcher(first) is get_extraction_batcher(first)
+    assert get_extraction_batcher(first) is not get_extraction_batcher(second)
@@ -0,0 +1,50 @@
+from ai.cleaning import clean_markdown
+
+
+TOPICAL_PAGE = """[Home](/) | [Docs](/docs) | [Sign in](/login)
+Accept all cookies
+Manage consent preferences
+
+# JavaScript performance
+
+Modern JavaScript engines use a JIT compiler to turn hot functions into machine code.
+Under GDPR, sites must record consent before they set tracking cookies.
+
+| Engine | JIT tiers |
+|--------|-----------|
+| V8     | 2         |
+
+Does the page register a service worker?
+
+- Yes
+- No
+- Yes
+
+Subscribe to our newsletter
+[Privacy policy](/privacy)
+"""
+
+
+def test_topical_content_survives():
+    cleaned = clean_markdown(TOPICAL_PAGE)
+    assert "# JavaScript performance" in cleaned
+    assert "JIT compiler to turn hot functions into machine code." in cleaned
+    assert "record consent before they set tracking cookies." in cleaned
+    assert "Does the page register a service worker?" in cleaned
+    assert "| V8 | 2 |" in cleaned
+    assert cleaned.count("- Yes") == 2
+
+
+def test_banner_runs_are_removed():
+    cleaned = clean_markdown(TOPICAL_PAGE)
+    assert "Accept all cookies" not in cleaned
+    assert "Manage consent preferences" not in cleaned
+    assert "Subscribe to our newsletter" not in cleaned
+    assert "Sign in" not in cleaned
+
+
+def test_repeated_footer_lines_keep_first_occurrence():
+    body = "\n\n".join(f"Paragraph {i} about battery chemistry and cell formats." for i in range(40))
+    cleaned = clean_markdown(f"Acme Research\n\n{body}\n\nAcme Research\n")
+    assert cleaned.count("Acme Research") == 1
+    assert cleaned.count("Paragraph 39") == 1
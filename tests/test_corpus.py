@@ -0,0 +1,45 @@
+from corpus import CorpusIndex
+
+
+def page(url, markdown):
+    return {"url": url, "title": "", "markdown": markdown}
+
+
+def test_stemmed_terms_count_towards_coverage(tmp_path):
+    corpus = CorpusIndex(str(tmp_path / "corpus.sqlite"), min_coverage=1.0)
+    corpus.add_pages([page("https://a.example/", "Caching responses at the edge servers")])
+    assert [hit["url"] for hit in corpus.search("cache response edge server", 5)] == ["https://a.example/"]
+
+
+def test_pages_missing_too_many_terms_are_not_matched(tmp_path):
+    corpus = CorpusIndex(str(tmp_path / "corpus.sqlite"), min_coverage=0.75)
+    corpus.add_pages([
+        page("https://all.example/", "rust async runtime scheduler internals"),
+        page("https://three.example/", "rust async runtime overview"),
+        page("https://two.example/", "rust async basics"),
+    ])
+    urls = {hit["url"] for hit in corpus.search("rust async runtime scheduler", 5)}
+    assert urls == {"https://all.example/", "https://three.example/"}
+    assert corpus.stats.pages_served == 2
+
+
+def test_long_queries_require_every_term():
+    expressions = CorpusIndex.match_expressions(" ".join(f"term{i}" for i in range(16)), 0.75)
+    assert len(expressions) == 1 and " OR " not in expressions[0] and expressions[0].count(" AND ") == 15
+    assert CorpusIndex.match_expressions("alpha beta gamma delta", 0.75) == [
+        '"alpha" AND "beta" AND "gamma" AND "delta"',
+        '("alpha" AND "beta" AND "gamma") OR ("alpha" AND "beta" AND "delta") OR '
+        '("alpha" AND "gamma" AND "delta") OR ("beta" AND "gamma" AND "delta")',
+    ]
+
+
+def test_pages_with_every_term_rank_first(tmp_path):
+    corpus = CorpusIndex(str(tmp_path / "corpus.sqlite"), min_coverage=0.75)
+    corpus.add_pages([
+        page("https://three.example/", "rust async runtime rust async runtime"),
+        page("https://all.example/", "rust async runtime scheduler"),
+    ])
+    assert [hit["url"] for hit in corpus.search("rust async runtime scheduler", 1)] == ["https://all.example/"]
+    assert [hit["url"] for hit in corpus.search("rust async runtime scheduler", 5)] == [
+        "https://all.example/", "https://three.example/",
+    ]
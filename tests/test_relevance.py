@@ -0,0 +1,24 @@
+from ai.relevance import select_relevant_chunks
+
+
+def count_words(text):
+    return len(text.split())
+
+
+def test_dropped_leading_and_trailing_text_is_marked():
+    page = "\n\n".join(["intro about nothing " * 5, "battery chemistry lithium " * 5, "closing remarks " * 5])
+    selected, = select_relevant_chunks([page], "lithium battery", 20, count_words, chunk_size=80)
+    assert selected.startswith("\n[...]\n") and selected.endswith("\n[...]\n")
+    assert "lithium" in selected and "closing" not in selected
+
+
+def test_known_lengths_are_not_counted_again():
+    counted = []
+
+    def count(text):
+        counted.append(text)
+        return count_words(text)
+
+    pages = ["short page about batteries", "another short page"]
+    assert select_relevant_chunks(pages, "batteries", 20, count, lengths=[4, None]) == pages
+    assert counted == ["another short page"]
@@ -0,0 +1,57 @@
+from typing import Dict, List, Optional, Set
+from urllib.parse import urlsplit, urlunsplit
+import time
+
+
+class UrlRegistry:
+    """
+    Visited-URL registry shared by every node of one research tree.
+
+    Methods never await, so a check-and-claim is atomic with respect to the
+    other tasks running on the event loop: two sibling branches racing for the
+    same page cannot both claim it.
+    """
+
+    def __init__(self):
+        # When the research run began; pages scraped since then belong to one of its own branches
+        self.started = time.time()
+        self._learnings: Dict[str, List[str]] = {}
+        self._content_hashes: Set[str] = set()
+        self.duplicates_avoided = 0
+
+    @staticmethod
+    def normalize_url(url: str) -> str:
+        parts = urlsplit(url.strip())
+        path = parts.path.rstrip("/") or "/"
+        return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), path, parts.query, ""))
+
+    def claim(self, url: str) -> bool:
+        """Mark `url` as visited. Returns False if some node already claimed it."""
+        key = self.normalize_url(url)
+        if key in self._learnings:
+            self.duplicates_avoided += 1
+            return False
+        self._learnings[key] = []
+        return True
+
+    def claim_content(self, digest: str) -> bool:
+        """Mark a page's content hash as seen. Returns False if the same content was already claimed under any URL."""
+        if digest in self._content_hashes:
+            self.duplicates_avoided += 1
+            return False
+        self._content_hashes.add(digest)
+        return True
+
+    def record_learnings(self, urls: List[str], learnings: List[str]):
+        """Remember which learnings were extracted from the pages at `urls`."""
+        for url in urls:
+            self._learnings.setdefault(self.normalize_url(url), []).extend(learnings)
+
+    def learnings_for(self, url: str) -> Optional[List[str]]:
+        return self._learnings.get(self.normalize_url(url))
+
+    def __contains__(self, url: str) -> bool:
+        return self.normalize_url(url) in self._learnings
+
+    def __len__(self) -> int:
+        return len(self._learnings)